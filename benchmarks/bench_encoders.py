@@ -0,0 +1,136 @@
+"""
+Encoders benchmark.
+
+Measures the encode/decode throughput and the compression ratio of every
+encoder on synthetic frames, and prints a markdown table. Run it from the
+repository root::
+
+    python -m benchmarks.bench_encoders --frames 32 --size 512
+"""
+import argparse
+import os
+import tempfile
+import time
+import torch
+from typing import Any, Dict, List, Optional
+from encoders import get_encoders
+from encoders.image_encoder import ImageEncoder
+
+
+def make_frames(num_frames: int, size: int, seed: int = 0) -> torch.Tensor:
+    """
+    Build slowly moving gradients with a little noise, a stand-in for video frames.
+
+    :param num_frames: number of frames
+    :type num_frames: int
+    :param size: width and height of the frames
+    :type size: int
+    :param seed: noise seed
+    :type seed: int
+    :return: ``[N,H,W,3]`` float frames in [0, 1]
+    :rtype: torch.Tensor
+    """
+    generator = torch.Generator().manual_seed(seed)
+    y, x = torch.meshgrid(torch.linspace(0, 1, size), torch.linspace(0, 1, size), indexing="ij")
+    frames = []
+    for idx in range(num_frames):
+        shift = idx / max(num_frames, 1)
+        frame = torch.stack([
+            0.5 + 0.5 * torch.sin(2 * torch.pi * (x + shift)),
+            0.5 + 0.5 * torch.cos(2 * torch.pi * (y + shift)),
+            (x + y) / 2,
+        ], dim=-1)
+        frames.append(frame + torch.randn(frame.shape, generator=generator) * 0.01)
+    return torch.stack(frames).clamp_(0, 1)
+
+
+def get_dir_size(path: str) -> int:
+    """Get the size of the files of a directory tree."""
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def bench_encoder(
+    encoder: ImageEncoder,
+    frames: torch.Tensor,
+    workers: int,
+    options: Optional[Dict[str, Any]] = None,
+) -> Dict[str, float]:
+    """
+    Benchmark a single encoder.
+
+    :param encoder: encoder to benchmark
+    :type encoder: ImageEncoder
+    :param frames: frames to encode
+    :type frames: torch.Tensor
+    :param workers: number of encoding/decoding threads
+    :type workers: int
+    :param options: encoder options
+    :type options: Optional[Dict[str, Any]]
+    :return: encode/decode MB/s of 8 bits RGB frames, compression ratio and maximum error
+    :rtype: Dict[str, float]
+    """
+    # throughputs are given for the 8 bits frames, the size every encoder works from
+    raw_bytes = frames.numel()
+    with tempfile.TemporaryDirectory() as bank_path:
+        start = time.perf_counter()
+        encoder.save_frames(frames, bank_path, workers=workers, options=options)
+        encode_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        loaded = encoder.load_frames(bank_path, frames.shape[0], workers=workers)
+        # read every frame once, memory-mapped banks are only read on access
+        loaded.max()
+        decode_time = time.perf_counter() - start
+
+        disk_bytes = get_dir_size(bank_path)
+        stored = frames.mul(255).round_().to(torch.uint8)
+        error = (loaded.to(torch.int16) - stored.to(torch.int16)).abs().max().item() if loaded.dtype == torch.uint8 \
+            else (loaded.float() - frames).abs().max().item() * 255
+
+    return {
+        "encode": raw_bytes / encode_time / 1e6,
+        "decode": raw_bytes / decode_time / 1e6,
+        "ratio": raw_bytes / disk_bytes,
+        "error": error,
+    }
+
+
+# (encoder name, options, label)
+BENCH_CASES = [
+    ("pil", None, "lossy WebP (default)"),
+    ("webp_lossless", None, "lossless WebP, method 0"),
+    ("webp_lossless", {"effort": 4, "quality": 80}, "lossless WebP, method 4"),
+    ("png", None, "PNG, level 1"),
+    ("png", {"effort": 6}, "PNG, level 6"),
+    ("packed", None, "lossy WebP container"),
+    ("safetensors", {"dtype": "uint8"}, "zstd safetensors, uint8"),
+    ("safetensors_bank", {"dtype": "uint8"}, "zstd chunks, uint8"),
+    ("raw", {"dtype": "uint8"}, "uncompressed, uint8"),
+]
+
+
+def main(args: Optional[List[str]] = None):
+    """Run the benchmark and print the results as a markdown table."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=32, help="number of frames")
+    parser.add_argument("--size", type=int, default=512, help="width and height of the frames")
+    parser.add_argument("--workers", type=int, default=1, help="number of encoding/decoding threads")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per encoder, the best one is kept")
+    parsed = parser.parse_args(args)
+
+    frames = make_frames(parsed.frames, parsed.size)
+    encoders = get_encoders()
+
+    print(f"{parsed.frames} frames of {parsed.size}x{parsed.size}, {parsed.workers} worker(s)\n")
+    print("| encoder | options | encode MB/s | decode MB/s | ratio | max error |")
+    print("|---|---|---:|---:|---:|---:|")
+    for name, options, label in BENCH_CASES:
+        runs = [bench_encoder(encoders[name], frames, parsed.workers, options) for _ in range(parsed.repeat)]
+        print(
+            f"| `{name}` | {label} | {max(r['encode'] for r in runs):.0f} | {max(r['decode'] for r in runs):.0f} "
+            f"| {runs[0]['ratio']:.1f} | {runs[0]['error']:.0f} |"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,11 @@ from typing import Dict
 from .image_encoder import ImageEncoder
 from .safetensor_image_encoder import SafetensorsImageEncoder
 from .pil_image_encoder import PilImageEncoder
+from .packed_image_encoder import PackedImageEncoder
+from .safetensor_bank_encoder import SafetensorsBankEncoder
+from .raw_image_encoder import RawImageEncoder
+from .lossless_webp_image_encoder import LosslessWebpImageEncoder
+from .png_image_encoder import PngImageEncoder
 
 
 def get_encoders() -> Dict[str, ImageEncoder]:
@@ -13,4 +18,12 @@ def get_encoders() -> Dict[str, ImageEncoder]:
     :return: Encoders implementations
     :rtype: Dict[str, ImageEncoder]
     """
-    return {"safetensors": SafetensorsImageEncoder, "pil": PilImageEncoder}  # type: ignore
+    return {
+        "safetensors": SafetensorsImageEncoder,
+        "pil": PilImageEncoder,
+        "packed": PackedImageEncoder,
+        "safetensors_bank": SafetensorsBankEncoder,
+        "raw": RawImageEncoder,
+        "webp_lossless": LosslessWebpImageEncoder,
+        "png": PngImageEncoder,
+    }  # type: ignore
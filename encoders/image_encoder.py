@@ -1,6 +1,116 @@
 """ImageEncoder base class."""
 import torch
 from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import BoundedSemaphore, Event
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+STORAGE_DTYPES = {
+    "float32": torch.float32,
+    "float16": torch.float16,
+    "uint8": torch.uint8,
+}
+
+
+def to_storage_dtype(image: torch.Tensor, options: Optional[Dict[str, Any]] = None) -> torch.Tensor:
+    """
+    Convert images to the storage dtype set in the encoder options.
+
+    :param image: image(s) with values in [0, 1]
+    :type image: torch.Tensor
+    :param options: encoder options, ``dtype`` is one of ``STORAGE_DTYPES`` (defaults to float32)
+    :type options: Optional[Dict[str, Any]]
+    :return: converted image(s)
+    :rtype: torch.Tensor
+    """
+    dtype_name = (options or dict()).get("dtype") or "float32"
+    dtype = STORAGE_DTYPES.get(dtype_name)
+    if dtype is None:
+        raise Exception(f"Unsupported storage dtype '{dtype_name}', expected one of {list(STORAGE_DTYPES)}")
+    if image.dtype == dtype:
+        return image
+    if dtype == torch.uint8:
+        return image.mul(255.0).round_().clamp_(0, 255).to(torch.uint8)
+    return image.to(dtype)
+
+
+def as_image_batch(images: Sequence[torch.Tensor]) -> torch.Tensor:
+    """
+    Get a sequence of images as a single ``[N,H,W,C]`` batch.
+
+    :param images: ``[N,H,W,C]`` batch (returned as is), single image or sequence of images
+    :type images: Sequence[torch.Tensor]
+    :return: batch of images
+    :rtype: torch.Tensor
+    """
+    if isinstance(images, torch.Tensor):
+        return images if images.dim() == 4 else images.unsqueeze(0)
+    return torch.stack(list(images), dim=0)
+
+
+def run_bounded(func: Callable[[int], None], count: int, workers: int = 1, max_pending: Optional[int] = None):
+    """
+    Call ``func(idx)`` for ``idx`` in ``range(count)`` across a pool of threads.
+
+    At most ``max_pending`` calls are queued at once, so that submission blocks
+    while the pool is busy. Submission stops at the first failure, which is
+    re-raised.
+
+    :param func: function to call
+    :type func: Callable[[int], None]
+    :param count: number of calls
+    :type count: int
+    :param workers: number of threads
+    :type workers: int
+    :param max_pending: maximum number of queued calls, defaults to ``2 * workers``
+    :type max_pending: Optional[int]
+    """
+    if workers <= 1 or count < 2:
+        for idx in range(count):
+            func(idx)
+        return
+
+    slots = BoundedSemaphore(max_pending or 2 * workers)
+    failed = Event()
+    futures: List[Future] = []
+
+    def on_done(future: Future):
+        if future.exception() is not None:
+            failed.set()
+        slots.release()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for idx in range(count):
+            slots.acquire()
+            if failed.is_set():
+                # stop submitting once a call failed
+                slots.release()
+                break
+            future = pool.submit(func, idx)
+            future.add_done_callback(on_done)
+            futures.append(future)
+
+    # propagate the first error
+    for future in futures:
+        future.result()
+
+
+def to_float_images(images: torch.Tensor) -> torch.Tensor:
+    """
+    Expand images from their stored dtype to float32 with values in [0, 1].
+
+    The whole batch is converted at once, float32 images are returned as is.
+
+    :param images: image(s) in a dtype of ``STORAGE_DTYPES``
+    :type images: torch.Tensor
+    :return: float32 image(s)
+    :rtype: torch.Tensor
+    """
+    if images.dtype == torch.float32:
+        return images
+    if images.dtype == torch.uint8:
+        return images.to(torch.float32).div_(255.0)
+    return images.to(torch.float32)
 
 
 class ImageEncoder(ABC):
@@ -20,7 +130,7 @@ class ImageEncoder(ABC):
 
     @staticmethod
     @abstractmethod
-    def save_image(image: torch.Tensor, save_path: str):
+    def save_image(image: torch.Tensor, save_path: str, options: Optional[Dict[str, Any]] = None):
         """
         Save a Tensor image to the provided path.
 
@@ -28,6 +138,8 @@ class ImageEncoder(ABC):
         :type image: torch.Tensor
         :param save_path: save path without extension
         :type save_path: str
+        :param options: encoder options, ``quality`` sets the encoder specific quality/speed trade-off
+        :type options: Optional[Dict[str, Any]]
         """
         pass
 
@@ -43,3 +155,211 @@ class ImageEncoder(ABC):
         :rtype: Tensor
         """
         pass
+
+    @classmethod
+    def load_stored_image(cls, image_path: str) -> torch.Tensor:
+        """
+        Load image from a given path, in its stored dtype.
+
+        :param image_path: path without extension
+        :type image_path: str
+        :return: Image as a Tensor, see ``to_float_images``
+        :rtype: Tensor
+        """
+        return cls.load_image(image_path)
+
+    @classmethod
+    def save_images(
+        cls,
+        images: Sequence[torch.Tensor],
+        save_paths: Sequence[str],
+        workers: int = 1,
+        max_pending: Optional[int] = None,
+        options: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        Save a batch of images, one file per image.
+
+        Images are encoded by a pool of threads. At most ``max_pending`` images
+        are queued at once, so that submission blocks while the pool is busy.
+
+        :param images: ``[N,H,W,C]`` batch or sequence of images
+        :type images: Sequence[torch.Tensor]
+        :param save_paths: save paths without extension, one per image
+        :type save_paths: Sequence[str]
+        :param workers: number of encoding threads
+        :type workers: int
+        :param max_pending: maximum number of queued images, defaults to ``2 * workers``
+        :type max_pending: Optional[int]
+        :param options: encoder options, ``quality`` sets the encoder specific quality/speed trade-off
+        :type options: Optional[Dict[str, Any]]
+        """
+        if len(images) != len(save_paths):
+            raise Exception(f"Got {len(images)} images for {len(save_paths)} paths!")
+
+        def save(idx: int):
+            cls.save_image(images[idx], save_paths[idx], options)
+
+        run_bounded(save, len(save_paths), workers, max_pending)
+
+    @classmethod
+    def load_images(cls, image_paths: Sequence[str], workers: int = 1) -> torch.Tensor:
+        """
+        Load a batch of images, in their stored dtype.
+
+        Images are decoded by a pool of threads and copied straight into a
+        preallocated ``[N,H,W,C]`` tensor.
+
+        :param image_paths: paths without extension
+        :type image_paths: Sequence[str]
+        :param workers: number of decoding threads
+        :type workers: int
+        :return: Batch of images, see ``to_float_images``
+        :rtype: Tensor
+        """
+        if not image_paths:
+            raise Exception("Cannot load an empty batch of images!")
+
+        # the first image gives the shape and dtype of the output
+        first = cls.load_stored_image(image_paths[0])
+        output = torch.empty((len(image_paths), *first.shape), dtype=first.dtype)
+        output[0].copy_(first)
+
+        def decode(idx: int):
+            output[idx + 1].copy_(cls.load_stored_image(image_paths[idx + 1]))
+
+        run_bounded(decode, len(image_paths) - 1, workers)
+        return output
+
+    @classmethod
+    def save_frames(
+        cls,
+        images: Sequence[torch.Tensor],
+        bank_path: str,
+        workers: int = 1,
+        max_pending: Optional[int] = None,
+        options: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        Save the frames of a bank.
+
+        :param images: ``[N,H,W,C]`` batch or sequence of frames to save
+        :type images: Sequence[torch.Tensor]
+        :param bank_path: path of the bank, frames are stored as ``{bank_path}/{idx}``
+        :type bank_path: str
+        :param workers: number of encoding threads
+        :type workers: int
+        :param max_pending: maximum number of queued frames, defaults to ``2 * workers``
+        :type max_pending: Optional[int]
+        :param options: encoder options, ``quality`` sets the encoder specific quality/speed trade-off
+        :type options: Optional[Dict[str, Any]]
+        """
+        cls.save_images(images, [f"{bank_path}/{idx}" for idx in range(len(images))], workers, max_pending, options)
+
+    @classmethod
+    def packs_frames(cls) -> bool:
+        """Check if the frames of a bank are packed in container files rather than stored one file per frame."""
+        return False
+
+    @classmethod
+    def write_batch_frames(cls) -> int:
+        """Get the number of frames ``append_frames`` expects per call (except the last one)."""
+        return 1
+
+    @classmethod
+    def append_frames(
+        cls,
+        images: Sequence[torch.Tensor],
+        bank_path: str,
+        start: int,
+        workers: int = 1,
+        options: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        Save frames of a bank that is written incrementally.
+
+        :param images: frames to save
+        :type images: Sequence[torch.Tensor]
+        :param bank_path: path of the bank
+        :type bank_path: str
+        :param start: index of the first frame
+        :type start: int
+        :param workers: number of encoding threads
+        :type workers: int
+        :param options: encoder options
+        :type options: Optional[Dict[str, Any]]
+        """
+        cls.save_images(
+            images, [f"{bank_path}/{idx}" for idx in range(start, start + len(images))], workers, options=options
+        )
+
+    @classmethod
+    def finish_frames(cls, bank_path: str, num_frames: int):
+        """
+        Complete a bank written by ``append_frames``, once every frame has been appended.
+
+        :param bank_path: path of the bank
+        :type bank_path: str
+        :param num_frames: number of frames appended
+        :type num_frames: int
+        """
+        pass
+
+    @classmethod
+    def load_frames(cls, bank_path: str, num_frames: int, workers: int = 1) -> torch.Tensor:
+        """
+        Load all the frames of a bank as a single batch.
+
+        Like every bank level loader, frames are returned in their stored
+        dtype (see ``to_float_images``).
+
+        :param bank_path: path of the bank, frames are stored as ``{bank_path}/{idx}``
+        :type bank_path: str
+        :param num_frames: number of frames in the bank
+        :type num_frames: int
+        :param workers: number of decoding threads
+        :type workers: int
+        :return: Batch of images
+        :rtype: Tensor
+        """
+        if num_frames < 1:
+            raise Exception(f"Cannot load {num_frames} frames from bank {bank_path}!")
+        return cls.load_images([f"{bank_path}/{idx}" for idx in range(num_frames)], workers)
+
+    @classmethod
+    def load_frame(cls, bank_path: str, index: int) -> torch.Tensor:
+        """
+        Load a single frame of a bank.
+
+        :param bank_path: path of the bank, frames are stored as ``{bank_path}/{idx}``
+        :type bank_path: str
+        :param index: index of the frame (non negative)
+        :type index: int
+        :return: Image as a Tensor
+        :rtype: Tensor
+        """
+        return cls.load_stored_image(f"{bank_path}/{index}")
+
+    @classmethod
+    def load_frame_range(cls, bank_path: str, start: int, stop: int) -> torch.Tensor:
+        """
+        Load the frames ``start`` to ``stop`` (excluded) of a bank.
+
+        :param bank_path: path of the bank
+        :type bank_path: str
+        :param start: index of the first frame
+        :type start: int
+        :param stop: index after the last frame
+        :type stop: int
+        :return: Batch of images
+        :rtype: Tensor
+        """
+        if stop <= start:
+            raise Exception(f"Cannot load frames {start} to {stop} from bank {bank_path}!")
+
+        first = cls.load_frame(bank_path, start)
+        output = torch.empty((stop - start, *first.shape), dtype=first.dtype)
+        output[0].copy_(first)
+        for idx in range(start + 1, stop):
+            output[idx - start].copy_(cls.load_frame(bank_path, idx))
+        return output
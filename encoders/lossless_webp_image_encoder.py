@@ -0,0 +1,41 @@
+"""LosslessWebpImageEncoder module."""
+from typing import Any, Dict, Optional
+from .pil_image_encoder import PilImageEncoder
+
+
+class LosslessWebpImageEncoder(PilImageEncoder):
+    """
+    LosslessWebpImageEncoder implementation.
+
+    Frames are stored as lossless WebP images tuned for encoding speed, so
+    they round trip exactly (as 8 bits images).
+    """
+
+    # fastest method and compression effort
+    DEFAULT_EFFORT = 0
+    DEFAULT_QUALITY = 0
+
+    @staticmethod
+    def get_name() -> str:
+        """Get the unique name of the encoder."""
+        return "webp_lossless"
+
+    @staticmethod
+    def save_params(options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Get the PIL save parameters from the encoder options.
+
+        :param options: encoder options, ``quality`` is the compression effort (0-100) and ``effort``
+            the WebP method (0-6), both default to the fastest setting
+        :type options: Optional[Dict[str, Any]]
+        :return: keyword arguments of ``Image.save``
+        :rtype: Dict[str, Any]
+        """
+        options = options or dict()
+        quality = options.get("quality")
+        effort = options.get("effort")
+        return PilImageEncoder.save_params({
+            "quality": LosslessWebpImageEncoder.DEFAULT_QUALITY if quality is None or quality < 0 else quality,
+            "effort": LosslessWebpImageEncoder.DEFAULT_EFFORT if effort is None or effort < 0 else effort,
+            "lossless": True,
+        })
@@ -0,0 +1,322 @@
+"""PackedImageEncoder module."""
+import io
+import os
+import struct
+import torch
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from PIL import Image
+from .image_encoder import ImageEncoder, as_image_batch, run_bounded, to_float_images, to_storage_dtype
+from .pil_image_encoder import PilImageEncoder
+
+PACKED_MAGIC = b"PSTPACK1"
+# magic, number of frames, flags
+_HEADER = struct.Struct("<8sII")
+_OFFSET = struct.Struct("<Q")
+# the offset table follows the frames
+_FLAG_FOOTER = 1
+PACKED_FILENAME = "frames"
+# offsets of the frames appended so far, next to a container being written
+_OFFSETS_SUFFIX = ".offsets"
+
+
+class PackedImageEncoder(ImageEncoder):
+    """
+    PackedImageEncoder implementation.
+
+    A bank is stored as a single container file: a header, a table of
+    ``num_frames + 1`` frame offsets, then the WebP encoded frames. Banks
+    written incrementally hold the offset table after the frames instead,
+    which is flagged in the header.
+    """
+
+    @staticmethod
+    def file_extension() -> str:
+        """Get file extension (with initial dot)."""
+        return ".pbank"
+
+    @staticmethod
+    def get_name() -> str:
+        """Get the unique name of the encoder."""
+        return "packed"
+
+    @classmethod
+    def packs_frames(cls) -> bool:
+        """Check if the frames of a bank are packed in container files rather than stored one file per frame."""
+        return True
+
+    @staticmethod
+    def encode_frame(image: torch.Tensor, options: Optional[Dict[str, Any]] = None) -> bytes:
+        """
+        Encode a single frame.
+
+        :param image: Tensor containing an image, float in [0, 1] or uint8
+        :type image: torch.Tensor
+        :param options: encoder options, see ``PilImageEncoder.save_params``
+        :type options: Optional[Dict[str, Any]]
+        :return: encoded frame
+        :rtype: bytes
+        """
+        buffer = io.BytesIO()
+        PilImageEncoder.to_pil_image(image).save(buffer, format="WEBP", **PilImageEncoder.save_params(options))
+        return buffer.getvalue()
+
+    @staticmethod
+    def decode_frame(data: bytes) -> torch.Tensor:
+        """
+        Decode a single frame.
+
+        :param data: encoded frame
+        :type data: bytes
+        :return: Image as a uint8 Tensor
+        :rtype: Tensor
+        """
+        return PilImageEncoder.from_pil_image(Image.open(io.BytesIO(data)), compact=True)
+
+    @staticmethod
+    def _write_container(frames: List[bytes], file_path: str):
+        data_offset = _HEADER.size + _OFFSET.size * (len(frames) + 1)
+        offsets = [data_offset]
+        for frame in frames:
+            offsets.append(offsets[-1] + len(frame))
+
+        with open(file_path, "wb") as fo:
+            fo.write(_HEADER.pack(PACKED_MAGIC, len(frames), 0))
+            fo.write(b"".join(_OFFSET.pack(o) for o in offsets))
+            for frame in frames:
+                fo.write(frame)
+
+    @staticmethod
+    def _read_offsets(fi) -> List[int]:
+        magic, num_frames, flags = _HEADER.unpack(fi.read(_HEADER.size))
+        if magic != PACKED_MAGIC:
+            raise Exception(f"{fi.name} is not a packed bank!")
+        if flags & _FLAG_FOOTER:
+            fi.seek(-_OFFSET.size * (num_frames + 1), os.SEEK_END)
+        table = fi.read(_OFFSET.size * (num_frames + 1))
+        return [o for (o,) in _OFFSET.iter_unpack(table)]
+
+    @staticmethod
+    def _frame_range(offsets: List[int], index: int, file_path: str) -> Tuple[int, int]:
+        num_frames = len(offsets) - 1
+        if not -num_frames <= index < num_frames:
+            raise IndexError(f"Frame {index} out of range for {file_path} ({num_frames} frames)")
+        index %= num_frames
+        return offsets[index], offsets[index + 1]
+
+    @staticmethod
+    def save_image(image: torch.Tensor, save_path: str, options: Optional[Dict[str, Any]] = None):
+        """
+        Save a Tensor image to the provided path.
+
+        :param image: Tensor containing an image
+        :type image: torch.Tensor
+        :param save_path: save path without extension
+        :type save_path: str
+        :param options: encoder options, ``quality`` sets the encoder specific quality/speed trade-off
+        :type options: Optional[Dict[str, Any]]
+        """
+        PackedImageEncoder._write_container(
+            [PackedImageEncoder.encode_frame(image, options)], f"{save_path}{PackedImageEncoder.file_extension()}"
+        )
+
+    @staticmethod
+    def load_image(image_path: str) -> torch.Tensor:
+        """
+        Load image from a given path.
+
+        :param image_path: path without extension
+        :type image_path: str
+        :return: Image as a Tensor
+        :rtype: Tensor
+        """
+        return to_float_images(PackedImageEncoder.load_stored_image(image_path))
+
+    @classmethod
+    def load_stored_image(cls, image_path: str) -> torch.Tensor:
+        """
+        Load image from a given path, as uint8.
+
+        :param image_path: path without extension
+        :type image_path: str
+        :return: Image as a uint8 Tensor
+        :rtype: Tensor
+        """
+        return cls._load_packed_frame(f"{image_path}{cls.file_extension()}", 0)
+
+    @staticmethod
+    def _load_packed_frame(file_path: str, index: int) -> torch.Tensor:
+        with open(file_path, "rb") as fi:
+            start, end = PackedImageEncoder._frame_range(PackedImageEncoder._read_offsets(fi), index, file_path)
+            fi.seek(start)
+            return PackedImageEncoder.decode_frame(fi.read(end - start))
+
+    @classmethod
+    def save_frames(
+        cls,
+        images: Sequence[torch.Tensor],
+        bank_path: str,
+        workers: int = 1,
+        max_pending: Optional[int] = None,
+        options: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        Save the frames of a bank in a single container file.
+
+        :param images: ``[N,H,W,C]`` batch or sequence of frames to save
+        :type images: Sequence[torch.Tensor]
+        :param bank_path: path of the bank
+        :type bank_path: str
+        :param workers: number of encoding threads
+        :type workers: int
+        :param max_pending: maximum number of queued frames, defaults to ``2 * workers``
+        :type max_pending: Optional[int]
+        :param options: encoder options, ``quality`` sets the encoder specific quality/speed trade-off
+        :type options: Optional[Dict[str, Any]]
+        """
+        cls._write_container(
+            cls._encode_frames(images, workers, max_pending, options),
+            f"{bank_path}/{PACKED_FILENAME}{cls.file_extension()}",
+        )
+
+    @classmethod
+    def _encode_frames(
+        cls,
+        images: Sequence[torch.Tensor],
+        workers: int,
+        max_pending: Optional[int],
+        options: Optional[Dict[str, Any]],
+    ) -> List[bytes]:
+        # convert the whole batch at once, the threads only encode
+        batch = to_storage_dtype(as_image_batch(images).detach().cpu(), {"dtype": "uint8"})
+        frames: List[bytes] = [b""] * batch.shape[0]
+
+        def encode(idx: int):
+            frames[idx] = cls.encode_frame(batch[idx], options)
+
+        run_bounded(encode, len(frames), workers, max_pending)
+        return frames
+
+    @classmethod
+    def load_frames(cls, bank_path: str, num_frames: int, workers: int = 1) -> torch.Tensor:
+        """
+        Load all the frames of a bank with a single sequential read.
+
+        :param bank_path: path of the bank
+        :type bank_path: str
+        :param num_frames: number of frames in the bank
+        :type num_frames: int
+        :param workers: number of decoding threads
+        :type workers: int
+        :return: Batch of images
+        :rtype: Tensor
+        """
+        file_path = f"{bank_path}/{PACKED_FILENAME}{cls.file_extension()}"
+        with open(file_path, "rb") as fi:
+            offsets = cls._read_offsets(fi)
+            data_offset = offsets[0]
+            fi.seek(data_offset)
+            data = memoryview(fi.read(offsets[-1] - data_offset))
+
+        if len(offsets) - 1 != num_frames or num_frames < 1:
+            raise Exception(f"Expected {num_frames} frames in {file_path}, found {len(offsets) - 1}!")
+
+        def frame_data(idx: int) -> bytes:
+            return data[offsets[idx] - data_offset:offsets[idx + 1] - data_offset]
+
+        first = cls.decode_frame(frame_data(0))
+        output = torch.empty((num_frames, *first.shape), dtype=first.dtype)
+        output[0].copy_(first)
+
+        def decode(idx: int):
+            output[idx].copy_(cls.decode_frame(frame_data(idx)))
+
+        run_bounded(lambda idx: decode(idx + 1), num_frames - 1, workers)
+
+        return output
+
+    @classmethod
+    def load_frame(cls, bank_path: str, index: int) -> torch.Tensor:
+        """
+        Load a single frame of a bank, only this frame is read from the container.
+
+        :param bank_path: path of the bank
+        :type bank_path: str
+        :param index: index of the frame (negative indices are supported)
+        :type index: int
+        :return: Image as a Tensor
+        :rtype: Tensor
+        """
+        return cls._load_packed_frame(f"{bank_path}/{PACKED_FILENAME}{cls.file_extension()}", index)
+
+    @classmethod
+    def append_frames(
+        cls,
+        images: Sequence[torch.Tensor],
+        bank_path: str,
+        start: int,
+        workers: int = 1,
+        options: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        Save frames of a bank that is written incrementally.
+
+        Frames are appended to the container, their offsets to a side file
+        until ``finish_frames`` writes them after the frames.
+
+        :param images: frames to save
+        :type images: Sequence[torch.Tensor]
+        :param bank_path: path of the bank
+        :type bank_path: str
+        :param start: index of the first frame
+        :type start: int
+        :param workers: number of encoding threads
+        :type workers: int
+        :param options: encoder options
+        :type options: Optional[Dict[str, Any]]
+        """
+        frames = cls._encode_frames(images, workers, None, options)
+        file_path = f"{bank_path}/{PACKED_FILENAME}{cls.file_extension()}"
+        offsets_path = f"{file_path}{_OFFSETS_SUFFIX}"
+
+        if start == 0:
+            with open(file_path, "wb") as fo:
+                fo.write(_HEADER.pack(PACKED_MAGIC, 0, _FLAG_FOOTER))
+            open(offsets_path, "wb").close()
+        else:
+            found = os.path.getsize(offsets_path) // _OFFSET.size
+            if found != start:
+                raise Exception(f"Expected {start} frames in {file_path}, found {found}!")
+
+        with open(file_path, "ab") as fo:
+            end = fo.tell()
+            ends = []
+            for frame in frames:
+                fo.write(frame)
+                end += len(frame)
+                ends.append(end)
+        with open(offsets_path, "ab") as fo:
+            fo.write(b"".join(_OFFSET.pack(o) for o in ends))
+
+    @classmethod
+    def finish_frames(cls, bank_path: str, num_frames: int):
+        """
+        Write the offset table of a bank written by ``append_frames``.
+
+        :param bank_path: path of the bank
+        :type bank_path: str
+        :param num_frames: number of frames appended
+        :type num_frames: int
+        """
+        file_path = f"{bank_path}/{PACKED_FILENAME}{cls.file_extension()}"
+        offsets_path = f"{file_path}{_OFFSETS_SUFFIX}"
+        with open(offsets_path, "rb") as fi:
+            ends = fi.read()
+        if len(ends) != _OFFSET.size * num_frames:
+            raise Exception(f"Expected {num_frames} frames in {file_path}, found {len(ends) // _OFFSET.size}!")
+
+        with open(file_path, "r+b") as fo:
+            fo.seek(0, os.SEEK_END)
+            fo.write(_OFFSET.pack(_HEADER.size) + ends)
+            fo.seek(0)
+            fo.write(_HEADER.pack(PACKED_MAGIC, num_frames, _FLAG_FOOTER))
+        os.remove(offsets_path)
@@ -1,8 +1,9 @@
 """PilImageEncoder module."""
 import torch
 import numpy as np
+from typing import Any, Dict, Optional, Sequence
 from PIL import Image
-from .image_encoder import ImageEncoder
+from .image_encoder import ImageEncoder, as_image_batch, run_bounded, to_float_images, to_storage_dtype
 
 
 class PilImageEncoder(ImageEncoder):
@@ -21,7 +22,30 @@ class PilImageEncoder(ImageEncoder):
         return "pil"
 
     @staticmethod
-    def save_image(image: torch.Tensor, save_path: str):
+    def save_params(options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Get the PIL save parameters from the encoder options.
+
+        :param options: encoder options, ``quality`` is the WebP quality (0-100), ``effort`` the WebP method
+            (0-6, fastest first) and ``lossless`` enables lossless WebP
+        :type options: Optional[Dict[str, Any]]
+        :return: keyword arguments of ``Image.save``
+        :rtype: Dict[str, Any]
+        """
+        options = options or dict()
+        params: Dict[str, Any] = {"compress_level": PilImageEncoder.COMPRESS_LEVEL}
+        quality = options.get("quality")
+        if quality is not None and quality >= 0:
+            params["quality"] = max(0, min(100, int(quality)))
+        effort = options.get("effort")
+        if effort is not None and effort >= 0:
+            params["method"] = max(0, min(6, int(effort)))
+        if options.get("lossless"):
+            params["lossless"] = True
+        return params
+
+    @classmethod
+    def save_image(cls, image: torch.Tensor, save_path: str, options: Optional[Dict[str, Any]] = None):
         """
         Save a Tensor image to the provided path.
 
@@ -29,15 +53,54 @@ class PilImageEncoder(ImageEncoder):
         :type image: torch.Tensor
         :param save_path: save path without extension
         :type save_path: str
+        :param options: encoder options, ``quality`` sets the encoder specific quality/speed trade-off
+        :type options: Optional[Dict[str, Any]]
         """
-        i = 255.0 * image.cpu().numpy()
-        img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
+        img = cls.to_pil_image(image)
 
-        file_path = f"{save_path}{PilImageEncoder.file_extension()}"
-        img.save(file_path, compress_level=PilImageEncoder.COMPRESS_LEVEL)
+        file_path = f"{save_path}{cls.file_extension()}"
+        img.save(file_path, **cls.save_params(options))
 
-    @staticmethod
-    def load_image(image_path: str) -> torch.Tensor:
+    @classmethod
+    def save_images(
+        cls,
+        images: Sequence[torch.Tensor],
+        save_paths: Sequence[str],
+        workers: int = 1,
+        max_pending: Optional[int] = None,
+        options: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        Save a batch of images, one file per image.
+
+        The whole batch is converted to uint8 at once, the threads only
+        encode the frames.
+
+        :param images: ``[N,H,W,C]`` batch or sequence of images
+        :type images: Sequence[torch.Tensor]
+        :param save_paths: save paths without extension, one per image
+        :type save_paths: Sequence[str]
+        :param workers: number of encoding threads
+        :type workers: int
+        :param max_pending: maximum number of queued images, defaults to ``2 * workers``
+        :type max_pending: Optional[int]
+        :param options: encoder options, ``quality`` is the WebP quality (0-100)
+        :type options: Optional[Dict[str, Any]]
+        """
+        if len(images) != len(save_paths):
+            raise Exception(f"Got {len(images)} images for {len(save_paths)} paths!")
+
+        frames = cls.to_uint8_array(as_image_batch(images))
+        params = cls.save_params(options)
+        extension = cls.file_extension()
+
+        def save(idx: int):
+            Image.fromarray(frames[idx]).save(f"{save_paths[idx]}{extension}", **params)
+
+        run_bounded(save, len(save_paths), workers, max_pending)
+
+    @classmethod
+    def load_image(cls, image_path: str) -> torch.Tensor:
         """
         Load image from a given path.
 
@@ -46,12 +109,57 @@ class PilImageEncoder(ImageEncoder):
         :return: Image as a Tensor
         :rtype: Tensor
         """
-        i = Image.open(f"{image_path}{PilImageEncoder.file_extension()}")
+        return to_float_images(cls.load_stored_image(image_path))
+
+    @classmethod
+    def load_stored_image(cls, image_path: str) -> torch.Tensor:
+        """
+        Load image from a given path, as uint8.
+
+        :param image_path: path without extension
+        :type image_path: str
+        :return: Image as a uint8 Tensor
+        :rtype: Tensor
+        """
+        return cls.from_pil_image(Image.open(f"{image_path}{cls.file_extension()}"), compact=True)
+
+    @staticmethod
+    def to_uint8_array(images: torch.Tensor) -> np.ndarray:
+        """
+        Convert Tensor image(s) to a uint8 array, rounding to the nearest value.
+
+        :param images: image or batch of images, float in [0, 1] or uint8
+        :type images: torch.Tensor
+        :return: uint8 array with the same shape
+        :rtype: np.ndarray
+        """
+        return to_storage_dtype(images.detach().cpu(), {"dtype": "uint8"}).numpy()
 
+    @staticmethod
+    def to_pil_image(image: torch.Tensor) -> Image.Image:
+        """
+        Convert a Tensor image to a PIL image.
+
+        :param image: Tensor containing an image, float in [0, 1] or uint8
+        :type image: torch.Tensor
+        :return: 8 bits PIL image
+        :rtype: Image.Image
+        """
+        return Image.fromarray(PilImageEncoder.to_uint8_array(image))
+
+    @staticmethod
+    def from_pil_image(i: Image.Image, compact: bool = False) -> torch.Tensor:
+        """
+        Convert a PIL image to a Tensor image.
+
+        :param i: PIL image
+        :type i: Image.Image
+        :param compact: return the uint8 image instead of float32
+        :type compact: bool
+        :return: Image as a Tensor
+        :rtype: Tensor
+        """
         if i.mode == "I":
             i = i.point(lambda i: i * (1 / 255))
-        image = i.convert("RGB")
-
-        image = np.array(image).astype(np.float32) / 255.0
-        image = torch.from_numpy(image)[None,]
-        return image.squeeze(0)  # remove batch dimension
+        image = torch.from_numpy(np.array(i.convert("RGB")))
+        return image if compact else to_float_images(image)
@@ -0,0 +1,39 @@
+"""PngImageEncoder module."""
+from typing import Any, Dict, Optional
+from .pil_image_encoder import PilImageEncoder
+
+
+class PngImageEncoder(PilImageEncoder):
+    """
+    PngImageEncoder implementation.
+
+    Frames are stored as lossless PNG images, with a low zlib level by
+    default as encoding speed matters more than size.
+    """
+
+    COMPRESS_LEVEL = 1
+
+    @staticmethod
+    def file_extension() -> str:
+        """Get file extension (with initial dot)."""
+        return ".png"
+
+    @staticmethod
+    def get_name() -> str:
+        """Get the unique name of the encoder."""
+        return "png"
+
+    @staticmethod
+    def save_params(options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Get the PIL save parameters from the encoder options.
+
+        :param options: encoder options, ``effort`` is the zlib level (0-9), ``quality`` is ignored
+        :type options: Optional[Dict[str, Any]]
+        :return: keyword arguments of ``Image.save``
+        :rtype: Dict[str, Any]
+        """
+        effort = (options or dict()).get("effort")
+        if effort is None or effort < 0:
+            return {"compress_level": PngImageEncoder.COMPRESS_LEVEL}
+        return {"compress_level": max(0, min(9, int(effort)))}
@@ -0,0 +1,260 @@
+"""RawImageEncoder module."""
+import os
+import json
+import mmap
+import struct
+import torch
+from typing import Any, Dict, Optional, Sequence
+from safetensors.torch import save_file
+from .image_encoder import ImageEncoder, as_image_batch, to_float_images, to_storage_dtype
+
+RAW_FILENAME = "frames"
+
+_DTYPES = {
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "U8": torch.uint8,
+}
+_DTYPE_NAMES = {dtype: name for name, dtype in _DTYPES.items()}
+_HEADER_SIZE = struct.Struct("<Q")
+# room left in the header of a bank written incrementally for its final frame count and size
+_HEADER_RESERVE = 64
+
+
+class RawImageEncoder(ImageEncoder):
+    """
+    RawImageEncoder implementation.
+
+    A bank is stored as a single uncompressed safetensors file holding the
+    ``[N,H,W,C]`` batch. Loading memory-maps the file: the returned tensor is
+    backed by the page cache, which is shared between processes, and writes
+    to it are private copy-on-write pages that never reach the file.
+
+    Banks written incrementally reserve room in the safetensors header,
+    which is padded with spaces and rewritten after each append.
+    """
+
+    @staticmethod
+    def file_extension() -> str:
+        """Get file extension (with initial dot)."""
+        return ".safetensors"
+
+    @staticmethod
+    def get_name() -> str:
+        """Get the unique name of the encoder."""
+        return "raw"
+
+    @classmethod
+    def packs_frames(cls) -> bool:
+        """Check if the frames of a bank are packed in container files rather than stored one file per frame."""
+        return True
+
+    @staticmethod
+    def map_tensor(file_path: str, name: str = "images") -> torch.Tensor:
+        """
+        Memory-map a tensor of an uncompressed safetensors file.
+
+        :param file_path: file path with extension
+        :type file_path: str
+        :param name: name of the tensor in the file
+        :type name: str
+        :return: tensor backed by the mapping
+        :rtype: Tensor
+        """
+        with open(file_path, "rb") as fi:
+            mapping = mmap.mmap(fi.fileno(), 0, access=mmap.ACCESS_COPY)
+
+        (header_size,) = struct.unpack("<Q", mapping[:8])
+        info = json.loads(mapping[8:8 + header_size]).get(name)
+        if info is None:
+            raise Exception(f"Tensor '{name}' not found in {file_path}!")
+
+        dtype = _DTYPES.get(info["dtype"])
+        if dtype is None:
+            raise Exception(f"Unsupported dtype {info['dtype']} in {file_path}!")
+
+        start, end = info["data_offsets"]
+        shape = info["shape"]
+        if end == start:
+            return torch.empty(shape, dtype=dtype)
+
+        # the tensor keeps a reference to the mapping
+        tensor = torch.frombuffer(
+            mapping, dtype=dtype, count=(end - start) // dtype.itemsize, offset=8 + header_size + start
+        )
+        return tensor.view(shape)
+
+    @staticmethod
+    def save_image(image: torch.Tensor, save_path: str, options: Optional[Dict[str, Any]] = None):
+        """
+        Save a Tensor image to the provided path.
+
+        :param image: Tensor containing an image
+        :type image: torch.Tensor
+        :param save_path: save path without extension
+        :type save_path: str
+        :param options: encoder options, ``quality`` sets the encoder specific quality/speed trade-off
+        :type options: Optional[Dict[str, Any]]
+        """
+        save_file(
+            {"images": to_storage_dtype(image, options).unsqueeze(0).contiguous()},
+            f"{save_path}{RawImageEncoder.file_extension()}",
+        )
+
+    @staticmethod
+    def load_image(image_path: str) -> torch.Tensor:
+        """
+        Load image from a given path.
+
+        :param image_path: path without extension
+        :type image_path: str
+        :return: Image as a Tensor
+        :rtype: Tensor
+        """
+        return to_float_images(RawImageEncoder.load_stored_image(image_path))
+
+    @classmethod
+    def load_stored_image(cls, image_path: str) -> torch.Tensor:
+        """
+        Memory-map image from a given path, in its stored dtype.
+
+        :param image_path: path without extension
+        :type image_path: str
+        :return: Image as a Tensor
+        :rtype: Tensor
+        """
+        return cls.map_tensor(f"{image_path}{cls.file_extension()}")[0]
+
+    @classmethod
+    def save_frames(
+        cls,
+        images: Sequence[torch.Tensor],
+        bank_path: str,
+        workers: int = 1,
+        max_pending: Optional[int] = None,
+        options: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        Save the frames of a bank as a single uncompressed tensor.
+
+        :param images: frames to save
+        :type images: Sequence[torch.Tensor]
+        :param bank_path: path of the bank
+        :type bank_path: str
+        :param workers: unused, nothing is encoded
+        :type workers: int
+        :param max_pending: unused
+        :type max_pending: Optional[int]
+        :param options: encoder options, ``quality`` sets the encoder specific quality/speed trade-off
+        :type options: Optional[Dict[str, Any]]
+        """
+        save_file(
+            {"images": to_storage_dtype(as_image_batch(images), options).contiguous()},
+            f"{bank_path}/{RAW_FILENAME}{cls.file_extension()}",
+        )
+
+    @classmethod
+    def load_frames(cls, bank_path: str, num_frames: int, workers: int = 1) -> torch.Tensor:
+        """
+        Memory-map all the frames of a bank, nothing is decoded or copied.
+
+        :param bank_path: path of the bank
+        :type bank_path: str
+        :param num_frames: number of frames in the bank
+        :type num_frames: int
+        :param workers: unused
+        :type workers: int
+        :return: Batch of images
+        :rtype: Tensor
+        """
+        file_path = f"{bank_path}/{RAW_FILENAME}{cls.file_extension()}"
+        images = cls.map_tensor(file_path)
+        if images.shape[0] != num_frames:
+            raise Exception(f"Expected {num_frames} frames in {file_path}, found {images.shape[0]}!")
+        return images
+
+    @classmethod
+    def load_frame(cls, bank_path: str, index: int) -> torch.Tensor:
+        """
+        Memory-map a single frame of a bank.
+
+        :param bank_path: path of the bank
+        :type bank_path: str
+        :param index: index of the frame (negative indices are supported)
+        :type index: int
+        :return: Image as a Tensor
+        :rtype: Tensor
+        """
+        return cls.map_tensor(f"{bank_path}/{RAW_FILENAME}{cls.file_extension()}")[index]
+
+    @classmethod
+    def append_frames(
+        cls,
+        images: Sequence[torch.Tensor],
+        bank_path: str,
+        start: int,
+        workers: int = 1,
+        options: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        Save frames of a bank that is written incrementally.
+
+        :param images: frames to save
+        :type images: Sequence[torch.Tensor]
+        :param bank_path: path of the bank
+        :type bank_path: str
+        :param start: index of the first frame
+        :type start: int
+        :param workers: unused, nothing is encoded
+        :type workers: int
+        :param options: encoder options
+        :type options: Optional[Dict[str, Any]]
+        """
+        batch = to_storage_dtype(as_image_batch(images), options).contiguous()
+        file_path = f"{bank_path}/{RAW_FILENAME}{cls.file_extension()}"
+
+        if start == 0:
+            info = {"dtype": _DTYPE_NAMES[batch.dtype], "shape": [0, *batch.shape[1:]], "data_offsets": [0, 0]}
+            header_size = len(json.dumps({"images": info})) + _HEADER_RESERVE
+            # keep the data aligned as safetensors does
+            header_size += -header_size % 8
+            with open(file_path, "wb") as fo:
+                fo.write(_HEADER_SIZE.pack(header_size) + b" " * header_size)
+        else:
+            with open(file_path, "rb") as fi:
+                (header_size,) = _HEADER_SIZE.unpack(fi.read(_HEADER_SIZE.size))
+                info = json.loads(fi.read(header_size))["images"]
+            if info["shape"][0] != start:
+                raise Exception(f"Expected {start} frames in {file_path}, found {info['shape'][0]}!")
+            if info["dtype"] != _DTYPE_NAMES[batch.dtype] or info["shape"][1:] != list(batch.shape[1:]):
+                raise Exception(f"Frames appended to {file_path} must be {info['dtype']} {info['shape'][1:]} frames!")
+
+        info["shape"][0] += batch.shape[0]
+        info["data_offsets"][1] += batch.numel() * batch.element_size()
+        header = json.dumps({"images": info}).encode()
+        if len(header) > header_size:
+            raise Exception(f"Header of {file_path} is too small for {info['shape'][0]} frames!")
+
+        with open(file_path, "r+b") as fo:
+            fo.seek(0, os.SEEK_END)
+            fo.write(memoryview(batch.reshape(-1).view(torch.uint8).numpy()))
+            # the header is rewritten last, the file is only valid once the frames are written
+            fo.seek(_HEADER_SIZE.size)
+            fo.write(header.ljust(header_size))
+
+    @classmethod
+    def load_frame_range(cls, bank_path: str, start: int, stop: int) -> torch.Tensor:
+        """
+        Memory-map the frames ``start`` to ``stop`` (excluded) of a bank.
+
+        :param bank_path: path of the bank
+        :type bank_path: str
+        :param start: index of the first frame
+        :type start: int
+        :param stop: index after the last frame
+        :type stop: int
+        :return: Batch of images
+        :rtype: Tensor
+        """
+        return cls.map_tensor(f"{bank_path}/{RAW_FILENAME}{cls.file_extension()}")[start:stop]
@@ -0,0 +1,310 @@
+"""SafetensorsBankEncoder module."""
+import os
+import bisect
+import torch
+import zstandard as zstd
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+from safetensors.torch import save, load
+from .image_encoder import ImageEncoder, as_image_batch, to_float_images, to_storage_dtype
+from .safetensor_image_encoder import SafetensorsImageEncoder
+
+# 128MB window: several consecutive frames are visible to the matcher
+ZSTD_WINDOW_LOG = 27
+
+
+class SafetensorsBankEncoder(ImageEncoder):
+    """
+    SafetensorsBankEncoder implementation.
+
+    Frames are stored in chunks of ``CHUNK_FRAMES`` frames, each chunk being a
+    single ``[K,H,W,C]`` tensor compressed with zstd long distance matching so
+    redundancy between consecutive frames is removed. Chunk files are named
+    after the index of their first frame.
+    """
+
+    CHUNK_FRAMES = 16
+
+    @staticmethod
+    def get_name() -> str:
+        """Get the unique name of the encoder."""
+        return "safetensors_bank"
+
+    @staticmethod
+    def file_extension() -> str:
+        """Get file extension (with initial dot)."""
+        return ".frames.safetensors.zst"
+
+    @classmethod
+    def packs_frames(cls) -> bool:
+        """Check if the frames of a bank are packed in container files rather than stored one file per frame."""
+        return True
+
+    @staticmethod
+    def _compressor(options: Optional[Dict[str, Any]] = None) -> zstd.ZstdCompressor:
+        params = zstd.ZstdCompressionParameters.from_level(
+            SafetensorsImageEncoder.compression_level(options), window_log=ZSTD_WINDOW_LOG, enable_ldm=True
+        )
+        return zstd.ZstdCompressor(compression_params=params)
+
+    @staticmethod
+    def save_chunk(images: torch.Tensor, file_path: str, options: Optional[Dict[str, Any]] = None):
+        """
+        Save a batch of frames as a single compressed tensor.
+
+        :param images: batch of images
+        :type images: torch.Tensor
+        :param file_path: file path with extension
+        :type file_path: str
+        :param options: encoder options, ``quality`` is the zstd level, ``dtype`` the storage dtype
+        :type options: Optional[Dict[str, Any]]
+        """
+        images = to_storage_dtype(images, options)
+        data = save({"images": images if images.is_contiguous() else images.contiguous()})
+        with open(file_path, "wb") as ofh:
+            ofh.write(SafetensorsBankEncoder._compressor(options).compress(data))
+
+    @staticmethod
+    def load_chunk(file_path: str) -> torch.Tensor:
+        """
+        Load a batch of frames saved by ``save_chunk``.
+
+        :param file_path: file path with extension
+        :type file_path: str
+        :return: Batch of images
+        :rtype: Tensor
+        """
+        with open(file_path, "rb") as cached_file:
+            with zstd.ZstdDecompressor().stream_reader(cached_file) as reader:
+                data = reader.read()
+        return load(data).get("images")  # type: ignore
+
+    @classmethod
+    def _chunk_starts(cls, bank_path: str) -> List[int]:
+        ext = cls.file_extension()
+        starts = []
+        for name in os.listdir(bank_path):
+            if name.endswith(ext) and name[:-len(ext)].isdigit():
+                starts.append(int(name[:-len(ext)]))
+        if not starts:
+            raise Exception(f"No frames found in bank {bank_path}!")
+        return sorted(starts)
+
+    @staticmethod
+    def save_image(image: torch.Tensor, save_path: str, options: Optional[Dict[str, Any]] = None):
+        """
+        Save a Tensor image to the provided path.
+
+        :param image: Tensor containing an image
+        :type image: torch.Tensor
+        :param save_path: save path without extension
+        :type save_path: str
+        :param options: encoder options, ``quality`` sets the encoder specific quality/speed trade-off
+        :type options: Optional[Dict[str, Any]]
+        """
+        SafetensorsBankEncoder.save_chunk(
+            image.unsqueeze(0), f"{save_path}{SafetensorsBankEncoder.file_extension()}", options
+        )
+
+    @staticmethod
+    def load_image(image_path: str) -> torch.Tensor:
+        """
+        Load image from a given path.
+
+        :param image_path: path without extension
+        :type image_path: str
+        :return: Image as a Tensor
+        :rtype: Tensor
+        """
+        return to_float_images(SafetensorsBankEncoder.load_stored_image(image_path))
+
+    @classmethod
+    def load_stored_image(cls, image_path: str) -> torch.Tensor:
+        """
+        Load image from a given path, in its stored dtype.
+
+        :param image_path: path without extension
+        :type image_path: str
+        :return: Image as a Tensor
+        :rtype: Tensor
+        """
+        return cls.load_chunk(f"{image_path}{cls.file_extension()}")[0]
+
+    @classmethod
+    def save_frames(
+        cls,
+        images: Sequence[torch.Tensor],
+        bank_path: str,
+        workers: int = 1,
+        max_pending: Optional[int] = None,
+        options: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        Save the frames of a bank in chunks of ``CHUNK_FRAMES`` frames.
+
+        :param images: frames to save
+        :type images: Sequence[torch.Tensor]
+        :param bank_path: path of the bank
+        :type bank_path: str
+        :param workers: number of chunks compressed in parallel
+        :type workers: int
+        :param max_pending: unused
+        :type max_pending: Optional[int]
+        :param options: encoder options, ``quality`` sets the encoder specific quality/speed trade-off
+        :type options: Optional[Dict[str, Any]]
+        """
+        cls.append_frames(images, bank_path, 0, workers=workers, options=options)
+
+    @classmethod
+    def write_batch_frames(cls) -> int:
+        """Get the number of frames ``append_frames`` expects per call (except the last one)."""
+        return cls.CHUNK_FRAMES
+
+    @classmethod
+    def append_frames(
+        cls,
+        images: Sequence[torch.Tensor],
+        bank_path: str,
+        start: int,
+        workers: int = 1,
+        options: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        Save frames of a bank that is written incrementally.
+
+        :param images: frames to save
+        :type images: Sequence[torch.Tensor]
+        :param bank_path: path of the bank
+        :type bank_path: str
+        :param start: index of the first frame, must start a chunk
+        :type start: int
+        :param workers: number of chunks compressed in parallel
+        :type workers: int
+        :param options: encoder options
+        :type options: Optional[Dict[str, Any]]
+        """
+        if start % cls.CHUNK_FRAMES != 0:
+            raise Exception(f"Frames must be appended by chunks of {cls.CHUNK_FRAMES} frames!")
+
+        offsets = range(0, len(images), cls.CHUNK_FRAMES)
+
+        def save_chunk(offset: int):
+            chunk = as_image_batch(images[offset:offset + cls.CHUNK_FRAMES])
+            cls.save_chunk(chunk, f"{bank_path}/{start + offset}{cls.file_extension()}", options)
+
+        if workers > 1 and len(offsets) > 1:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(save_chunk, offsets))
+        else:
+            for offset in offsets:
+                save_chunk(offset)
+
+    @classmethod
+    def load_frames(cls, bank_path: str, num_frames: int, workers: int = 1) -> torch.Tensor:
+        """
+        Load all the frames of a bank.
+
+        :param bank_path: path of the bank
+        :type bank_path: str
+        :param num_frames: number of frames in the bank
+        :type num_frames: int
+        :param workers: number of chunks decompressed in parallel
+        :type workers: int
+        :return: Batch of images
+        :rtype: Tensor
+        """
+        starts = cls._chunk_starts(bank_path)
+
+        first = cls.load_chunk(f"{bank_path}/{starts[0]}{cls.file_extension()}")
+        output = torch.empty((num_frames, *first.shape[1:]), dtype=first.dtype)
+        lengths: Dict[int, int] = dict()
+
+        def copy_chunk(start: int, chunk: torch.Tensor):
+            if start + chunk.shape[0] > num_frames:
+                raise Exception(f"Bank {bank_path} holds more than {num_frames} frames!")
+            output[start:start + chunk.shape[0]].copy_(chunk)
+            lengths[start] = chunk.shape[0]
+
+        def decode(start: int):
+            copy_chunk(start, cls.load_chunk(f"{bank_path}/{start}{cls.file_extension()}"))
+
+        copy_chunk(starts[0], first)
+        if workers > 1 and len(starts) > 2:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(decode, starts[1:]))
+        else:
+            for start in starts[1:]:
+                decode(start)
+
+        # the chunks must cover [0, num_frames) exactly, the output is not initialized elsewhere
+        end = 0
+        for start in starts:
+            if start != end:
+                raise Exception(f"Bank {bank_path} is missing frames {end} to {start}!")
+            end = start + lengths[start]
+        if end != num_frames:
+            raise Exception(f"Bank {bank_path} holds {end} frames, expected {num_frames}!")
+
+        return output
+
+    @classmethod
+    def load_frame(cls, bank_path: str, index: int) -> torch.Tensor:
+        """
+        Load a single frame of a bank, only its chunk is decompressed.
+
+        :param bank_path: path of the bank
+        :type bank_path: str
+        :param index: index of the frame (negative indices are supported)
+        :type index: int
+        :return: Image as a Tensor
+        :rtype: Tensor
+        """
+        starts = cls._chunk_starts(bank_path)
+
+        if index < 0:
+            # negative indices are resolved against the last chunk
+            chunk = cls.load_chunk(f"{bank_path}/{starts[-1]}{cls.file_extension()}")
+            index += starts[-1] + chunk.shape[0]
+            if index < 0:
+                raise IndexError(f"Frame index out of range for bank {bank_path}")
+            if index >= starts[-1]:
+                return chunk[index - starts[-1]].clone()
+
+        start = starts[bisect.bisect_right(starts, index) - 1]
+        chunk = cls.load_chunk(f"{bank_path}/{start}{cls.file_extension()}")
+        if not start <= index < start + chunk.shape[0]:
+            raise IndexError(f"Frame {index} out of range for bank {bank_path}")
+        # do not keep the whole chunk alive
+        return chunk[index - start].clone()
+
+    @classmethod
+    def load_frame_range(cls, bank_path: str, start: int, stop: int) -> torch.Tensor:
+        """
+        Load the frames ``start`` to ``stop`` (excluded) of a bank, each chunk is decompressed once.
+
+        :param bank_path: path of the bank
+        :type bank_path: str
+        :param start: index of the first frame
+        :type start: int
+        :param stop: index after the last frame
+        :type stop: int
+        :return: Batch of images
+        :rtype: Tensor
+        """
+        starts = cls._chunk_starts(bank_path)
+        output: Optional[torch.Tensor] = None
+        loaded = 0
+
+        for chunk_start in starts[max(0, bisect.bisect_right(starts, start) - 1):]:
+            if chunk_start >= stop:
+                break
+            chunk = cls.load_chunk(f"{bank_path}/{chunk_start}{cls.file_extension()}")
+            if output is None:
+                output = torch.empty((stop - start, *chunk.shape[1:]), dtype=chunk.dtype)
+            lo, hi = max(start, chunk_start), min(stop, chunk_start + chunk.shape[0])
+            output[lo - start:hi - start].copy_(chunk[lo - chunk_start:hi - chunk_start])
+            loaded += max(0, hi - lo)
+
+        if output is None or loaded != stop - start:
+            raise IndexError(f"Frames {start} to {stop} out of range for bank {bank_path}")
+        return output
@@ -1,9 +1,9 @@
 """SafetensorsImageEncoder module."""
 import torch
-import tempfile
 import zstandard as zstd
-from safetensors.torch import save_file, load_file
-from .image_encoder import ImageEncoder
+from typing import Any, Dict, Optional
+from safetensors.torch import save, load
+from .image_encoder import ImageEncoder, to_float_images, to_storage_dtype
 
 ZSTD_COMPRESSION_LEVEL = 5
 
@@ -22,42 +22,68 @@ class SafetensorsImageEncoder(ImageEncoder):
         return ".safetensors.zst"
 
     @staticmethod
-    def save_image(image: torch.Tensor, save_path: str):
+    def compression_level(options: Optional[Dict[str, Any]] = None) -> int:
+        """
+        Get the zstd compression level from the encoder options.
+
+        :param options: encoder options, ``quality`` is the zstd level (1-22)
+        :type options: Optional[Dict[str, Any]]
+        :return: zstd compression level
+        :rtype: int
+        """
+        level = (options or dict()).get("quality")
+        if level is None or level < 0:
+            return ZSTD_COMPRESSION_LEVEL
+        return max(1, min(22, int(level)))
+
+    @staticmethod
+    def save_image(image: torch.Tensor, save_path: str, options: Optional[Dict[str, Any]] = None):
         """
         Save a Tensor image to the provided path.
 
+        The image is serialized and compressed in memory.
+
         :param image: Tensor containing an image
         :type image: torch.Tensor
         :param save_path: save path without extension
         :type save_path: str
+        :param options: encoder options, ``quality`` is the zstd level, ``dtype`` the storage dtype
+        :type options: Optional[Dict[str, Any]]
         """
-        with tempfile.NamedTemporaryFile(delete=True) as save_tmp_filename:
-            save_file(
-                {"img": image.clone().contiguous()}, filename=save_tmp_filename.name
-            )
+        image = to_storage_dtype(image, options)
+        # safetensors needs a contiguous tensor, avoid the copy when it already is
+        data = save({"img": image if image.is_contiguous() else image.contiguous()})
 
-            z_comp = zstd.ZstdCompressor(level=ZSTD_COMPRESSION_LEVEL)
-            with open(save_tmp_filename.name, "rb") as ifh, open(
-                f"{save_path}{SafetensorsImageEncoder.file_extension()}", "wb"
-            ) as ofh:
-                z_comp.copy_stream(ifh, ofh)
+        z_comp = zstd.ZstdCompressor(level=SafetensorsImageEncoder.compression_level(options))
+        with open(f"{save_path}{SafetensorsImageEncoder.file_extension()}", "wb") as ofh:
+            ofh.write(z_comp.compress(data))
 
     @staticmethod
     def load_image(image_path: str) -> torch.Tensor:
         """
         Load image from a given path.
 
+        The image is decompressed and deserialized in memory.
+
+        :param image_path: path without extension
+        :type image_path: str
+        :return: Image as a Tensor
+        :rtype: Tensor
+        """
+        return to_float_images(SafetensorsImageEncoder.load_stored_image(image_path))
+
+    @classmethod
+    def load_stored_image(cls, image_path: str) -> torch.Tensor:
+        """
+        Load image from a given path, in its stored dtype.
+
         :param image_path: path without extension
         :type image_path: str
         :return: Image as a Tensor
         :rtype: Tensor
         """
-        with tempfile.NamedTemporaryFile(delete=True) as load_tmp_filename:
-            with open(
-                f"{image_path}{SafetensorsImageEncoder.file_extension()}", "rb"
-            ) as cached_file, open(
-                load_tmp_filename.name, "wb"
-            ) as uncompressed_cached_file:
-                z_decomp = zstd.ZstdDecompressor()
-                z_decomp.copy_stream(cached_file, uncompressed_cached_file)
-            return load_file(load_tmp_filename.name).get("img")  # type: ignore
+        with open(f"{image_path}{cls.file_extension()}", "rb") as cached_file:
+            # streamed decompression also handles frames without content size
+            with zstd.ZstdDecompressor().stream_reader(cached_file) as reader:
+                data = reader.read()
+        return load(data).get("img")  # type: ignore
@@ -0,0 +1,188 @@
+"""Color transfer between images."""
+from typing import Tuple
+
+import torch
+
+# regularization of the covariance matrices, flat images have singular ones
+_COV_EPS = 1e-6
+# frames of a sequence sorted together, bounds the working memory of the batched sort
+_SORT_CHUNK_FRAMES = 8
+
+
+def _sort_channels(images: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Sort the values of each channel, ``[..., P, C]`` -> sorted values and order, ``[..., C, P]``."""
+    return torch.sort(images.transpose(-1, -2).contiguous(), dim=-1)
+
+
+def _get_runs(sorted_values: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Locate the runs of equal values of sorted channels.
+
+    :return: number of values lower than or equal to each value, index of the first value equal to it
+    """
+    size = sorted_values.shape[-1]
+    positions = torch.arange(size, device=sorted_values.device).expand_as(sorted_values)
+    is_first = torch.ones_like(sorted_values, dtype=torch.bool)
+    is_first[..., 1:] = sorted_values[..., 1:] != sorted_values[..., :-1]
+    is_last = torch.ones_like(is_first)
+    is_last[..., :-1] = is_first[..., 1:]
+
+    counts = torch.where(is_last, positions + 1, size).flip(-1).cummin(-1).values.flip(-1)
+    starts = torch.where(is_first, positions, 0).cummax(-1).values
+    return counts, starts
+
+
+class _Histograms:
+    """Cumulative histograms of the channels of a reference image."""
+
+    def __init__(self, reference: torch.Tensor):
+        self.values, _ = _sort_channels(reference.reshape(-1, reference.shape[-1]))
+        self.counts, self.starts = _get_runs(self.values)
+        self.values = self.values.to(torch.float64)
+
+    def match(self, sorted_values: torch.Tensor, order: torch.Tensor) -> torch.Tensor:
+        """
+        Map sorted ``[C, P]`` channels to the values of same quantile, returns ``[P, C]`` values.
+
+        Same as ``numpy.interp(src_cdf, ref_cdf, ref_values)`` over the unique
+        values, the interpolation interval is found by integer arithmetic
+        since both cumulative histograms are sorted.
+        """
+        src_size, ref_size = sorted_values.shape[-1], self.values.shape[-1]
+        src_counts, _ = _get_runs(sorted_values)
+
+        # first reference value whose quantile reaches the source quantile
+        reached = (src_counts * ref_size + src_size - 1) // src_size - 1
+        idx = self.starts.gather(-1, reached)
+        if ref_size == 1:
+            matched = self.values.expand_as(idx)
+        else:
+            idx = idx.clamp(1, ref_size - 1)
+            x = src_counts.to(torch.float64) / src_size
+            x0 = self.counts.gather(-1, idx - 1).to(torch.float64) / ref_size
+            x1 = self.counts.gather(-1, idx).to(torch.float64) / ref_size
+            y0, y1 = self.values.gather(-1, idx - 1), self.values.gather(-1, idx)
+            # x0 == x1 when the first run of the reference spans the first two values
+            matched = y0 + ((x - x0) / (x1 - x0).clamp_min(torch.finfo(x.dtype).tiny)).clamp(0, 1) * (y1 - y0)
+
+        matched = matched.to(sorted_values.dtype)
+        return torch.empty_like(matched).scatter_(-1, order, matched).transpose(-1, -2)
+
+
+def match_histograms(source: torch.Tensor, reference: torch.Tensor) -> torch.Tensor:
+    """
+    Match the per channel histogram of an image to the one of a reference.
+
+    Each source value is mapped to the reference value of same quantile,
+    equal source values are mapped to the same value.
+
+    :param source: image to transform, ``[..., C]``
+    :type source: torch.Tensor
+    :param reference: image whose colors are matched, ``[..., C]``
+    :type reference: torch.Tensor
+    :return: transformed image, shaped as the source
+    :rtype: torch.Tensor
+    """
+    sorted_values, order = _sort_channels(source.reshape(-1, source.shape[-1]))
+    return _Histograms(reference).match(sorted_values, order).reshape(source.shape)
+
+
+def _sqrtm(matrix: torch.Tensor, inverse: bool = False) -> torch.Tensor:
+    """Square root (or inverse square root) of a symmetric positive semi-definite matrix."""
+    eigenvalues, eigenvectors = torch.linalg.eigh(matrix)
+    eigenvalues = eigenvalues.clamp_min(_COV_EPS).sqrt()
+    if inverse:
+        eigenvalues = 1.0 / eigenvalues
+    return eigenvectors @ torch.diag_embed(eigenvalues) @ eigenvectors.transpose(-1, -2)
+
+
+def match_gaussian(source: torch.Tensor, reference: torch.Tensor) -> torch.Tensor:
+    """
+    Match the color distribution of an image to the one of a reference, both modeled as multivariate Gaussians.
+
+    Colors are moved by the linear Monge-Kantorovich map between the two
+    distributions, which matches the mean and covariance of the reference.
+
+    :param source: image to transform, ``[..., C]``
+    :type source: torch.Tensor
+    :param reference: image whose colors are matched, ``[..., C]``
+    :type reference: torch.Tensor
+    :return: transformed image, shaped as the source
+    :rtype: torch.Tensor
+    """
+    src = source.reshape(-1, source.shape[-1]).to(torch.float64)
+    ref = reference.reshape(-1, reference.shape[-1]).to(torch.float64)
+    eye = torch.eye(src.shape[-1], dtype=torch.float64, device=src.device)
+
+    src_mean, ref_mean = src.mean(0), ref.mean(0)
+    src_cov = torch.cov(src.T).reshape(eye.shape) + _COV_EPS * eye
+    ref_cov = torch.cov(ref.T).reshape(eye.shape) + _COV_EPS * eye
+
+    src_sqrt = _sqrtm(src_cov)
+    src_inv_sqrt = _sqrtm(src_cov, inverse=True)
+    transfer = src_inv_sqrt @ _sqrtm(src_sqrt @ ref_cov @ src_sqrt) @ src_inv_sqrt
+
+    matched = (src - src_mean) @ transfer + ref_mean
+    return matched.to(source.dtype).reshape(source.shape)
+
+
+def hm_mvgd_hm(source: torch.Tensor, reference: torch.Tensor) -> torch.Tensor:
+    """
+    Transfer the colors of a reference to an image: histogram matching, Gaussian matching, histogram matching.
+
+    :param source: image to transform, ``[H,W,C]``
+    :type source: torch.Tensor
+    :param reference: image whose colors are matched, ``[H,W,C]``
+    :type reference: torch.Tensor
+    :return: transformed image
+    :rtype: torch.Tensor
+    """
+    sorted_values, order = _sort_channels(source.reshape(-1, source.shape[-1]))
+    return _hm_mvgd_hm(sorted_values, order, reference).reshape(source.shape)
+
+
+def _hm_mvgd_hm(sorted_values: torch.Tensor, order: torch.Tensor, reference: torch.Tensor) -> torch.Tensor:
+    """``hm_mvgd_hm`` of a source whose ``[C, P]`` channels are already sorted, returns ``[P, C]`` values."""
+    # the reference histograms are built once for both matchings
+    histograms = _Histograms(reference)
+    matched = match_gaussian(histograms.match(sorted_values, order), reference)
+    return histograms.match(*_sort_channels(matched))
+
+
+def transfer_colors(images: torch.Tensor, strength: float = 1.0) -> torch.Tensor:
+    """
+    Match the colors of each frame of a sequence to the previous (already matched) frame.
+
+    The first frame is the reference of the whole sequence, each following
+    frame is matched to its predecessor once transformed, so colors stay
+    stable along the sequence. The matching runs frame after frame on
+    purpose, since each frame depends on the previous matched one. The
+    source frames do not, they are sorted in batch by chunks of
+    ``_SORT_CHUNK_FRAMES`` frames, so the working memory does not grow with
+    the length of the sequence.
+
+    :param images: ``[N,H,W,C]`` batch of frames
+    :type images: torch.Tensor
+    :param strength: blend between the original (0) and the matched (1) frames
+    :type strength: float
+    :return: ``[N,H,W,C]`` batch of float32 frames, in ``[0, 1]``
+    :rtype: torch.Tensor
+    """
+    if images.dim() == 3:
+        images = images.unsqueeze(0)
+    if images.dim() != 4:
+        raise ValueError(f"Expected 3D or 4D tensor, got shape {tuple(images.shape)}")
+
+    images = images.to(torch.float32)
+    result = images.clone()
+    if images.shape[0] < 2 or strength == 0:
+        return result
+
+    frames = images.reshape(images.shape[0], -1, images.shape[-1])
+    for start in range(1, images.shape[0], _SORT_CHUNK_FRAMES):
+        stop = min(start + _SORT_CHUNK_FRAMES, images.shape[0])
+        sorted_values, orders = _sort_channels(frames[start:stop])
+        for idx in range(start, stop):
+            matched = _hm_mvgd_hm(sorted_values[idx - start], orders[idx - start], result[idx - 1])
+            result[idx] = torch.lerp(images[idx], matched.reshape(images[idx].shape), strength).clamp_(0, 1)
+    return result
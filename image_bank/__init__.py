@@ -3,20 +3,61 @@ import os
 import json
 import hashlib
 import logging
-from typing import Dict, List, Any
+import threading
+from typing import Dict, List, Any, Optional, Tuple
 from pathlib import Path
 from pathvalidate import sanitize_filepath
 
+from .tensor_cache import invalidate_bank
+from .bank_index import get_bank_index
+from .integrity import DEFAULT_VALIDATION_MODE, check_files
+
 
 BANK_CONF_FILE = "image_banks.json"
 DEFAULT_BANK_ENCODER = "pil"
 METADATA_FILENAME = "metadata.json"
 DEFAULT_CACHE_NAME = "default"
+DEFAULT_DECODE_WORKERS = min(8, os.cpu_count() or 1)
+DEFAULT_ENCODE_WORKERS = os.cpu_count() or 1
+DEFAULT_MEMORY_CACHE_BYTES = 0
+DEFAULT_MAX_BYTES = 0
+DEFAULT_TTL = 0
+DEFAULT_LOCK_TIMEOUT = 600
 
 _logger = logging.getLogger("comfy.custom.persistence")
 
 
-def _get_cache_conf(cache_name: str = DEFAULT_CACHE_NAME) -> Dict[str, str]:
+_conf_lock = threading.Lock()
+_conf_files: Dict[str, Tuple[Tuple[int, int], Dict[str, Any]]] = dict()
+
+
+def load_conf_file(conf_file_path: str) -> Dict[str, Any]:
+    """
+    Load the caches configuration file.
+
+    The parsed configuration is kept in memory and the file is only parsed
+    again when its mtime or size changes.
+
+    :param conf_file_path: path of the configuration file
+    :type conf_file_path: str
+    :return: configuration of all the caches
+    :rtype: Dict[str, Any]
+    """
+    st = os.stat(conf_file_path)
+    stamp = (st.st_mtime_ns, st.st_size)
+
+    with _conf_lock:
+        cached = _conf_files.get(conf_file_path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+
+        with open(conf_file_path, "r") as cf:
+            conf = json.load(cf)
+        _conf_files[conf_file_path] = (stamp, conf)
+        return conf
+
+
+def _get_conf_file_path() -> str:
     from folder_paths import user_directory, output_directory
 
     conf_file_path = os.path.join(user_directory, BANK_CONF_FILE)
@@ -31,8 +72,12 @@ def _get_cache_conf(cache_name: str = DEFAULT_CACHE_NAME) -> Dict[str, str]:
         with open(conf_file_path, "w") as cf:
             json.dump(default_conf, cf, indent=2)
 
-    with open(conf_file_path, "r") as cf:
-        conf = json.load(cf)
+    return conf_file_path
+
+
+def _get_cache_conf(cache_name: str = DEFAULT_CACHE_NAME) -> Dict[str, Any]:
+    conf_file_path = _get_conf_file_path()
+    conf = load_conf_file(conf_file_path)
 
     cache_conf = conf.get(cache_name)
     if cache_conf is None:
@@ -42,11 +87,23 @@ def _get_cache_conf(cache_name: str = DEFAULT_CACHE_NAME) -> Dict[str, str]:
     if cache_path is None:
         raise Exception(f"'cache_path' has not been set for Cache {cache_name} in {conf_file_path}!")
 
+    # the loaded configuration is shared, do not alter it
+    cache_conf = dict(cache_conf)
     cache_conf["encoder"] = cache_conf.get("encoder", DEFAULT_BANK_ENCODER)
 
     return cache_conf
 
 
+def get_cache_names() -> List[str]:
+    """
+    Get the names of all the configured caches.
+
+    :return: Cache names, in configuration order
+    :rtype: List[str]
+    """
+    return list(load_conf_file(_get_conf_file_path()).keys())
+
+
 def get_cache_path(cache_name: str = DEFAULT_CACHE_NAME) -> str:
     """
     Get cache path.
@@ -77,6 +134,167 @@ def get_cache_encoder(cache_name: str = DEFAULT_CACHE_NAME) -> str:
     return encoder
 
 
+def _get_cache_workers(cache_name: str, key: str, default: int) -> int:
+    workers = _get_cache_conf(cache_name=cache_name).get(key, default)
+    try:
+        return max(1, int(workers))
+    except (TypeError, ValueError):
+        raise Exception(f"Invalid '{key}' value in cache configuration '{cache_name}': {workers}")
+
+
+def get_cache_encoder_options(cache_name: str = DEFAULT_CACHE_NAME) -> Dict[str, Any]:
+    """
+    Get the encoder options of this cache.
+
+    :param cache_name: Name of this cache
+    :type cache_name: str
+    :return: Encoder options (``quality``...)
+    :rtype: Dict[str, Any]
+    """
+    options = _get_cache_conf(cache_name=cache_name).get("encoder_options", dict())
+    if not isinstance(options, dict):
+        raise Exception(f"'encoder_options' must be an object in cache configuration '{cache_name}'")
+    return dict(options)
+
+
+def get_cache_decode_workers(cache_name: str = DEFAULT_CACHE_NAME) -> int:
+    """
+    Get the number of threads used to decode the frames of a cached bank.
+
+    :param cache_name: Name of this cache
+    :type cache_name: str
+    :return: Number of decoding threads (at least 1)
+    :rtype: int
+    """
+    return _get_cache_workers(cache_name, "decode_workers", DEFAULT_DECODE_WORKERS)
+
+
+def get_cache_encode_workers(cache_name: str = DEFAULT_CACHE_NAME) -> int:
+    """
+    Get the number of threads used to encode the frames of a new bank.
+
+    :param cache_name: Name of this cache
+    :type cache_name: str
+    :return: Number of encoding threads (at least 1)
+    :rtype: int
+    """
+    return _get_cache_workers(cache_name, "encode_workers", DEFAULT_ENCODE_WORKERS)
+
+
+def get_cache_write_behind(cache_name: str = DEFAULT_CACHE_NAME) -> bool:
+    """
+    Check if new banks of this cache are written in the background.
+
+    :param cache_name: Name of this cache
+    :type cache_name: str
+    :return: Whether write-behind is enabled
+    :rtype: bool
+    """
+    return bool(_get_cache_conf(cache_name=cache_name).get("write_behind", False))
+
+
+def get_cache_dedup(cache_name: str = DEFAULT_CACHE_NAME) -> bool:
+    """
+    Check if the frames of new banks of this cache are stored in its content-addressed blob store.
+
+    :param cache_name: Name of this cache
+    :type cache_name: str
+    :return: Whether deduplication is enabled
+    :rtype: bool
+    """
+    return bool(_get_cache_conf(cache_name=cache_name).get("dedup", False))
+
+
+def get_cache_memory_bytes(cache_name: str = DEFAULT_CACHE_NAME) -> int:
+    """
+    Get the byte budget of the in-memory cache of loaded banks.
+
+    :param cache_name: Name of this cache
+    :type cache_name: str
+    :return: Byte budget, 0 when the in-memory cache is disabled
+    :rtype: int
+    """
+    max_bytes = _get_cache_conf(cache_name=cache_name).get("memory_cache_bytes", DEFAULT_MEMORY_CACHE_BYTES)
+    try:
+        return max(0, int(max_bytes))
+    except (TypeError, ValueError):
+        raise Exception(f"Invalid 'memory_cache_bytes' value in cache configuration '{cache_name}': {max_bytes}")
+
+
+def _get_cache_number(cache_name: str, key: str, default: float) -> float:
+    value = _get_cache_conf(cache_name=cache_name).get(key, default)
+    try:
+        return max(0, float(value))
+    except (TypeError, ValueError):
+        raise Exception(f"Invalid '{key}' value in cache configuration '{cache_name}': {value}")
+
+
+def get_cache_max_bytes(cache_name: str = DEFAULT_CACHE_NAME) -> int:
+    """
+    Get the disk budget of this cache, least recently used banks are evicted beyond it.
+
+    :param cache_name: Name of this cache
+    :type cache_name: str
+    :return: Byte budget, 0 when unlimited
+    :rtype: int
+    """
+    return int(_get_cache_number(cache_name, "max_bytes", DEFAULT_MAX_BYTES))
+
+
+def get_cache_ttl(cache_name: str = DEFAULT_CACHE_NAME) -> float:
+    """
+    Get the time to live of the banks of this cache, banks not accessed for longer are evicted.
+
+    :param cache_name: Name of this cache
+    :type cache_name: str
+    :return: Time to live in seconds, 0 when banks never expire
+    :rtype: float
+    """
+    return _get_cache_number(cache_name, "ttl", DEFAULT_TTL)
+
+
+def get_cache_lock_timeout(cache_name: str = DEFAULT_CACHE_NAME) -> float:
+    """
+    Get how long a worker waits for another worker generating the same bank.
+
+    :param cache_name: Name of this cache
+    :type cache_name: str
+    :return: Timeout in seconds, 0 to generate the bank without waiting
+    :rtype: float
+    """
+    return _get_cache_number(cache_name, "lock_timeout", DEFAULT_LOCK_TIMEOUT)
+
+
+def get_cache_remote(cache_name: str = DEFAULT_CACHE_NAME) -> Optional[Dict[str, Any]]:
+    """
+    Get the shared storage behind this cache, the local cache_path then acts as a read-through/write-through tier.
+
+    :param cache_name: Name of this cache
+    :type cache_name: str
+    :return: storage configuration (``type``, ``bucket``, ``prefix``, ``endpoint_url``, ``region`` or ``path``), None if the cache is local only
+    :rtype: Optional[Dict[str, Any]]
+    """
+    remote = _get_cache_conf(cache_name=cache_name).get("remote")
+    if remote is not None and not isinstance(remote, dict):
+        raise Exception(f"Invalid 'remote' value in cache configuration '{cache_name}': {remote}")
+    return remote or None
+
+
+def get_bank_mtime(bank_path: str) -> Optional[int]:
+    """
+    Get the modification time of the bank metadata.
+
+    :param bank_path: Bank path
+    :type bank_path: str
+    :return: metadata mtime in nanoseconds, None if the metadata is missing
+    :rtype: Optional[int]
+    """
+    try:
+        return os.stat(os.path.join(bank_path, METADATA_FILENAME)).st_mtime_ns
+    except OSError:
+        return None
+
+
 def read_bank_metadata(bank_path: str) -> Dict[str, Any]:
     """
     Get Bank metadata.
@@ -92,26 +310,74 @@ def read_bank_metadata(bank_path: str) -> Dict[str, Any]:
     return metadata
 
 
-def is_bank_valid(bank_path: str) -> bool:
+_validity_lock = threading.Lock()
+_validity_cache: Dict[Tuple[str, str], Tuple[int, bool]] = dict()
+
+
+def is_bank_valid(bank_path: str, mode: str = DEFAULT_VALIDATION_MODE) -> bool:
     """
     Check if a bank is valid.
 
+    Results are cached until the bank metadata changes, so repeated checks
+    of a bank only cost a ``stat`` of its metadata. ``checksum`` checks are
+    never served from the cache.
+
     :param bank_path: Bank path
     :type bank_path: str
+    :param mode: ``exists`` only checks the metadata is there, ``stat`` (default) also parses it and checks the
+        size of the recorded files, ``checksum`` also verifies their CRC32 (slow, meant for maintenance)
+    :type mode: str
     :return: Wether the Bank is valid
     :rtype: bool
     """
-    if os.path.isdir(bank_path):
-        try:
-            metadata = read_bank_metadata(bank_path=bank_path)
-            num_frames = metadata.get("bank_config", dict()).get("num_frames")  # type: ignore
-            if num_frames is None:
-                return False
-            # TODO: check all files are there
-            return True
-        except Exception as e:
-            _logger.debug(e)
-    return False
+    bank_mtime = get_bank_mtime(bank_path)
+    if bank_mtime is None:
+        return False
+    if mode == "exists":
+        # banks are committed atomically: the metadata is there once the bank is complete
+        return True
+
+    key = (os.path.abspath(bank_path), mode)
+    with _validity_lock:
+        cached = _validity_cache.get(key)
+    if cached is not None and cached[0] == bank_mtime and mode != "checksum":
+        return cached[1]
+
+    valid = False
+    try:
+        metadata = read_bank_metadata(bank_path=bank_path)
+        num_frames = metadata.get("bank_config", dict()).get("num_frames")  # type: ignore
+        valid = num_frames is not None and check_files(bank_path, metadata, mode)
+    except Exception as e:
+        _logger.debug(e)
+
+    with _validity_lock:
+        _validity_cache[key] = (bank_mtime, valid)
+    return valid
+
+
+def _invalidate_validity(bank_path: str):
+    abs_bank_path = os.path.abspath(bank_path)
+    with _validity_lock:
+        for key in [k for k in _validity_cache if k[0] == abs_bank_path]:
+            del _validity_cache[key]
+
+
+def verify_banks(cache_path: str, mode: str = "checksum") -> List[Dict[str, Any]]:
+    """
+    Verify all the banks of a cache.
+
+    :param cache_path: Path of the cache
+    :type cache_path: str
+    :param mode: validation mode, see ``is_bank_valid``
+    :type mode: str
+    :return: List of {bank_name, bank_id, metadata, size, atime} of the invalid banks
+    :rtype: List[Dict[str, Any]]
+    """
+    return [
+        bank for bank in get_banks(cache_path)
+        if not is_bank_valid(os.path.join(cache_path, bank["bank_name"], bank["bank_id"]), mode=mode)
+    ]
 
 
 def get_bank_fingerprint(bank_id) -> str:
@@ -147,42 +413,77 @@ def get_bank_path(cache_path: str, bank_name: str, bank_id):
     return sanitize_filepath(os.path.join(cache_path, bank_name, fingerprint), platform="auto", replacement_text="_")
 
 
-def get_banks(cache_path: str) -> List[str]:
+def get_banks(cache_path: str) -> List[Dict[str, Any]]:
     """
     Get all banks in a cache.
 
+    Banks are listed from the cache index rather than by walking the cache.
+
     :param cache_path: Path of the cache
     :type cache_path: str
-    :return: List of {bank_name}/{bank_id}
-    :rtype: List[str]
+    :return: List of {bank_name, bank_id, metadata, size, atime}
+    :rtype: List[Dict[str, Any]]
     """
-    output = []
-    abs_cache_path = os.path.abspath(cache_path)
-
-    for root, dirs, _ in os.walk(abs_cache_path):
+    return get_bank_index(cache_path).get_banks()
 
-        p_root = Path(root)
 
-        if p_root.parent == Path(abs_cache_path):
-            for bank_id in dirs:
-                bank_path = get_bank_path(abs_cache_path, p_root.name, bank_id)
-                if is_bank_valid(bank_path):
-                    output.append({
-                        "bank_id": bank_id,
-                        "bank_name": p_root.name,
-                        "metadata": read_bank_metadata(bank_path=bank_path)
-                    })
-    return output
-
-
-def write_bank_metadata(bank_path: str, data):
+def write_bank_metadata(bank_path: str, data, cache_path: Optional[str] = None):
     """
     Write the metadata file.
 
+    The file is written to a temporary file then renamed, so readers see
+    either the previous metadata or the new one, never a torn file.
+
     :param bank_path: bank full path
     :type bank_path: str
     :param data: bank data, should be Json serializable
+    :param cache_path: root path of the cache, the bank is added to its index when set
+    :type cache_path: Optional[str]
     """
     metadata_path = os.path.join(bank_path, METADATA_FILENAME)
-    with open(metadata_path, "w") as mo:
-        json.dump(data, fp=mo)
+    tmp_path = f"{metadata_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "w") as mo:
+            json.dump(data, fp=mo)
+            mo.flush()
+            os.fsync(mo.fileno())
+        os.replace(tmp_path, metadata_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    notify_bank_changed(bank_path=bank_path, data=data, cache_path=cache_path)
+
+
+def notify_bank_changed(bank_path: str, data, cache_path: Optional[str] = None):
+    """
+    Drop the state derived from a bank that has just been (re)written.
+
+    :param bank_path: bank full path
+    :type bank_path: str
+    :param data: new bank metadata
+    :param cache_path: root path of the cache, the bank is added to its index when set
+    :type cache_path: Optional[str]
+    """
+    # previously loaded images and validation results of this bank are stale now
+    invalidate_bank(bank_path)
+    _invalidate_validity(bank_path)
+
+    if cache_path is not None:
+        p_bank = Path(os.path.abspath(bank_path))
+        if p_bank.parent.parent == Path(os.path.abspath(cache_path)):
+            get_bank_index(cache_path).put(p_bank.parent.name, p_bank.name, data)
+
+
+def touch_bank(bank_path: str, cache_path: str):
+    """
+    Record an access to a bank in the index of its cache, for eviction.
+
+    :param bank_path: bank full path
+    :type bank_path: str
+    :param cache_path: root path of the cache
+    :type cache_path: str
+    """
+    p_bank = Path(os.path.abspath(bank_path))
+    if p_bank.parent.parent == Path(os.path.abspath(cache_path)):
+        get_bank_index(cache_path).touch(p_bank.parent.name, p_bank.name)
@@ -0,0 +1,333 @@
+"""Persistent index of the banks of a cache."""
+import os
+import json
+import time
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+from .bank_lock import file_lock
+
+BANK_INDEX_FILENAME = "bank_index.jsonl"
+# held shared by writers appending records, exclusive by the compaction
+_INDEX_LOCK_SUFFIX = ".lock"
+# compact the log when it holds this many records more than live entries
+_COMPACTION_SLACK = 256
+# minimum delay between two recorded accesses of a bank, in seconds
+TOUCH_INTERVAL = 60.0
+
+_logger = logging.getLogger("comfy.custom.persistence.bank_index")
+
+
+def get_dir_size(path: str) -> int:
+    """
+    Get the size of the files of a directory tree.
+
+    :param path: directory path
+    :type path: str
+    :return: size in bytes, 0 if the directory does not exist
+    :rtype: int
+    """
+    size = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            try:
+                size += os.path.getsize(os.path.join(root, f))
+            except OSError:
+                pass
+    return size
+
+
+class BankIndex:
+    """
+    Index of the valid banks of a cache.
+
+    The index is an append-only JSON log stored at the root of the cache.
+    Writers append ``put``/``del``/``touch`` records, readers replay the new
+    records only. Each bank entry tracks the size of the bank folder and its
+    last access time, used for eviction. Bank name directories whose mtime changed since they were last
+    scanned are rescanned, so banks created or deleted by other means are
+    picked up incrementally. Indexed banks whose ``metadata.json`` changed
+    or disappeared since they were recorded are updated or dropped.
+    """
+
+    def __init__(self, cache_path: str):
+        """
+        Create the index of a cache.
+
+        :param cache_path: root path of the cache
+        :type cache_path: str
+        """
+        self.cache_path = os.path.abspath(cache_path)
+        self.index_path = os.path.join(self.cache_path, BANK_INDEX_FILENAME)
+        self.lock_path = f"{self.index_path}{_INDEX_LOCK_SUFFIX}"
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._banks: Dict[str, Dict[str, Any]] = dict()
+        self._dirs: Dict[str, int] = dict()
+        self._offset = 0
+        self._inode: Optional[int] = None
+        self._records = 0
+
+    @staticmethod
+    def _key(bank_name: str, bank_id: str) -> str:
+        return f"{bank_name}/{bank_id}"
+
+    def _apply(self, record: Dict[str, Any]):
+        op = record.get("op")
+        if op == "put":
+            self._banks[self._key(record["bank_name"], record["bank_id"])] = {
+                "bank_id": record["bank_id"],
+                "bank_name": record["bank_name"],
+                "metadata": record.get("metadata"),
+                "size": record.get("size", 0),
+                "atime": record.get("atime", 0.0),
+                "mtime": record.get("mtime"),
+            }
+        elif op == "touch":
+            bank = self._banks.get(self._key(record["bank_name"], record["bank_id"]))
+            if bank is not None:
+                bank["atime"] = max(bank["atime"], record["atime"])
+        elif op == "del":
+            self._banks.pop(self._key(record["bank_name"], record["bank_id"]), None)
+        elif op == "dir":
+            if record.get("mtime") is None:
+                self._dirs.pop(record["bank_name"], None)
+            else:
+                self._dirs[record["bank_name"]] = record["mtime"]
+        self._records += 1
+
+    def _replay(self):
+        try:
+            st = os.stat(self.index_path)
+        except FileNotFoundError:
+            self._reset()
+            return
+
+        if st.st_ino != self._inode or st.st_size < self._offset:
+            # the log has been compacted by another process
+            self._reset()
+            self._inode = st.st_ino
+
+        if st.st_size == self._offset:
+            return
+
+        with open(self.index_path, "rb") as fi:
+            fi.seek(self._offset)
+            data = fi.read()
+
+        # ignore a trailing partial record, it will be read once complete
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            try:
+                self._apply(json.loads(line))
+            except (ValueError, KeyError) as e:
+                _logger.debug(f"Skipping invalid record in {self.index_path}: {e}")
+        self._offset += end
+
+    def _append(self, records: List[Dict[str, Any]]):
+        if not records:
+            return
+        os.makedirs(self.cache_path, exist_ok=True)
+        data = "".join(json.dumps(r) + "\n" for r in records)
+        # a single write in append mode keeps concurrent records whole, the lock keeps them out of a compaction
+        with file_lock(self.lock_path, exclusive=False):
+            with open(self.index_path, "a") as fo:
+                fo.write(data)
+        self._replay()
+
+    def _put_record(
+        self, bank_name: str, bank_id: str, metadata: Dict[str, Any], atime: Optional[float] = None
+    ) -> Dict[str, Any]:
+        from . import get_bank_mtime
+
+        bank_path = os.path.join(self.cache_path, bank_name, bank_id)
+        return {
+            "op": "put",
+            "bank_name": bank_name,
+            "bank_id": bank_id,
+            "metadata": metadata,
+            "size": get_dir_size(bank_path),
+            "atime": time.time() if atime is None else atime,
+            # metadata mtime the entry has been recorded from
+            "mtime": get_bank_mtime(bank_path),
+        }
+
+    def put(self, bank_name: str, bank_id: str, metadata: Dict[str, Any], atime: Optional[float] = None):
+        """
+        Record a valid bank.
+
+        :param bank_name: name of the bank
+        :type bank_name: str
+        :param bank_id: id (fingerprint) of the bank
+        :type bank_id: str
+        :param metadata: bank metadata
+        :type metadata: Dict[str, Any]
+        :param atime: last access time, defaults to now
+        :type atime: Optional[float]
+        """
+        with self._lock:
+            self._append([self._put_record(bank_name, bank_id, metadata, atime=atime)])
+
+    def touch(self, bank_name: str, bank_id: str, atime: Optional[float] = None):
+        """
+        Record an access to a bank.
+
+        Accesses closer than ``TOUCH_INTERVAL`` to the last recorded one are
+        dropped, so serving a bank does not grow the log every time.
+
+        :param bank_name: name of the bank
+        :type bank_name: str
+        :param bank_id: id (fingerprint) of the bank
+        :type bank_id: str
+        :param atime: access time, defaults to now
+        :type atime: Optional[float]
+        """
+        atime = time.time() if atime is None else atime
+        with self._lock:
+            self._replay()
+            bank = self._banks.get(self._key(bank_name, bank_id))
+            if bank is None:
+                return
+            # metadata rewritten in place do not change the bank name directory, read banks are checked here
+            records = self._revalidate(bank)
+            if records:
+                self._append(records)
+                bank = self._banks.get(self._key(bank_name, bank_id))
+                if bank is None:
+                    return
+            if atime - bank["atime"] < TOUCH_INTERVAL:
+                return
+            self._append([{"op": "touch", "bank_name": bank_name, "bank_id": bank_id, "atime": atime}])
+
+    def _revalidate(self, bank: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Get the records updating an entry whose metadata changed since it was recorded."""
+        from . import is_bank_valid, read_bank_metadata, get_bank_mtime
+
+        bank_path = os.path.join(self.cache_path, bank["bank_name"], bank["bank_id"])
+        bank_mtime = get_bank_mtime(bank_path)
+        if bank_mtime == bank.get("mtime"):
+            return []
+        if bank_mtime is None or not is_bank_valid(bank_path):
+            return [{"op": "del", "bank_name": bank["bank_name"], "bank_id": bank["bank_id"]}]
+        return [self._put_record(
+            bank["bank_name"], bank["bank_id"], read_bank_metadata(bank_path=bank_path), atime=bank["atime"]
+        )]
+
+    def remove(self, bank_name: str, bank_id: str):
+        """
+        Remove a bank from the index.
+
+        :param bank_name: name of the bank
+        :type bank_name: str
+        :param bank_id: id (fingerprint) of the bank
+        :type bank_id: str
+        """
+        with self._lock:
+            self._append([{"op": "del", "bank_name": bank_name, "bank_id": bank_id}])
+
+    def refresh(self):
+        """Replay new records and rescan the bank name directories that changed."""
+        from . import is_bank_valid, read_bank_metadata, get_bank_mtime
+
+        with self._lock:
+            self._replay()
+
+            records = []
+            try:
+                entries = [e for e in os.scandir(self.cache_path) if e.is_dir() and not e.name.startswith(".")]
+            except FileNotFoundError:
+                entries = []
+
+            current_names = set()
+            for entry in entries:
+                current_names.add(entry.name)
+                mtime = entry.stat().st_mtime_ns
+                if self._dirs.get(entry.name) == mtime:
+                    continue
+
+                bank_ids = set(
+                    e.name for e in os.scandir(entry.path) if e.is_dir() and not e.name.startswith(".")
+                )
+                for bank in self._banks.values():
+                    if bank["bank_name"] == entry.name and bank["bank_id"] not in bank_ids:
+                        records.append({"op": "del", "bank_name": entry.name, "bank_id": bank["bank_id"]})
+
+                for bank_id in bank_ids:
+                    bank = self._banks.get(self._key(entry.name, bank_id))
+                    if bank is not None:
+                        # replaced by a commit since it was recorded
+                        records.extend(self._revalidate(bank))
+                        continue
+                    bank_path = os.path.join(entry.path, bank_id)
+                    if is_bank_valid(bank_path):
+                        records.append(self._put_record(
+                            entry.name,
+                            bank_id,
+                            read_bank_metadata(bank_path=bank_path),
+                            # last access is unknown, use the bank creation
+                            atime=(get_bank_mtime(bank_path) or 0) / 1e9,
+                        ))
+                records.append({"op": "dir", "bank_name": entry.name, "mtime": mtime})
+
+            # bank name directories that have been removed
+            for bank_name in set(self._dirs) - current_names:
+                records.append({"op": "dir", "bank_name": bank_name, "mtime": None})
+            for bank in self._banks.values():
+                if bank["bank_name"] not in current_names:
+                    records.append({"op": "del", "bank_name": bank["bank_name"], "bank_id": bank["bank_id"]})
+
+            self._append(records)
+
+            if self._records > len(self._banks) + len(self._dirs) + _COMPACTION_SLACK:
+                self.compact()
+
+    def get_banks(self) -> List[Dict[str, Any]]:
+        """
+        Get all the valid banks of the cache.
+
+        :return: List of {bank_name, bank_id, metadata, size, atime}
+        :rtype: List[Dict[str, Any]]
+        """
+        with self._lock:
+            self.refresh()
+            return list(self._banks.values())
+
+    def compact(self):
+        """Rewrite the log with one record per live entry."""
+        with self._lock, file_lock(self.lock_path, exclusive=True):
+            # no record can be appended until the compacted log replaces the current one
+            self._replay()
+            records = [{"op": "dir", "bank_name": n, "mtime": m} for n, m in self._dirs.items()]
+            records += [{"op": "put", **bank} for bank in self._banks.values()]
+
+            tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as fo:
+                fo.write("".join(json.dumps(r) + "\n" for r in records))
+
+            os.replace(tmp_path, self.index_path)
+            self._reset()
+            self._replay()
+
+
+_bank_indexes: Dict[str, BankIndex] = dict()
+_bank_indexes_lock = threading.Lock()
+
+
+def get_bank_index(cache_path: str) -> BankIndex:
+    """
+    Get the process-wide index of a cache.
+
+    :param cache_path: root path of the cache
+    :type cache_path: str
+    :return: bank index
+    :rtype: BankIndex
+    """
+    abs_cache_path = os.path.abspath(cache_path)
+    with _bank_indexes_lock:
+        bank_index = _bank_indexes.get(abs_cache_path)
+        if bank_index is None:
+            bank_index = _bank_indexes[abs_cache_path] = BankIndex(abs_cache_path)
+        return bank_index
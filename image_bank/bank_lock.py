@@ -0,0 +1,270 @@
+"""Cross-process locks around the generation of banks."""
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None  # type: ignore
+    import msvcrt
+
+LOCK_SUFFIX = ".lock"
+_POLL_MIN = 0.05
+_POLL_MAX = 1.0
+
+_logger = logging.getLogger("comfy.custom.persistence.bank_lock")
+
+
+class BankLock:
+    """
+    Advisory lock on a bank, held while the bank is generated.
+
+    The lock is a ``{bank_path}.lock`` file next to the bank, locked with
+    ``flock`` (``msvcrt.locking`` on Windows). It is released by the system
+    when the holding process dies, so a crashed worker never blocks the
+    others for good. The holder removes the lock file before releasing it,
+    a worker that locked a file no longer at the lock path locks the new
+    one instead, so two workers never hold different files for the same
+    bank. Lock files are left in place on Windows.
+    """
+
+    def __init__(self, bank_path: str):
+        """
+        Create the lock of a bank.
+
+        :param bank_path: bank full path
+        :type bank_path: str
+        """
+        self.bank_path = bank_path
+        self.lock_path = f"{os.path.abspath(bank_path)}{LOCK_SUFFIX}"
+        self._fd: Optional[int] = None
+
+    @property
+    def held(self) -> bool:
+        """Whether this instance holds the lock."""
+        return self._fd is not None
+
+    def _try_lock(self, fd: int) -> bool:
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:  # pragma: no cover - Windows
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+
+    def _is_current(self, fd: int) -> bool:
+        """Check if the locked file is still the lock file of the bank."""
+        if fcntl is None:  # pragma: no cover - Windows
+            return True
+        try:
+            st = os.stat(self.lock_path)
+        except FileNotFoundError:
+            return False
+        fst = os.fstat(fd)
+        return (st.st_dev, st.st_ino) == (fst.st_dev, fst.st_ino)
+
+    def acquire(self, timeout: float = 0) -> bool:
+        """
+        Acquire the lock.
+
+        :param timeout: how long to wait for another holder to release the lock, in seconds
+        :type timeout: float
+        :return: Whether the lock has been acquired
+        :rtype: bool
+        """
+        if self.held:
+            return True
+
+        os.makedirs(os.path.dirname(self.lock_path), exist_ok=True)
+        deadline = time.monotonic() + max(0.0, timeout)
+        delay = _POLL_MIN
+        while True:
+            fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o666)
+            if self._try_lock(fd):
+                if self._is_current(fd):
+                    self._fd = fd
+                    return True
+                # removed by its previous holder, the lock file has to be created again
+                os.close(fd)
+                continue
+            os.close(fd)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, _POLL_MAX)
+
+    def release(self):
+        """Release the lock, if held."""
+        fd, self._fd = self._fd, None
+        if fd is None:
+            return
+        try:
+            if fcntl is not None:
+                # removed while still locked, waiting workers then lock a new file
+                try:
+                    os.remove(self.lock_path)
+                except FileNotFoundError:
+                    pass
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            else:  # pragma: no cover - Windows
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(fd)
+
+
+@contextmanager
+def file_lock(lock_path: str, exclusive: bool = True) -> Iterator[None]:
+    """
+    Hold a blocking advisory lock on a file.
+
+    Shared locks exclude exclusive ones only. Where ``fcntl`` is not
+    available, every lock is exclusive.
+
+    :param lock_path: path of the lock file, created if needed
+    :type lock_path: str
+    :param exclusive: take an exclusive lock rather than a shared one
+    :type exclusive: bool
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(lock_path)), exist_ok=True)
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o666)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        else:  # pragma: no cover - Windows
+            while True:
+                try:
+                    msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK gives up after 10 seconds
+                    continue
+        yield
+    finally:
+        # closing the file releases the lock
+        os.close(fd)
+
+
+# held lock and owner of each bank, by absolute path
+_held_locks: Dict[str, Tuple[BankLock, Optional[Any]]] = dict()
+_held_locks_lock = threading.Lock()
+
+
+def acquire_bank_lock(bank_path: str, timeout: float = 0, owner: Optional[Any] = None) -> bool:
+    """
+    Acquire the lock of a bank and keep it until ``release_bank_lock``.
+
+    :param bank_path: bank full path
+    :type bank_path: str
+    :param timeout: how long to wait for another worker to release the lock, in seconds
+    :type timeout: float
+    :param owner: prompt the lock is acquired for, see ``release_stale_bank_locks``
+    :type owner: Optional[Any]
+    :return: Whether the lock is held by this process
+    :rtype: bool
+    """
+    key = os.path.abspath(bank_path)
+    with _held_locks_lock:
+        if key in _held_locks:
+            if owner is not None:
+                _held_locks[key] = (_held_locks[key][0], owner)
+            return True
+
+    bank_lock = BankLock(bank_path)
+    if not bank_lock.acquire(timeout=timeout):
+        return False
+
+    with _held_locks_lock:
+        if key in _held_locks:
+            # acquired concurrently by another thread of this process
+            bank_lock.release()
+        else:
+            _held_locks[key] = (bank_lock, owner)
+    return True
+
+
+def is_bank_lock_held(bank_path: str) -> bool:
+    """
+    Check if this process holds the lock of a bank.
+
+    :param bank_path: bank full path
+    :type bank_path: str
+    :return: Whether the lock is held
+    :rtype: bool
+    """
+    with _held_locks_lock:
+        return os.path.abspath(bank_path) in _held_locks
+
+
+def disown_bank_lock(bank_path: str):
+    """
+    Detach the lock of a bank from its prompt, it is then only released by ``release_bank_lock``.
+
+    :param bank_path: bank full path
+    :type bank_path: str
+    """
+    key = os.path.abspath(bank_path)
+    with _held_locks_lock:
+        if key in _held_locks:
+            _held_locks[key] = (_held_locks[key][0], None)
+
+
+def release_bank_lock(bank_path: str):
+    """
+    Release the lock of a bank held by this process, if any.
+
+    :param bank_path: bank full path
+    :type bank_path: str
+    """
+    with _held_locks_lock:
+        held = _held_locks.pop(os.path.abspath(bank_path), None)
+    if held is not None:
+        held[0].release()
+        _logger.debug(f"{bank_path} lock released")
+
+
+def _release_owned_locks(is_released: Callable[[Any], bool]) -> int:
+    with _held_locks_lock:
+        keys = [key for key, (_, owner) in _held_locks.items() if owner is not None and is_released(owner)]
+        bank_locks = [_held_locks.pop(key)[0] for key in keys]
+    for bank_lock in bank_locks:
+        bank_lock.release()
+        _logger.warning(f"{bank_lock.bank_path} lock released, its prompt ended before the bank was written")
+    return len(bank_locks)
+
+
+def release_prompt_bank_locks() -> int:
+    """
+    Release the locks acquired for a prompt, once its execution is over.
+
+    Banks whose node did not run, because an upstream node failed or the
+    prompt was interrupted, release their lock here. Locks without owner
+    are kept.
+
+    :return: number of locks released
+    :rtype: int
+    """
+    return _release_owned_locks(lambda owner: True)
+
+
+def release_stale_bank_locks(owner: Any) -> int:
+    """
+    Release the locks acquired for a prompt other than ``owner``.
+
+    Fallback of ``release_prompt_bank_locks`` when the end of a prompt has
+    not been reported: prompts run one at a time in a process, so the locks
+    of previous prompts are stale once another one runs. Locks without
+    owner are kept.
+
+    :param owner: prompt being run
+    :type owner: Any
+    :return: number of locks released
+    :rtype: int
+    """
+    return _release_owned_locks(lambda held_owner: held_owner is not owner)
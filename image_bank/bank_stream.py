@@ -0,0 +1,224 @@
+"""Streaming access to image banks."""
+import os
+import shutil
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional
+
+import torch
+
+from . import read_bank_metadata, write_bank_metadata
+from .staging import commit_staged_bank, make_staging_path
+from .blob_store import FRAMES_KEY, can_dedup, get_blobs_path, load_bank_frame_range, record_bank_files, save_blobs
+
+DEFAULT_PREFETCH = 2
+
+_logger = logging.getLogger("comfy.custom.persistence.bank_stream")
+
+
+class BankReader:
+    """
+    Iterate over the frames of a bank by fixed-size chunks.
+
+    Up to ``prefetch`` chunks are decoded ahead in background threads, so
+    only ``(prefetch + 1) * chunk_size`` frames are held in memory. Frames
+    are yielded in their compact stored dtype, see ``to_float_images``.
+    """
+
+    def __init__(
+        self,
+        bank_path: str,
+        encoder,
+        num_frames: Optional[int] = None,
+        chunk_size: int = 1,
+        prefetch: int = DEFAULT_PREFETCH,
+    ):
+        """
+        Create the reader.
+
+        :param bank_path: bank full path
+        :type bank_path: str
+        :param encoder: ImageEncoder of the bank
+        :param num_frames: number of frames, read from the bank metadata when not set
+        :type num_frames: Optional[int]
+        :param chunk_size: number of frames per chunk
+        :type chunk_size: int
+        :param prefetch: number of chunks decoded ahead
+        :type prefetch: int
+        """
+        if chunk_size < 1:
+            raise ValueError(f"chunk_size must be positive, got {chunk_size}")
+        try:
+            metadata = read_bank_metadata(bank_path=bank_path)
+        except FileNotFoundError:
+            if num_frames is None:
+                raise
+            # frames owned by the bank, read straight from the encoder
+            metadata = dict()
+        if num_frames is None:
+            num_frames = metadata.get("bank_config", dict()).get("num_frames")
+            if num_frames is None:
+                raise Exception(f"Unable to get num_frames from bank {bank_path} metadata!")
+
+        self.bank_path = bank_path
+        self.metadata = metadata
+        self.encoder = encoder
+        self.num_frames = num_frames
+        self.chunk_size = chunk_size
+        self.prefetch = max(0, prefetch)
+
+    def __len__(self) -> int:
+        """Get the number of chunks."""
+        return (self.num_frames + self.chunk_size - 1) // self.chunk_size
+
+    def __iter__(self) -> Iterator[torch.Tensor]:
+        """Yield ``[K,H,W,C]`` chunks of frames, in order."""
+        starts = iter(range(0, self.num_frames, self.chunk_size))
+
+        def load(start: int) -> torch.Tensor:
+            return load_bank_frame_range(
+                self.encoder, self.bank_path, self.metadata, start, min(start + self.chunk_size, self.num_frames)
+            )
+
+        if self.prefetch == 0:
+            for start in starts:
+                yield load(start)
+            return
+
+        with ThreadPoolExecutor(max_workers=self.prefetch) as pool:
+            pending = deque(pool.submit(load, start) for _, start in zip(range(self.prefetch), starts))
+            while pending:
+                chunk = pending.popleft().result()
+                next_start = next(starts, None)
+                if next_start is not None:
+                    pending.append(pool.submit(load, next_start))
+                yield chunk
+
+    def frames(self) -> Iterator[torch.Tensor]:
+        """Yield ``[H,W,C]`` frames, in order."""
+        for chunk in self:
+            yield from chunk.unbind(dim=0)
+
+
+class BankWriter:
+    """
+    Write a bank frame by frame.
+
+    Frames are buffered until a batch can be encoded, then written to a
+    staging directory. ``close`` writes the metadata and renames the staging
+    directory into place, so the bank only becomes valid once every frame
+    has been written. Use it as a context manager: the bank is not committed
+    when an exception is raised.
+    """
+
+    def __init__(
+        self,
+        bank_path: str,
+        encoder,
+        bank_config: Optional[Dict[str, Any]] = None,
+        workers: int = 1,
+        options: Optional[Dict[str, Any]] = None,
+        cache_path: Optional[str] = None,
+        dedup: bool = False,
+    ):
+        """
+        Create the writer.
+
+        :param bank_path: bank full path
+        :type bank_path: str
+        :param encoder: ImageEncoder used to save the frames
+        :param bank_config: bank configuration stored in the metadata
+        :type bank_config: Optional[Dict[str, Any]]
+        :param workers: number of encoding threads
+        :type workers: int
+        :param options: encoder options
+        :type options: Optional[Dict[str, Any]]
+        :param cache_path: root path of the cache, the bank is added to its index when set
+        :type cache_path: Optional[str]
+        :param dedup: store the frames in the blob store of the cache, ignored by the encoders packing frames
+        :type dedup: bool
+        """
+        self.bank_path = bank_path
+        self.encoder = encoder
+        self.bank_config = dict(bank_config or dict())
+        self.workers = max(1, workers)
+        self.options = options
+        self.cache_path = cache_path
+        self.num_frames = 0
+        self.frame_keys: Optional[List[str]] = [] if can_dedup(encoder, dedup) else None
+        self._buffer: List[torch.Tensor] = []
+        self._batch_frames = encoder.write_batch_frames() * self.workers
+        self._closed = False
+        self._staging_path = make_staging_path(bank_path)
+
+    def write(self, images: torch.Tensor):
+        """
+        Add a frame ``[H,W,C]`` or a batch of frames ``[N,H,W,C]``.
+
+        :param images: frame(s) to add
+        :type images: torch.Tensor
+        """
+        if self._closed:
+            raise Exception(f"Bank {self.bank_path} writer is closed!")
+        if images.dim() == 3:
+            images = images.unsqueeze(0)
+        self._buffer.extend(images.unbind(dim=0))
+
+        while len(self._buffer) >= self._batch_frames:
+            batch, self._buffer = self._buffer[:self._batch_frames], self._buffer[self._batch_frames:]
+            self._flush(batch)
+
+    def _flush(self, batch: List[torch.Tensor]):
+        if not batch:
+            return
+        if self.frame_keys is not None:
+            self.frame_keys.extend(
+                save_blobs(self.encoder, batch, get_blobs_path(self._staging_path), workers=self.workers, options=self.options)
+            )
+        else:
+            self.encoder.append_frames(
+                batch, self._staging_path, self.num_frames, workers=self.workers, options=self.options
+            )
+        self.num_frames += len(batch)
+
+    def close(self):
+        """Write the remaining frames and commit the bank."""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._flush(self._buffer)
+            self._buffer = []
+
+            if self.num_frames == 0:
+                raise Exception(f"No frame written to bank {self.bank_path}!")
+
+            self.bank_config["num_frames"] = self.num_frames
+            metadata: Dict[str, Any] = {"encoder": self.encoder.get_name(), "bank_config": self.bank_config}
+            if self.frame_keys is not None:
+                metadata[FRAMES_KEY] = self.frame_keys
+            else:
+                self.encoder.finish_frames(self._staging_path, self.num_frames)
+            record_bank_files(self.encoder, self._staging_path, metadata)
+            write_bank_metadata(bank_path=self._staging_path, data=metadata)
+            commit_staged_bank(self._staging_path, self.bank_path, cache_path=self.cache_path)
+        finally:
+            self._discard()
+
+    def _discard(self):
+        if os.path.isdir(self._staging_path):
+            shutil.rmtree(self._staging_path, ignore_errors=True)
+
+    def __enter__(self) -> "BankWriter":
+        """Enter the context."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Commit the bank unless an exception has been raised."""
+        if exc_type is None:
+            self.close()
+        else:
+            self._closed = True
+            self._discard()
+            _logger.warning(f"Bank {self.bank_path} not committed: {exc_value}")
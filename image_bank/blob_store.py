@@ -0,0 +1,304 @@
+"""Content-addressed storage of frames shared by the banks of a cache."""
+import os
+import json
+import uuid
+import hashlib
+import logging
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import torch
+
+from . import METADATA_FILENAME
+from .integrity import FILES_KEY, describe_files, list_bank_files
+from .staging import fsync_path
+
+BLOBS_DIRNAME = ".blobs"
+# metadata key listing the blobs of a deduplicated bank
+FRAMES_KEY = "frames"
+
+_logger = logging.getLogger("comfy.custom.persistence.blob_store")
+_warned_encoders = set()
+
+
+def get_blobs_path(bank_path: str) -> str:
+    """
+    Get the blob store shared by the banks of a cache.
+
+    Banks are stored as ``{cache_path}/{bank_name}/{bank_id}``, blobs as
+    ``{cache_path}/.blobs``.
+
+    :param bank_path: bank full path
+    :type bank_path: str
+    :return: blob store path
+    :rtype: str
+    """
+    return str(Path(os.path.abspath(bank_path)).parent.parent / BLOBS_DIRNAME)
+
+
+def get_blob_path(blobs_path: str, key: str) -> str:
+    """
+    Get the path of a blob, without extension.
+
+    :param blobs_path: blob store path
+    :type blobs_path: str
+    :param key: blob key
+    :type key: str
+    :return: blob path without extension
+    :rtype: str
+    """
+    return os.path.join(blobs_path, key[:2], key)
+
+
+def hash_frame(image: torch.Tensor, salt: bytes = b"") -> str:
+    """
+    Hash the bytes of a frame.
+
+    :param image: frame
+    :type image: torch.Tensor
+    :param salt: extra bytes hashed with the frame, frames encoded with different settings must not share a blob
+    :type salt: bytes
+    :return: hex digest
+    :rtype: str
+    """
+    image = image.detach().cpu().contiguous()
+    digest = hashlib.blake2b(salt, digest_size=20)
+    digest.update(f"{image.dtype}{tuple(image.shape)}".encode("utf-8"))
+    digest.update(image.view(torch.uint8).numpy().data)
+    return digest.hexdigest()
+
+
+def get_blob_salt(encoder, options: Optional[Dict[str, Any]] = None) -> bytes:
+    """
+    Get the salt of the blob keys: blobs are only shared between frames encoded the same way.
+
+    :param encoder: ImageEncoder of the blobs
+    :param options: encoder options
+    :type options: Optional[Dict[str, Any]]
+    :return: salt
+    :rtype: bytes
+    """
+    return json.dumps([encoder.get_name(), options or dict()], sort_keys=True).encode("utf-8")
+
+
+def save_blobs(
+    encoder,
+    images: Sequence[torch.Tensor],
+    blobs_path: str,
+    workers: int = 1,
+    options: Optional[Dict[str, Any]] = None,
+) -> List[str]:
+    """
+    Save frames to the blob store, only the frames it does not hold yet are encoded.
+
+    Blobs are written under a temporary name, flushed, then renamed, so a
+    blob is either complete or missing.
+
+    :param encoder: ImageEncoder used to save the frames
+    :param images: ``[N,H,W,C]`` batch or sequence of frames
+    :type images: Sequence[torch.Tensor]
+    :param blobs_path: blob store path
+    :type blobs_path: str
+    :param workers: number of encoding threads
+    :type workers: int
+    :param options: encoder options
+    :type options: Optional[Dict[str, Any]]
+    :return: blob keys of the frames, in order
+    :rtype: List[str]
+    """
+    salt = get_blob_salt(encoder, options)
+    keys = [hash_frame(image, salt) for image in images]
+
+    extension = encoder.file_extension()
+    missing: Dict[str, int] = dict()
+    for idx, key in enumerate(keys):
+        if key in missing:
+            continue
+        try:
+            # a reused blob is refreshed so that garbage collection spares it
+            os.utime(f"{get_blob_path(blobs_path, key)}{extension}")
+        except FileNotFoundError:
+            missing[key] = idx
+
+    if missing:
+        token = uuid.uuid4().hex
+        tmp_paths = []
+        for key in missing:
+            blob_dir = os.path.dirname(get_blob_path(blobs_path, key))
+            os.makedirs(blob_dir, exist_ok=True)
+            tmp_paths.append(os.path.join(blob_dir, f".{key}.{token}"))
+
+        try:
+            encoder.save_images([images[idx] for idx in missing.values()], tmp_paths, workers=workers, options=options)
+            for key, tmp_path in zip(missing, tmp_paths):
+                fsync_path(f"{tmp_path}{extension}")
+                os.replace(f"{tmp_path}{extension}", f"{get_blob_path(blobs_path, key)}{extension}")
+        finally:
+            for tmp_path in tmp_paths:
+                if os.path.exists(f"{tmp_path}{extension}"):
+                    os.remove(f"{tmp_path}{extension}")
+
+    _logger.debug(f"{len(missing)} new blob(s) for {len(keys)} frame(s) in {blobs_path}")
+    return keys
+
+
+def load_blobs(encoder, keys: Sequence[str], blobs_path: str, workers: int = 1) -> torch.Tensor:
+    """
+    Load frames from the blob store, in their stored dtype.
+
+    :param encoder: ImageEncoder of the blobs
+    :param keys: blob keys
+    :type keys: Sequence[str]
+    :param blobs_path: blob store path
+    :type blobs_path: str
+    :param workers: number of decoding threads
+    :type workers: int
+    :return: Batch of images
+    :rtype: torch.Tensor
+    """
+    return encoder.load_images([get_blob_path(blobs_path, key) for key in keys], workers=workers)
+
+
+def can_dedup(encoder, dedup: bool = True) -> bool:
+    """
+    Check if the frames of a bank can be stored in the blob store.
+
+    Blobs hold a single frame each, which would defeat the container of the
+    encoders packing the frames of a bank: their banks are never deduplicated.
+
+    :param encoder: ImageEncoder of the bank
+    :param dedup: whether deduplication is enabled
+    :type dedup: bool
+    :return: Whether the frames go to the blob store
+    :rtype: bool
+    """
+    if not dedup:
+        return False
+    if encoder.packs_frames():
+        if encoder.get_name() not in _warned_encoders:
+            _warned_encoders.add(encoder.get_name())
+            _logger.warning(f"Encoder {encoder.get_name()} packs the frames of a bank, its banks are not deduplicated")
+        return False
+    return True
+
+
+def save_bank_frames(
+    encoder,
+    images: Sequence[torch.Tensor],
+    bank_path: str,
+    metadata: Dict[str, Any],
+    workers: int = 1,
+    options: Optional[Dict[str, Any]] = None,
+    dedup: bool = False,
+):
+    """
+    Save the frames of a bank, either in the bank itself or in the blob store of its cache.
+
+    :param encoder: ImageEncoder used to save the frames
+    :param images: ``[N,H,W,C]`` batch or sequence of frames
+    :type images: Sequence[torch.Tensor]
+    :param bank_path: bank full path
+    :type bank_path: str
+    :param metadata: bank metadata, the blob keys (when deduplicated) and the file records are added to it
+    :type metadata: Dict[str, Any]
+    :param workers: number of encoding threads
+    :type workers: int
+    :param options: encoder options
+    :type options: Optional[Dict[str, Any]]
+    :param dedup: store the frames in the blob store, ignored by the encoders packing frames
+    :type dedup: bool
+    """
+    if can_dedup(encoder, dedup):
+        metadata[FRAMES_KEY] = save_blobs(encoder, images, get_blobs_path(bank_path), workers=workers, options=options)
+    else:
+        encoder.save_frames(images, bank_path, workers=workers, options=options)
+    record_bank_files(encoder, bank_path, metadata)
+
+
+def record_bank_files(encoder, bank_path: str, metadata: Dict[str, Any]):
+    """
+    Record the size and checksum of the files of a bank in its metadata.
+
+    :param encoder: ImageEncoder of the bank
+    :param bank_path: bank full path
+    :type bank_path: str
+    :param metadata: bank metadata, updated
+    :type metadata: Dict[str, Any]
+    """
+    keys = metadata.get(FRAMES_KEY)
+    if keys is None:
+        file_paths = list_bank_files(bank_path, exclude=[METADATA_FILENAME])
+    else:
+        blobs_path = get_blobs_path(bank_path)
+        file_paths = [f"{get_blob_path(blobs_path, key)}{encoder.file_extension()}" for key in sorted(set(keys))]
+    metadata[FILES_KEY] = describe_files(bank_path, file_paths)
+
+
+def load_bank_frames(
+    encoder, bank_path: str, metadata: Dict[str, Any], num_frames: int, workers: int = 1
+) -> torch.Tensor:
+    """
+    Load all the frames of a bank, in their stored dtype.
+
+    :param encoder: ImageEncoder of the bank
+    :param bank_path: bank full path
+    :type bank_path: str
+    :param metadata: bank metadata
+    :type metadata: Dict[str, Any]
+    :param num_frames: number of frames in the bank
+    :type num_frames: int
+    :param workers: number of decoding threads
+    :type workers: int
+    :return: Batch of images
+    :rtype: torch.Tensor
+    """
+    keys = metadata.get(FRAMES_KEY)
+    if keys is None:
+        return encoder.load_frames(bank_path, num_frames, workers=workers)
+    if len(keys) != num_frames:
+        raise Exception(f"Bank {bank_path} references {len(keys)} frames, expected {num_frames}!")
+    return load_blobs(encoder, keys, get_blobs_path(bank_path), workers=workers)
+
+
+def load_bank_frame_range(encoder, bank_path: str, metadata: Dict[str, Any], start: int, stop: int) -> torch.Tensor:
+    """
+    Load the frames ``[start, stop)`` of a bank, in their stored dtype.
+
+    :param encoder: ImageEncoder of the bank
+    :param bank_path: bank full path
+    :type bank_path: str
+    :param metadata: bank metadata
+    :type metadata: Dict[str, Any]
+    :param start: index of the first frame
+    :type start: int
+    :param stop: index after the last frame
+    :type stop: int
+    :return: Batch of images
+    :rtype: torch.Tensor
+    """
+    keys = metadata.get(FRAMES_KEY)
+    if keys is None:
+        return encoder.load_frame_range(bank_path, start, stop)
+    if not 0 <= start < stop <= len(keys):
+        raise IndexError(f"Frames [{start}, {stop}) out of range for {bank_path} ({len(keys)} frames)")
+    return load_blobs(encoder, keys[start:stop], get_blobs_path(bank_path))
+
+
+def load_bank_frame(encoder, bank_path: str, metadata: Dict[str, Any], index: int) -> torch.Tensor:
+    """
+    Load a single frame of a bank, in its stored dtype.
+
+    :param encoder: ImageEncoder of the bank
+    :param bank_path: bank full path
+    :type bank_path: str
+    :param metadata: bank metadata
+    :type metadata: Dict[str, Any]
+    :param index: index of the frame
+    :type index: int
+    :return: Image as a Tensor
+    :rtype: torch.Tensor
+    """
+    keys = metadata.get(FRAMES_KEY)
+    if keys is None:
+        return encoder.load_frame(bank_path, index)
+    return encoder.load_stored_image(get_blob_path(get_blobs_path(bank_path), keys[index]))
@@ -0,0 +1,307 @@
+"""Eviction of the banks of a cache on disk."""
+import os
+import time
+import shutil
+import logging
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from . import METADATA_FILENAME
+from .bank_index import get_bank_index
+from .bank_lock import BankLock
+from .blob_store import BLOBS_DIRNAME, FRAMES_KEY
+from .tensor_cache import invalidate_bank
+from .staging import STAGING_PREFIX, TRASH_PREFIX
+
+DEFAULT_EVICTION_INTERVAL = 60.0
+# unreferenced blobs and staging directories younger than this may belong to a bank being written
+DEFAULT_BLOB_GRACE = 3600.0
+
+_logger = logging.getLogger("comfy.custom.persistence.eviction")
+
+
+class CacheEvictor:
+    """
+    Keep a cache within its size budget and time to live.
+
+    Banks are evicted by least recent access, as tracked by the bank
+    index. ``metadata.json`` is removed first so the bank is reported as
+    missing right away, then the bank folder is deleted. Blobs no longer
+    referenced by any bank, and staging directories left by interrupted
+    writes, are garbage collected once older than ``blob_grace``. Without
+    any limit, the background thread only collects staging directories.
+    """
+
+    def __init__(
+        self,
+        cache_path: str,
+        max_bytes: int = 0,
+        ttl: float = 0,
+        interval: float = DEFAULT_EVICTION_INTERVAL,
+        blob_grace: float = DEFAULT_BLOB_GRACE,
+    ):
+        """
+        Create the evictor of a cache.
+
+        :param cache_path: root path of the cache
+        :type cache_path: str
+        :param max_bytes: disk budget of the cache, 0 when unlimited
+        :type max_bytes: int
+        :param ttl: time to live of the banks since their last access in seconds, 0 when banks never expire
+        :type ttl: float
+        :param interval: delay between two eviction runs of the background thread, in seconds
+        :type interval: float
+        :param blob_grace: minimum age of an unreferenced blob before it is removed, in seconds
+        :type blob_grace: float
+        """
+        self.cache_path = os.path.abspath(cache_path)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.interval = interval
+        self.blob_grace = blob_grace
+        self.on_run: Optional[Callable[[Dict[str, Any]], None]] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats: Dict[str, Any] = {
+            "bytes_used": 0,
+            "banks": 0,
+            "banks_evicted": 0,
+            "bytes_evicted": 0,
+            "blobs_removed": 0,
+            "last_run": None,
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get the cache statistics, as of the last run.
+
+        :return: bytes_used, banks, banks_evicted, bytes_evicted, blobs_removed and last_run
+        :rtype: Dict[str, Any]
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def evict_bank(self, bank_name: str, bank_id: str) -> bool:
+        """
+        Delete a bank.
+
+        Banks locked by a worker, which is writing them or waiting for
+        their images, are skipped.
+
+        :param bank_name: name of the bank
+        :type bank_name: str
+        :param bank_id: id (fingerprint) of the bank
+        :type bank_id: str
+        :return: Whether the bank has been invalidated
+        :rtype: bool
+        """
+        bank_path = os.path.join(self.cache_path, bank_name, bank_id)
+        # a lock of its own, so that locks held by this process are not taken over
+        bank_lock = BankLock(bank_path)
+        if not bank_lock.acquire(timeout=0):
+            _logger.debug(f"{bank_path} is locked, not evicted")
+            return False
+
+        try:
+            try:
+                # the bank is invalid from now on
+                os.remove(os.path.join(bank_path, METADATA_FILENAME))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                _logger.warning(f"Unable to evict {bank_path}: {e}")
+                return False
+
+            invalidate_bank(bank_path)
+            get_bank_index(self.cache_path).remove(bank_name, bank_id)
+            shutil.rmtree(bank_path, ignore_errors=True)
+        finally:
+            bank_lock.release()
+        _logger.info(f"{bank_path} evicted")
+        return True
+
+    def _scan_blobs(self) -> Dict[str, Tuple[List[str], int, float]]:
+        """Get the files, total size and latest mtime of each blob key."""
+        blobs: Dict[str, Tuple[List[str], int, float]] = dict()
+        for root, _, files in os.walk(os.path.join(self.cache_path, BLOBS_DIRNAME)):
+            for f in files:
+                file_path = os.path.join(root, f)
+                try:
+                    st = os.stat(file_path)
+                except OSError:
+                    continue
+                # temporary files are ".{key}.{token}{ext}"
+                key = f.lstrip(".").split(".", 1)[0]
+                paths, size, mtime = blobs.get(key, ([], 0, 0.0))
+                blobs[key] = (paths + [file_path], size + st.st_size, max(mtime, st.st_mtime))
+        return blobs
+
+    def _remove_stale_staging(self, now: float):
+        """Remove the staging directories of writes that never completed."""
+        try:
+            bank_names = [e for e in os.scandir(self.cache_path) if e.is_dir() and not e.name.startswith(".")]
+        except FileNotFoundError:
+            return
+        for bank_name in bank_names:
+            for entry in os.scandir(bank_name.path):
+                if not entry.name.startswith((STAGING_PREFIX, TRASH_PREFIX)):
+                    continue
+                try:
+                    stale = entry.stat().st_mtime < now - self.blob_grace
+                except OSError:
+                    continue
+                if stale:
+                    _logger.info(f"Removing stale {entry.path}")
+                    shutil.rmtree(entry.path, ignore_errors=True)
+
+    def run_once(self, now: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Evict expired banks, then least recently used banks beyond the budget, then unreferenced blobs.
+
+        :param now: current time, defaults to now
+        :type now: Optional[float]
+        :return: the cache statistics
+        :rtype: Dict[str, Any]
+        """
+        now = time.time() if now is None else now
+        banks = sorted(get_bank_index(self.cache_path).get_banks(), key=lambda b: b["atime"])
+
+        blobs = self._scan_blobs()
+        refs: Counter = Counter()
+        for bank in banks:
+            refs.update(set((bank["metadata"] or dict()).get(FRAMES_KEY) or []))
+
+        def is_collectable(key: str) -> bool:
+            return refs[key] <= 0 and key in blobs and blobs[key][2] < now - self.blob_grace
+
+        bytes_used = sum(b["size"] for b in banks) + sum(size for _, size, _ in blobs.values())
+        bytes_used -= sum(blobs[key][1] for key in blobs if is_collectable(key))
+
+        evicted = 0
+        bytes_evicted = 0
+        kept = []
+        for bank in banks:
+            expired = self.ttl > 0 and bank["atime"] < now - self.ttl
+            over_budget = self.max_bytes > 0 and bytes_used > self.max_bytes
+            if not (expired or over_budget) or not self.evict_bank(bank["bank_name"], bank["bank_id"]):
+                kept.append(bank)
+                continue
+
+            freed = bank["size"]
+            for key in set((bank["metadata"] or dict()).get(FRAMES_KEY) or []):
+                refs[key] -= 1
+                if is_collectable(key):
+                    freed += blobs[key][1]
+            bytes_used -= freed
+            bytes_evicted += freed
+            evicted += 1
+
+        self._remove_stale_staging(now)
+
+        blobs_removed = 0
+        for key in [k for k in blobs if is_collectable(k)]:
+            for file_path in blobs[key][0]:
+                try:
+                    os.remove(file_path)
+                except OSError as e:
+                    _logger.debug(f"Unable to remove blob {file_path}: {e}")
+            blobs_removed += 1
+
+        with self._lock:
+            self._stats["bytes_used"] = max(0, bytes_used)
+            self._stats["banks"] = len(kept)
+            self._stats["banks_evicted"] += evicted
+            self._stats["bytes_evicted"] += bytes_evicted
+            self._stats["blobs_removed"] += blobs_removed
+            self._stats["last_run"] = now
+            stats = dict(self._stats)
+
+        if evicted or blobs_removed:
+            _logger.info(
+                f"{self.cache_path}: {evicted} bank(s) and {blobs_removed} blob(s) evicted, "
+                f"{stats['bytes_used']} bytes used"
+            )
+        if self.on_run is not None:
+            self.on_run(stats)
+        return stats
+
+    def start(self):
+        """Start the background eviction thread, if not running yet."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="persistence-evictor", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the background eviction thread."""
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self.max_bytes > 0 or self.ttl > 0:
+                    self.run_once()
+                else:
+                    self._remove_stale_staging(time.time())
+            except Exception as e:
+                _logger.exception(f"Eviction of {self.cache_path} failed: {e}")
+            self._stop.wait(self.interval)
+
+
+_evictors: Dict[str, CacheEvictor] = dict()
+_evictors_lock = threading.Lock()
+
+
+def get_cache_evictor(cache_path: str) -> CacheEvictor:
+    """
+    Get the process-wide evictor of a cache.
+
+    :param cache_path: root path of the cache
+    :type cache_path: str
+    :return: cache evictor
+    :rtype: CacheEvictor
+    """
+    abs_cache_path = os.path.abspath(cache_path)
+    with _evictors_lock:
+        evictor = _evictors.get(abs_cache_path)
+        if evictor is None:
+            evictor = _evictors[abs_cache_path] = CacheEvictor(abs_cache_path)
+        return evictor
+
+
+def ensure_cache_evictor(
+    cache_path: str,
+    max_bytes: int,
+    ttl: float,
+    on_run: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> CacheEvictor:
+    """
+    Apply the eviction settings of a cache and start its evictor.
+
+    The evictor runs even without any limit, to collect the staging
+    directories left by interrupted writes.
+
+    :param cache_path: root path of the cache
+    :type cache_path: str
+    :param max_bytes: disk budget of the cache, 0 when unlimited
+    :type max_bytes: int
+    :param ttl: time to live of the banks in seconds, 0 when banks never expire
+    :type ttl: float
+    :param on_run: called with the cache statistics after each run
+    :type on_run: Optional[Callable[[Dict[str, Any]], None]]
+    :return: the running evictor
+    :rtype: CacheEvictor
+    """
+    evictor = get_cache_evictor(cache_path)
+    evictor.max_bytes = max_bytes
+    evictor.ttl = ttl
+    evictor.on_run = on_run
+    evictor.start()
+    return evictor
@@ -0,0 +1,146 @@
+"""Workflow graph utils."""
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import DEFAULT_CACHE_NAME
+
+BANK_NODE_TYPE = "PersistImageBank"
+STEPPED_BANK_NODE_TYPE = "PersistSteppedImageBank"
+# stepped banks reuse the bank_name of the previous step
+STEP_BANK_NAME_PLACEHOLDER = "<COPY-PREVIOUS-STEP>"
+# index of the series output of stepped banks
+_SERIES_OUTPUT = 3
+
+
+def is_output_used(prompt: Optional[Dict[str, Any]], unique_id: Optional[Any], output_index: int) -> bool:
+    """
+    Check if an output of a node is linked to another node of the prompt.
+
+    When the node cannot be found in the prompt (e.g. it has been created by
+    a node expansion), the output is considered used.
+
+    :param prompt: prompt being executed (hidden ``PROMPT`` input)
+    :type prompt: Optional[Dict[str, Any]]
+    :param unique_id: id of the node (hidden ``UNIQUE_ID`` input)
+    :type unique_id: Optional[Any]
+    :param output_index: index of the output
+    :type output_index: int
+    :return: Whether the output is used
+    :rtype: bool
+    """
+    if not prompt or unique_id is None or str(unique_id) not in prompt:
+        return True
+
+    node_id = str(unique_id)
+    for node in prompt.values():
+        for value in node.get("inputs", dict()).values():
+            if _is_link(value) and str(value[0]) == node_id and value[1] == output_index:
+                return True
+    return False
+
+
+def _is_link(value: Any) -> bool:
+    # links are encoded as [node_id, output_index]
+    return isinstance(value, list) and len(value) == 2 and isinstance(value[1], int)
+
+
+def get_step_bank_settings(
+    bank_name: Optional[str], bank_id: Optional[Any], previous_series: Optional[List[Dict]]
+) -> Tuple[str, Any]:
+    """
+    Resolve the bank of a stepped bank node.
+
+    :param bank_name: bank_name input, the placeholder reuses the name of the previous step
+    :type bank_name: Optional[str]
+    :param bank_id: bank_id input, defaults to ``step{n}``
+    :type bank_id: Optional[Any]
+    :param previous_series: steps of the previous series if any
+    :type previous_series: Optional[List[Dict]]
+    :return: bank_name and bank_id
+    :rtype: Tuple[str, Any]
+    """
+    if (not bank_name or bank_name == STEP_BANK_NAME_PLACEHOLDER) and previous_series:
+        bank_name = previous_series[-1].get("bank_name")
+
+    if not bank_name:
+        raise Exception("bank_name must be provided!")
+
+    if bank_id:
+        return bank_name, bank_id
+    if previous_series:
+        return bank_name, f"step{len(previous_series) + 1}"
+    return bank_name, "step1"
+
+
+def predict_banks(prompt: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Predict the banks a prompt will read or write, before it is executed.
+
+    Only banks whose inputs are constants can be predicted. Stepped banks
+    are followed through their ``previous_series`` links, so every step of
+    a chain is predicted.
+
+    :param prompt: prompt to execute
+    :type prompt: Optional[Dict[str, Any]]
+    :return: {node_id, cache_name, bank_name, bank_id} of each predictable bank
+    :rtype: List[Dict[str, Any]]
+    """
+    prompt = prompt or dict()
+    # node id -> steps of its series output, None when unpredictable
+    series: Dict[str, Optional[List[Dict[str, Any]]]] = dict()
+
+    def resolve_series(node_id: str) -> Optional[List[Dict[str, Any]]]:
+        if node_id in series:
+            return series[node_id]
+        # guards against cycles
+        series[node_id] = None
+
+        node = prompt.get(node_id) or dict()
+        inputs = node.get("inputs", dict())
+        if node.get("class_type") != STEPPED_BANK_NODE_TYPE or _is_link(inputs.get("bank_name")):
+            return None
+        if _is_link(inputs.get("bank_id")) or _is_link(inputs.get("cache_name")):
+            return None
+
+        previous_series = None
+        previous_link = inputs.get("previous_series")
+        if previous_link is not None:
+            if not _is_link(previous_link) or previous_link[1] != _SERIES_OUTPUT:
+                return None
+            previous_series = resolve_series(str(previous_link[0]))
+            if previous_series is None:
+                return None
+
+        try:
+            bank_name, bank_id = get_step_bank_settings(inputs.get("bank_name"), inputs.get("bank_id"), previous_series)
+        except Exception:
+            return None
+
+        step = {
+            "node_id": node_id,
+            "cache_name": inputs.get("cache_name") or DEFAULT_CACHE_NAME,
+            "bank_name": bank_name,
+            "bank_id": bank_id,
+        }
+        series[node_id] = (previous_series or []) + [step]
+        return series[node_id]
+
+    banks = []
+    for node_id, node in prompt.items():
+        node_id = str(node_id)
+        inputs = node.get("inputs", dict())
+        if node.get("class_type") == BANK_NODE_TYPE:
+            if any(_is_link(inputs.get(key)) for key in ("cache_name", "bank_name", "bank_id")):
+                continue
+            if not inputs.get("bank_name") or inputs.get("bank_id") is None:
+                continue
+            banks.append({
+                "node_id": node_id,
+                "cache_name": inputs.get("cache_name") or DEFAULT_CACHE_NAME,
+                "bank_name": inputs["bank_name"],
+                "bank_id": inputs["bank_id"],
+            })
+        elif node.get("class_type") == STEPPED_BANK_NODE_TYPE:
+            steps = resolve_series(node_id)
+            if steps is not None:
+                banks.append(steps[-1])
+    return banks
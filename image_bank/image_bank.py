@@ -1,17 +1,31 @@
 """Image Bank implementation."""
-import os
 import logging
 import torch
-from typing import Any, Dict
+from typing import Any, Dict, Optional, Tuple
 from server import PromptServer
 from comfy_execution.graph_utils import GraphBuilder
 
 from . import DEFAULT_BANK_ENCODER, DEFAULT_CACHE_NAME
 from . import get_bank_path, is_bank_valid, get_cache_path, read_bank_metadata, get_bank_fingerprint, write_bank_metadata
+from . import get_cache_decode_workers, get_cache_encode_workers, get_cache_write_behind
+from . import get_cache_memory_bytes, get_bank_mtime, get_cache_names, get_cache_encoder, get_cache_encoder_options
+from . import get_cache_dedup, get_cache_max_bytes, get_cache_ttl, get_cache_lock_timeout, get_cache_remote, touch_bank
+from .bank_lock import acquire_bank_lock, disown_bank_lock, release_bank_lock, release_prompt_bank_locks, release_stale_bank_locks
+from .eviction import ensure_cache_evictor
+from .staging import OUTPUTS_DIRNAME, stage_bank
+from .storage import get_tiered_storage
+from .blob_store import save_bank_frames, load_bank_frames, load_bank_frame
+from .write_behind import get_write_behind_queue
+from .tensor_cache import get_tensor_cache
+from .graph_utils import BANK_NODE_TYPE, is_output_used, predict_banks
+from .prefetch import get_bank_prefetcher
 
 from ..image.image_utils import split_images
 from ..encoders import get_encoders
-from ..encoders.image_encoder import ImageEncoder
+from ..encoders.image_encoder import ImageEncoder, to_float_images
+
+# use the encoder configured for the cache
+CACHE_ENCODER = "default"
 
 
 class PersistImageBank:
@@ -24,7 +38,7 @@ class PersistImageBank:
         """INPUT_TYPES definition."""
         from comfy.comfy_types.node_typing import IO
 
-        cache_names = [DEFAULT_CACHE_NAME]
+        cache_names = get_cache_names()
 
         return {
             "required": {
@@ -36,6 +50,13 @@ class PersistImageBank:
             },
             "optional": {
                 "images": ("IMAGE", {"lazy": True}),
+                "encoder": ([CACHE_ENCODER] + list(get_encoders().keys()), {"default": CACHE_ENCODER}),
+                "quality": ("INT", {"min": -1, "max": 100, "default": -1}),
+                "selected_only": ("BOOLEAN", {"default": False}),
+            },
+            "hidden": {
+                "prompt": "PROMPT",
+                "unique_id": "UNIQUE_ID",
             },
         }
 
@@ -72,17 +93,79 @@ class PersistImageBank:
         bank_name = kwargs.get("bank_name")
         bank_id = kwargs.get("bank_id")
 
-        bank_path = get_bank_path(
-            cache_path=get_cache_path(cache_name=cache_name), bank_name=bank_name, bank_id=bank_id
-        )
+        cache_path = get_cache_path(cache_name=cache_name)
+        bank_path = get_bank_path(cache_path=cache_path, bank_name=bank_name, bank_id=bank_id)
 
-        if is_bank_valid(bank_path=bank_path):
+        # locks are owned by the prompt, so the ones left by a failed or interrupted prompt are released
+        prompt = kwargs.get("prompt")
+        if prompt is not None:
+            release_stale_bank_locks(prompt)
+
+        # the bank is loaded in the background while upstream nodes run
+        prefetch = not kwargs.get("selected_only", False) and is_output_used(prompt, kwargs.get("unique_id"), 0)
+
+        if self._is_bank_available(bank_path):
             self._logger.info(f"{bank_path} images are already cached!")
+            if prefetch:
+                self._prefetch_bank(cache_name, bank_path)
+            return []
+
+        # single-flight: only the worker holding the lock generates the bank, the others wait for its commit
+        if not acquire_bank_lock(bank_path, owner=prompt):
+            lock_timeout = get_cache_lock_timeout(cache_name=cache_name)
+            self._logger.info(f"{bank_path} is being generated by another worker, waiting up to {lock_timeout}s")
+            if not acquire_bank_lock(bank_path, timeout=lock_timeout, owner=prompt):
+                self._logger.warning(f"{bank_path} lock timed out, generating the bank anyway")
+
+        # the bank may have been committed while acquiring the lock
+        if self._is_bank_available(bank_path):
+            release_bank_lock(bank_path)
+            self._logger.info(f"{bank_path} images have been cached by another worker!")
+            if prefetch:
+                self._prefetch_bank(cache_name, bank_path)
+            return []
+
+        # read-through: the bank may have been generated on another node
+        if self._fetch_remote_bank(cache_name, cache_path, bank_path):
+            release_bank_lock(bank_path)
+            self._logger.info(f"{bank_path} images have been fetched from the remote store!")
+            if prefetch:
+                self._prefetch_bank(cache_name, bank_path)
             return []
 
         self._logger.info(f"{bank_path} images are NOT already cached!")
         return ["images"]
 
+    def _is_bank_available(self, bank_path: str) -> bool:
+        # banks are committed atomically, their metadata is only there once complete
+        return is_bank_valid(bank_path=bank_path, mode="exists") or get_write_behind_queue().is_pending(bank_path)
+
+    def _get_tiered_storage(self, cache_name: str, cache_path: str):
+        remote = get_cache_remote(cache_name=cache_name)
+        if remote is None:
+            return None
+        return get_tiered_storage(cache_path, remote, workers=get_cache_decode_workers(cache_name=cache_name))
+
+    def _fetch_remote_bank(self, cache_name: str, cache_path: str, bank_path: str) -> bool:
+        storage = self._get_tiered_storage(cache_name, cache_path)
+        if storage is None:
+            return False
+        try:
+            return storage.fetch_bank(bank_path)
+        except Exception as e:
+            self._logger.warning(f"Unable to fetch {bank_path} from the remote store: {e}")
+            return False
+
+    def _push_remote_bank(self, cache_name: str, cache_path: str, bank_path: str):
+        storage = self._get_tiered_storage(cache_name, cache_path)
+        if storage is None:
+            return
+        try:
+            storage.push_bank(bank_path)
+        except Exception as e:
+            # the bank stays available locally, other nodes generate their own copy
+            self._logger.warning(f"Unable to push {bank_path} to the remote store: {e}")
+
     def process(
         self,
         cache_name: str,
@@ -91,6 +174,11 @@ class PersistImageBank:
         selected_index: int,
         enable_write: bool,
         images=None,
+        encoder: str = CACHE_ENCODER,
+        quality: int = -1,
+        selected_only: bool = False,
+        prompt: Optional[Dict[str, Any]] = None,
+        unique_id: Optional[str] = None,
     ):
         """
         Run the node.
@@ -107,24 +195,59 @@ class PersistImageBank:
         :param enable_write: Description
         :type enable_write: bool
         :param images: Description
+        :param encoder: name of the encoder used to write the bank, ``default`` uses the cache encoder
+        :type encoder: str
+        :param quality: encoder specific quality, -1 uses the cache setting
+        :type quality: int
+        :param selected_only: only output the selected frame, a stored bank then only loads this frame
+        :type selected_only: bool
+        :param prompt: prompt being executed, used by ``check_lazy_status``
+        :type prompt: Optional[Dict[str, Any]]
+        :param unique_id: id of this node in the prompt
+        :type unique_id: Optional[str]
         """
+        cache_path = get_cache_path(cache_name=cache_name)
         bank_path = get_bank_path(
-            cache_path=get_cache_path(cache_name=cache_name),
+            cache_path=cache_path,
             bank_name=bank_name,
             bank_id=bank_id
         )
+        self._start_evictor(cache_name, cache_path)
 
+        try:
+            return self._process(
+                cache_name, cache_path, bank_path, bank_id, selected_index, enable_write, images, encoder, quality,
+                selected_only,
+            )
+        finally:
+            # a bank handed to the write-behind queue keeps its lock until it is written
+            if get_write_behind_queue().is_pending(bank_path):
+                disown_bank_lock(bank_path)
+            else:
+                release_bank_lock(bank_path)
+
+    def _process(
+        self,
+        cache_name: str,
+        cache_path: str,
+        bank_path: str,
+        bank_id: str,
+        selected_index: int,
+        enable_write: bool,
+        images,
+        encoder: str,
+        quality: int,
+        selected_only: bool,
+    ):
         if images is not None:
             sp_images = split_images(images)
+            selected_image = sp_images[selected_index].unsqueeze(0)
+            # same outputs whether the bank is generated or served, from memory or from disk
+            output_images = selected_image if selected_only else images
 
             if enable_write:
                 self._logger.info(f"caching {bank_path} ...")
 
-                os.makedirs(bank_path, exist_ok=True)
-
-                for idx, img in enumerate(sp_images):
-                    self.__get_encoder().save_image(img, f"{bank_path}/{idx}")
-
                 if isinstance(bank_id, str):
                     bank_config = {
                         "num_frames": len(sp_images)
@@ -133,36 +256,165 @@ class PersistImageBank:
                     bank_config = bank_id
                     # force num_frames if missing
                     bank_config["num_frames"] = len(sp_images)
-                write_bank_metadata(
-                    bank_path=bank_path,
-                    data={"encoder": DEFAULT_BANK_ENCODER, "bank_config": bank_config},
-                )
+                encoder_name = get_cache_encoder(cache_name=cache_name) if encoder == CACHE_ENCODER else encoder
+                bank_encoder = self.__get_encoder(encoder_name)
+                encoder_options = get_cache_encoder_options(cache_name=cache_name)
+                if quality >= 0:
+                    encoder_options["quality"] = quality
+
+                metadata = {"encoder": encoder_name, "bank_config": bank_config}
+                encode_workers = get_cache_encode_workers(cache_name=cache_name)
+                dedup = get_cache_dedup(cache_name=cache_name)
+
+                def notify_written(_):
+                    # write-through to the remote store, if any
+                    self._push_remote_bank(cache_name, cache_path, bank_path)
+                    PromptServer.instance.send_sync("persistence.written_bank", {
+                        "bank_id": get_bank_fingerprint(bank_id=bank_id)
+                    })
+
+                if get_cache_write_behind(cache_name=cache_name):
+                    # hand the images downstream, frames and metadata are written in the background
+                    get_write_behind_queue().submit(
+                        bank_path,
+                        bank_encoder,
+                        images,
+                        metadata,
+                        workers=encode_workers,
+                        on_commit=notify_written,
+                        cache_path=cache_path,
+                        options=encoder_options,
+                        dedup=dedup,
+                        on_finish=release_bank_lock,
+                    )
+                else:
+                    with stage_bank(bank_path, cache_path=cache_path) as staging_path:
+                        save_bank_frames(
+                            bank_encoder,
+                            images,
+                            staging_path,
+                            metadata,
+                            workers=encode_workers,
+                            options=encoder_options,
+                            dedup=dedup,
+                        )
+                        write_bank_metadata(bank_path=staging_path, data=metadata)
+                    notify_written(bank_path)
+                    # the written images are not cached: lossy encoders store other pixels, which a memory hit
+                    # must return like a load from disk does
 
                 # output movie using node expansion
                 graph = GraphBuilder()
-                graph.node("SaveWEBM", images=images, codec="vp9", fps=16.0, filename_prefix=f"{bank_path}/video", crf=32)
-
-                PromptServer.instance.send_sync("persistence.written_bank", {
-                    "bank_id": get_bank_fingerprint(bank_id=bank_id)
-                })
+                # the commit of the bank keeps its outputs folder, the video may be saved before a write-behind commit
+                graph.node(
+                    "SaveWEBM", images=images, codec="vp9", fps=16.0, filename_prefix=f"{bank_path}/{OUTPUTS_DIRNAME}/video", crf=32
+                )
 
                 # perform node expansion to save the video
                 return {
                     "result": (
-                        images,
-                        sp_images[selected_index].unsqueeze(0),
+                        output_images,
+                        selected_image,
                     ),
                     "expand": graph.finalize(),
                 }
 
             return (
-                images,
-                sp_images[selected_index].unsqueeze(0),
+                output_images,
+                selected_image,
             )
 
         # load from cache since there are no input images
         self._logger.info(f"serving {bank_path} from cache")
+        touch_bank(bank_path=bank_path, cache_path=cache_path)
 
+        # banks are held in their compact stored form, expanded to float32 on output
+        cached_images = self._get_loaded_bank(cache_name, bank_path)
+        if cached_images is not None:
+            cached_images = to_float_images(cached_images)
+            selected_image = cached_images[selected_index].unsqueeze(0)
+            return (
+                selected_image if selected_only else cached_images,
+                selected_image,
+            )
+
+        metadata, num_frames = self._read_bank(bank_path)
+
+        if selected_only:
+            # the outputs must only depend on the inputs, not on the links: skipping frames is requested explicitly
+            if not -num_frames <= selected_index < num_frames:
+                raise Exception(f"selected_index {selected_index} out of range for bank {bank_path} ({num_frames} frames)!")
+            self._logger.info(f"loading frame {selected_index} of {bank_path}")
+            selected_image = to_float_images(load_bank_frame(
+                self.__get_encoder(metadata.get("encoder", DEFAULT_BANK_ENCODER)),
+                bank_path,
+                metadata,
+                selected_index % num_frames,
+            )).unsqueeze(0)
+            return (
+                selected_image,
+                selected_image,
+            )
+
+        cached_images = to_float_images(self._load_bank_frames(cache_name, bank_path, metadata, num_frames))
+
+        return (
+            cached_images,
+            cached_images[selected_index].unsqueeze(0),
+        )
+
+    def _start_evictor(self, cache_name: str, cache_path: str):
+        def notify_stats(stats: Dict[str, Any]):
+            PromptServer.instance.send_sync("persistence.cache_stats", {"cache_name": cache_name, **stats})
+
+        ensure_cache_evictor(
+            cache_path,
+            max_bytes=get_cache_max_bytes(cache_name=cache_name),
+            ttl=get_cache_ttl(cache_name=cache_name),
+            on_run=notify_stats,
+        )
+
+    def _prefetch_bank(self, cache_name: str, bank_path: str):
+        # prefetched banks are handed over through the tensor cache
+        if get_cache_memory_bytes(cache_name=cache_name) <= 0:
+            return
+        if self._get_loaded_bank(cache_name, bank_path, wait=False) is not None:
+            return
+        if not is_bank_valid(bank_path=bank_path):
+            return
+
+        def load() -> torch.Tensor:
+            metadata, num_frames = self._read_bank(bank_path)
+            images = self._load_bank_frames(cache_name, bank_path, metadata, num_frames)
+            self._logger.info(f"{bank_path} prefetched")
+            return images
+
+        get_bank_prefetcher().submit(bank_path, load)
+
+    def _get_loaded_bank(self, cache_name: str, bank_path: str, wait: bool = True) -> Optional[torch.Tensor]:
+        # the bank is still being written in the background
+        pending_images = get_write_behind_queue().get_pending(bank_path)
+        if pending_images is not None:
+            return pending_images
+
+        # a bank larger than the memory budget is only handed over by its prefetch
+        prefetched_images = get_bank_prefetcher().wait(bank_path) if wait else None
+        if prefetched_images is not None:
+            self._logger.info(f"{bank_path} served from its prefetch")
+            return prefetched_images
+
+        bank_mtime = get_bank_mtime(bank_path)
+        if bank_mtime is None:
+            return None
+
+        cached_images = get_tensor_cache(cache_name, get_cache_memory_bytes(cache_name=cache_name)).get(
+            (bank_path, bank_mtime)
+        )
+        if cached_images is not None:
+            self._logger.info(f"{bank_path} served from memory")
+        return cached_images
+
+    def _read_bank(self, bank_path: str) -> Tuple[Dict[str, Any], int]:
         if not is_bank_valid(bank_path=bank_path):
             raise Exception(f"Unable to load the images from missing bank {bank_path}!")
 
@@ -172,14 +424,95 @@ class PersistImageBank:
         if num_frames is None:
             raise Exception(f"Unable to get num_frames from bank {bank_path} metadata!")
 
-        cached_images = []
-        for idx in range(num_frames):
-            img = self.__get_encoder(
-                metadata.get("encoder", DEFAULT_BANK_ENCODER)
-            ).load_image(f"{bank_path}/{idx}")
-            cached_images.append(img)
-
-        return (
-            torch.stack(cached_images, dim=0),
-            cached_images[selected_index].unsqueeze(0),
+        return metadata, num_frames
+
+    def _load_bank_frames(
+        self, cache_name: str, bank_path: str, metadata: Dict[str, Any], num_frames: int
+    ) -> torch.Tensor:
+        bank_mtime = get_bank_mtime(bank_path)
+        cached_images = load_bank_frames(
+            self.__get_encoder(metadata.get("encoder", DEFAULT_BANK_ENCODER)),
+            bank_path,
+            metadata,
+            num_frames,
+            workers=get_cache_decode_workers(cache_name=cache_name),
         )
+        if bank_mtime is not None:
+            get_tensor_cache(cache_name, get_cache_memory_bytes(cache_name=cache_name)).put(
+                (bank_path, bank_mtime), cached_images
+            )
+        return cached_images
+
+    def load_bank(self, cache_name: str, bank_path: str) -> torch.Tensor:
+        """
+        Load all the images of a bank, from memory when possible.
+
+        :param cache_name: name of the cache holding the bank
+        :type cache_name: str
+        :param bank_path: bank full path
+        :type bank_path: str
+        :return: Batch of float32 images
+        :rtype: torch.Tensor
+        """
+        touch_bank(bank_path=bank_path, cache_path=get_cache_path(cache_name=cache_name))
+        cached_images = self._get_loaded_bank(cache_name, bank_path)
+        if cached_images is not None:
+            return to_float_images(cached_images)
+
+        metadata, num_frames = self._read_bank(bank_path)
+        return to_float_images(self._load_bank_frames(cache_name, bank_path, metadata, num_frames))
+
+
+def _prefetch_prompt_banks(json_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Start loading the banks of a prompt as soon as it is queued."""
+    try:
+        node = PersistImageBank()
+        prompt = json_data.get("prompt")
+        for bank in predict_banks(prompt):
+            node_type = prompt[bank["node_id"]].get("class_type")
+            if node_type == BANK_NODE_TYPE and (
+                prompt[bank["node_id"]].get("inputs", {}).get("selected_only") is True
+                or not is_output_used(prompt, bank["node_id"], 0)
+            ):
+                # a single frame is decoded, or the bank is not consumed
+                continue
+            cache_path = get_cache_path(cache_name=bank["cache_name"])
+            bank_path = get_bank_path(cache_path=cache_path, bank_name=bank["bank_name"], bank_id=bank["bank_id"])
+            node._prefetch_bank(bank["cache_name"], bank_path)
+    except Exception as e:
+        # prefetching is an optimization, it must never reject a prompt
+        PersistImageBank._logger.debug(f"Unable to prefetch the banks of the prompt: {e}")
+    return json_data
+
+
+# events sent once a prompt is over, whether it completed, failed or was interrupted
+_EXECUTION_END_EVENTS = ("execution_success", "execution_error", "execution_interrupted")
+
+
+def _is_execution_end(event: str, data: Any) -> bool:
+    """Check if a server event reports the end of a prompt."""
+    if event in _EXECUTION_END_EVENTS:
+        return True
+    # older servers only report the end of a prompt as executing no node
+    return event == "executing" and isinstance(data, dict) and data.get("node") is None
+
+
+def _release_locks_on_execution_end(send_sync):
+    """Wrap ``PromptServer.send_sync`` to release the bank locks left by a prompt when it ends."""
+    def send_sync_wrapper(event, data, *args, **kwargs):
+        if _is_execution_end(event, data):
+            try:
+                release_prompt_bank_locks()
+            except Exception as e:
+                PersistImageBank._logger.warning(f"Unable to release the bank locks of the prompt: {e}")
+        return send_sync(event, data, *args, **kwargs)
+
+    return send_sync_wrapper
+
+
+_prompt_server = getattr(PromptServer, "instance", None)
+if _prompt_server is not None and hasattr(_prompt_server, "add_on_prompt_handler"):
+    _prompt_server.add_on_prompt_handler(_prefetch_prompt_banks)
+if _prompt_server is not None and hasattr(_prompt_server, "send_sync"):
+    # the server has no listener API, its events all go through send_sync
+    _prompt_server.send_sync = _release_locks_on_execution_end(_prompt_server.send_sync)
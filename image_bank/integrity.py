@@ -0,0 +1,110 @@
+"""Integrity records of the files of a bank."""
+import os
+import zlib
+import logging
+from typing import Any, Dict, List
+
+# metadata key holding {relative path: {size, crc32}}
+FILES_KEY = "files"
+# metadata file only / file sizes / file checksums
+VALIDATION_MODES = ("exists", "stat", "checksum")
+DEFAULT_VALIDATION_MODE = "stat"
+
+_CRC_CHUNK_SIZE = 1 << 20
+
+_logger = logging.getLogger("comfy.custom.persistence.integrity")
+
+
+def file_crc32(file_path: str) -> int:
+    """
+    Compute the CRC32 of a file.
+
+    :param file_path: file path
+    :type file_path: str
+    :return: CRC32 checksum
+    :rtype: int
+    """
+    crc = 0
+    with open(file_path, "rb") as fi:
+        while True:
+            chunk = fi.read(_CRC_CHUNK_SIZE)
+            if not chunk:
+                return crc
+            crc = zlib.crc32(chunk, crc)
+
+
+def describe_files(bank_path: str, file_paths: List[str]) -> Dict[str, Dict[str, int]]:
+    """
+    Record the size and checksum of files.
+
+    :param bank_path: bank full path, the files are recorded relative to it
+    :type bank_path: str
+    :param file_paths: paths of the files
+    :type file_paths: List[str]
+    :return: {relative path: {size, crc32}}
+    :rtype: Dict[str, Dict[str, int]]
+    """
+    return {
+        os.path.relpath(file_path, bank_path).replace(os.sep, "/"): {
+            "size": os.path.getsize(file_path),
+            "crc32": file_crc32(file_path),
+        }
+        for file_path in file_paths
+    }
+
+
+def list_bank_files(bank_path: str, exclude: List[str]) -> List[str]:
+    """
+    List the files held by a bank folder.
+
+    :param bank_path: bank full path
+    :type bank_path: str
+    :param exclude: names of the files to skip (metadata...), hidden files are always skipped
+    :type exclude: List[str]
+    :return: file paths
+    :rtype: List[str]
+    """
+    file_paths = []
+    for root, dirs, files in os.walk(bank_path):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        for f in files:
+            if f in exclude or f.startswith("."):
+                continue
+            file_paths.append(os.path.join(root, f))
+    return sorted(file_paths)
+
+
+def check_files(bank_path: str, metadata: Dict[str, Any], mode: str = DEFAULT_VALIDATION_MODE) -> bool:
+    """
+    Check the files recorded in the bank metadata.
+
+    Banks written before integrity records were added have none, they are
+    only checked for their metadata.
+
+    :param bank_path: bank full path
+    :type bank_path: str
+    :param metadata: bank metadata
+    :type metadata: Dict[str, Any]
+    :param mode: ``exists`` skips the files, ``stat`` compares their sizes, ``checksum`` their CRC32 too
+    :type mode: str
+    :return: Whether all the files are there and intact
+    :rtype: bool
+    """
+    if mode not in VALIDATION_MODES:
+        raise Exception(f"Unknown validation mode '{mode}', expected one of {list(VALIDATION_MODES)}")
+    if mode == "exists":
+        return True
+
+    for rel_path, record in (metadata.get(FILES_KEY) or dict()).items():
+        file_path = os.path.join(bank_path, rel_path)
+        try:
+            if os.path.getsize(file_path) != record["size"]:
+                _logger.warning(f"{file_path} is truncated or altered")
+                return False
+            if mode == "checksum" and file_crc32(file_path) != record["crc32"]:
+                _logger.warning(f"{file_path} checksum mismatch")
+                return False
+        except OSError:
+            _logger.warning(f"{file_path} is missing")
+            return False
+    return True
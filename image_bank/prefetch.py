@@ -0,0 +1,129 @@
+"""Background loading of banks into the in-memory cache."""
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+DEFAULT_PREFETCH_WORKERS = 2
+
+_logger = logging.getLogger("comfy.custom.persistence.prefetch")
+
+
+class BankPrefetcher:
+    """
+    Load banks in background threads ahead of the nodes reading them.
+
+    Loaders are expected to put the loaded bank in the tensor cache, the
+    prefetcher only tracks the loads in flight so that a bank is never
+    loaded twice and a node can wait for a load already started instead
+    of decoding the bank again. Completed loads are kept until a node waits
+    for them, since banks larger than the tensor cache are only handed over
+    this way. At most ``workers`` of them are kept, the oldest are dropped.
+    """
+
+    def __init__(self, workers: int = DEFAULT_PREFETCH_WORKERS):
+        """
+        Create the prefetcher.
+
+        :param workers: number of banks loaded concurrently
+        :type workers: int
+        """
+        self.workers = max(1, workers)
+        self._futures: Dict[str, Future] = dict()
+        # completed loads not consumed yet, oldest first
+        self._done: "OrderedDict[str, Future]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def submit(self, bank_path: str, load: Callable[[], Any]) -> Future:
+        """
+        Start loading a bank, unless it is already being loaded.
+
+        :param bank_path: bank full path
+        :type bank_path: str
+        :param load: loads the bank into the tensor cache, its result is handed to the nodes waiting for it
+        :type load: Callable[[], Any]
+        :return: future of the load
+        :rtype: Future
+        """
+        with self._lock:
+            future = self._futures.get(bank_path)
+            if future is not None:
+                return future
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="persistence-prefetch")
+            future = self._futures[bank_path] = self._executor.submit(load)
+
+        def forget(done: Future):
+            failed = done.cancelled() or done.exception() is not None
+            with self._lock:
+                if self._futures.get(bank_path) is not done:
+                    pass
+                elif failed or done.result() is None:
+                    del self._futures[bank_path]
+                else:
+                    self._done[bank_path] = done
+                    while len(self._done) > self.workers:
+                        oldest_path, oldest = self._done.popitem(last=False)
+                        if self._futures.get(oldest_path) is oldest:
+                            del self._futures[oldest_path]
+            if not done.cancelled() and done.exception() is not None:
+                _logger.warning(f"Prefetch of {bank_path} failed: {done.exception()}")
+
+        future.add_done_callback(forget)
+        return future
+
+    def is_pending(self, bank_path: str) -> bool:
+        """
+        Check if a bank is being loaded.
+
+        :param bank_path: bank full path
+        :type bank_path: str
+        :return: Whether a load is in flight
+        :rtype: bool
+        """
+        with self._lock:
+            future = self._futures.get(bank_path)
+            return future is not None and not future.done()
+
+    def wait(self, bank_path: str, timeout: Optional[float] = None) -> Any:
+        """
+        Wait for the load of a bank in flight or completed, if any, and consume it.
+
+        Failed loads are not raised: the node then loads the bank itself.
+
+        :param bank_path: bank full path
+        :type bank_path: str
+        :param timeout: maximum wait in seconds, None to wait until the load is over
+        :type timeout: Optional[float]
+        :return: result of the loader if a load was in flight and succeeded, None otherwise
+        :rtype: Any
+        """
+        with self._lock:
+            future = self._futures.get(bank_path)
+        if future is None:
+            return None
+        try:
+            result = future.result(timeout=timeout)
+        except Exception:
+            return None
+        with self._lock:
+            if self._futures.get(bank_path) is future:
+                del self._futures[bank_path]
+            if self._done.get(bank_path) is future:
+                del self._done[bank_path]
+        return result
+
+
+_bank_prefetcher = BankPrefetcher()
+
+
+def get_bank_prefetcher() -> BankPrefetcher:
+    """
+    Get the process-wide prefetcher.
+
+    :return: bank prefetcher
+    :rtype: BankPrefetcher
+    """
+    return _bank_prefetcher
@@ -0,0 +1,150 @@
+"""Atomic commit of banks through a staging directory."""
+import os
+import uuid
+import shutil
+import logging
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from . import notify_bank_changed, read_bank_metadata
+
+STAGING_PREFIX = ".staging-"
+TRASH_PREFIX = ".trash-"
+# files written into a bank folder by other nodes (the preview video), kept when the bank is committed
+OUTPUTS_DIRNAME = "outputs"
+_COMMIT_ATTEMPTS = 5
+
+_logger = logging.getLogger("comfy.custom.persistence.staging")
+
+
+def fsync_path(path: str):
+    """
+    Flush a file or a directory entry to disk.
+
+    :param path: file or directory path
+    :type path: str
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        # directories cannot be opened on some platforms
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def fsync_tree(path: str):
+    """
+    Flush all the files of a directory tree, then the directories themselves.
+
+    :param path: directory path
+    :type path: str
+    """
+    for root, _, files in os.walk(path, topdown=False):
+        for f in files:
+            fsync_path(os.path.join(root, f))
+        fsync_path(root)
+
+
+def commit_staged_bank(staging_path: str, bank_path: str, cache_path: Optional[str] = None):
+    """
+    Move a staged bank into place.
+
+    The staging directory is renamed over the bank path. A previous bank at
+    this path is first moved aside and deleted once replaced, so readers
+    see either a complete bank or no bank, never a mix of two writes. Its
+    ``OUTPUTS_DIRNAME`` folder is moved into the new bank: with
+    write-behind, the video of a bank may be saved before its commit.
+
+    :param staging_path: staging directory holding the complete bank, metadata included
+    :type staging_path: str
+    :param bank_path: bank full path
+    :type bank_path: str
+    :param cache_path: root path of the cache, the bank is added to its index when set
+    :type cache_path: Optional[str]
+    """
+    fsync_tree(staging_path)
+
+    parent_path, bank_id = os.path.split(os.path.abspath(bank_path))
+    trash_paths = []
+    for _ in range(_COMMIT_ATTEMPTS):
+        try:
+            os.rename(staging_path, bank_path)
+            break
+        except OSError:
+            # the bank already exists, move it aside (it may vanish meanwhile)
+            trash_path = os.path.join(parent_path, f"{TRASH_PREFIX}{bank_id}-{uuid.uuid4().hex}")
+            try:
+                os.rename(bank_path, trash_path)
+                trash_paths.append(trash_path)
+            except FileNotFoundError:
+                pass
+    else:
+        raise Exception(f"Unable to commit bank {bank_path}, it keeps being replaced!")
+
+    fsync_path(parent_path)
+    for trash_path in trash_paths:
+        _keep_outputs(trash_path, bank_path)
+        shutil.rmtree(trash_path, ignore_errors=True)
+
+    notify_bank_changed(bank_path=bank_path, data=read_bank_metadata(bank_path), cache_path=cache_path)
+
+
+def _keep_outputs(trash_path: str, bank_path: str):
+    """Move the outputs of a replaced bank folder into the committed bank."""
+    outputs_path = os.path.join(trash_path, OUTPUTS_DIRNAME)
+    if not os.path.isdir(outputs_path):
+        return
+    bank_outputs_path = os.path.join(bank_path, OUTPUTS_DIRNAME)
+    os.makedirs(bank_outputs_path, exist_ok=True)
+    for entry in os.scandir(outputs_path):
+        try:
+            os.replace(entry.path, os.path.join(bank_outputs_path, entry.name))
+        except OSError as e:
+            _logger.warning(f"Unable to keep {entry.path} in {bank_path}: {e}")
+
+
+def make_staging_path(bank_path: str) -> str:
+    """
+    Create a staging directory next to a bank.
+
+    Staging directories are hidden from the bank index and share the cache
+    root of the bank, blobs paths are the same from both.
+
+    :param bank_path: bank full path
+    :type bank_path: str
+    :return: staging directory path
+    :rtype: str
+    """
+    parent_path, bank_id = os.path.split(os.path.abspath(bank_path))
+    staging_path = os.path.join(parent_path, f"{STAGING_PREFIX}{bank_id}-{uuid.uuid4().hex}")
+    os.makedirs(staging_path)
+    return staging_path
+
+
+@contextmanager
+def stage_bank(bank_path: str, cache_path: Optional[str] = None) -> Iterator[str]:
+    """
+    Write a bank in a staging directory and commit it on exit.
+
+    The frames and the metadata must be written to the yielded directory.
+    Nothing is committed when an exception is raised.
+
+    :param bank_path: bank full path
+    :type bank_path: str
+    :param cache_path: root path of the cache, the bank is added to its index when set
+    :type cache_path: Optional[str]
+    :return: staging directory path
+    :rtype: Iterator[str]
+    """
+    staging_path = make_staging_path(bank_path)
+    try:
+        yield staging_path
+        commit_staged_bank(staging_path, bank_path, cache_path=cache_path)
+    finally:
+        if os.path.isdir(staging_path):
+            shutil.rmtree(staging_path, ignore_errors=True)
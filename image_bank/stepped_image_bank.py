@@ -4,11 +4,14 @@ import logging
 from server import PromptServer
 from typing import Any, Dict, List, Optional, Tuple, override
 
-from . import get_banks, get_cache_path, DEFAULT_CACHE_NAME
-from .image_bank import PersistImageBank
+from . import get_banks, get_bank_path, get_cache_path, get_cache_names, DEFAULT_CACHE_NAME
+from .image_bank import PersistImageBank, CACHE_ENCODER
+from .graph_utils import STEP_BANK_NAME_PLACEHOLDER, get_step_bank_settings, is_output_used
+from .video_series import make_serie, materialize_series
+from ..encoders import get_encoders
 
 
-_BANK_NAME_PLACEHOLDER = "<COPY-PREVIOUS-STEP>"
+_BANK_NAME_PLACEHOLDER = STEP_BANK_NAME_PLACEHOLDER
 
 
 class PersistSteppedImageBank(PersistImageBank):
@@ -18,17 +21,7 @@ class PersistSteppedImageBank(PersistImageBank):
 
     @staticmethod
     def _get_bank_settings(bank_name: Optional[str], bank_id: Optional[Any], previous_series: Optional[List[Dict]]) -> Tuple[str, str]:
-        if (not bank_name or bank_name == _BANK_NAME_PLACEHOLDER) and previous_series:
-            bank_name = previous_series[-1].get("bank_name")  # type: ignore
-
-        if not bank_name:
-            raise Exception("bank_name must be provided!")
-
-        if bank_id:
-            return bank_name, bank_id
-        if previous_series:
-            return bank_name, f"step{len(previous_series) + 1}"
-        return bank_name, "step1"
+        return get_step_bank_settings(bank_name, bank_id, previous_series)
 
     @classmethod
     def INPUT_TYPES(cls) -> Dict[str, Any]:
@@ -46,7 +39,7 @@ class PersistSteppedImageBank(PersistImageBank):
         banks.sort()
         banks.insert(0, "NONE")
 
-        cache_names = [DEFAULT_CACHE_NAME]
+        cache_names = get_cache_names()
 
         return {
             "required": {
@@ -58,6 +51,12 @@ class PersistSteppedImageBank(PersistImageBank):
                 "bank_id": (IO.ANY,),
                 "images": ("IMAGE", {"lazy": True}),
                 "previous_series": ("VIDEO_SERIES",),
+                "encoder": ([CACHE_ENCODER] + list(get_encoders().keys()), {"default": CACHE_ENCODER}),
+                "quality": ("INT", {"min": -1, "max": 100, "default": -1}),
+            },
+            "hidden": {
+                "prompt": "PROMPT",
+                "unique_id": "UNIQUE_ID",
             },
         }
 
@@ -97,6 +96,7 @@ class PersistSteppedImageBank(PersistImageBank):
                 "cache_name": kwargs.get("cache_name", DEFAULT_CACHE_NAME),
                 "bank_name": bank_name,
                 "bank_id": bank_id,
+                "prompt": kwargs.get("prompt"),
             }
         )
 
@@ -107,7 +107,11 @@ class PersistSteppedImageBank(PersistImageBank):
         enable_write: bool,
         bank_id=None,
         images: Optional[torch.Tensor] = None,
-        previous_series: Optional[List[Dict]] = None
+        previous_series: Optional[List[Dict]] = None,
+        encoder: str = CACHE_ENCODER,
+        quality: int = -1,
+        prompt: Optional[Dict[str, Any]] = None,
+        unique_id: Optional[str] = None,
     ):
         """
         Run the node.
@@ -124,6 +128,14 @@ class PersistSteppedImageBank(PersistImageBank):
         :type images: Optional[torch.Tensor]
         :param previous_series: previous series if any
         :type previous_series: Optional[List[Dict]]
+        :param encoder: name of the encoder used to write the bank, ``default`` uses the cache encoder
+        :type encoder: str
+        :param quality: encoder specific quality, -1 uses the cache setting
+        :type quality: int
+        :param prompt: prompt being executed, used to detect if all_images is consumed
+        :type prompt: Optional[Dict[str, Any]]
+        :param unique_id: id of this node in the prompt
+        :type unique_id: Optional[str]
         """
         bank_name, bank_id = self._get_bank_settings(bank_name, bank_id, previous_series)
 
@@ -134,7 +146,9 @@ class PersistSteppedImageBank(PersistImageBank):
             bank_id=bank_id,
             selected_index=-1,
             enable_write=enable_write,
-            images=images
+            images=images,
+            encoder=encoder,
+            quality=quality,
         )
         if isinstance(pstBankOutput, dict):
             current_images, current_last_image = pstBankOutput.get("result")
@@ -143,35 +157,36 @@ class PersistSteppedImageBank(PersistImageBank):
             current_images, current_last_image = pstBankOutput
             graph = None
 
-        current_serie = {"images": current_images, "bank_name": bank_name}
-
-        if previous_series:
-            # extract images from previous series
-            previous_images = list(map(lambda s: s.get("images"), previous_series))
-
-            if None in previous_images:
-                raise Exception("Not all previous series have images!")
-
-            all_images = previous_images + [current_images]
+        bank_path = get_bank_path(cache_path=get_cache_path(cache_name=cache_name), bank_name=bank_name, bank_id=bank_id)
+        # steps reference their bank, images are only carried when they are not persisted
+        persisted = images is None or enable_write
+        current_serie = make_serie(
+            bank_name=bank_name,
+            cache_name=cache_name,
+            bank_path=bank_path,
+            num_frames=current_images.shape[0],
+            images=None if persisted else current_images,
+        )
+        series = (previous_series or []) + [current_serie]
 
-            return {
-                "result": (
-                    current_images,
-                    current_last_image,
-                    torch.cat(all_images, dim=0),
-                    previous_series + [current_serie]
-                ),
-                "expand": graph,
-            }
+        # the chain is only decoded when all_images is consumed, downstream steps only need the series
+        if previous_series and is_output_used(prompt, unique_id, 2):
+            def load_step(step: Dict[str, Any]) -> torch.Tensor:
+                if step.get("bank_path") == bank_path:
+                    return current_images
+                return self.load_bank(step.get("cache_name", cache_name), step["bank_path"])
 
+            all_images = materialize_series(series, load_step)
         else:
-            # first or single step
-            return {
-                "result": (
-                    current_images,
-                    current_last_image,
-                    current_images,
-                    [current_serie]
-                ),
-                "expand": graph
-            }
+            # single step, or all_images is not consumed
+            all_images = current_images
+
+        return {
+            "result": (
+                current_images,
+                current_last_image,
+                all_images,
+                series
+            ),
+            "expand": graph,
+        }
@@ -0,0 +1,446 @@
+"""Storage backends sharing banks between workers, and the local tier in front of them."""
+import os
+import json
+import uuid
+import shutil
+import logging
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import METADATA_FILENAME, write_bank_metadata
+from .integrity import FILES_KEY, check_files, list_bank_files
+from .staging import stage_bank
+
+DEFAULT_STORAGE_WORKERS = 8
+
+_logger = logging.getLogger("comfy.custom.persistence.storage")
+
+
+class StorageBackend(ABC):
+    """
+    Store of files addressed by ``/`` separated keys.
+
+    Keys mirror the layout of a cache: ``{bank_name}/{bank_id}/{file}`` and
+    ``.blobs/{xx}/{key}{ext}``. Implementations must be safe to call from
+    several threads.
+    """
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        """
+        Check if a file exists.
+
+        :param key: file key
+        :type key: str
+        :return: Whether the file exists
+        :rtype: bool
+        """
+
+    @abstractmethod
+    def read_bytes(self, key: str) -> bytes:
+        """
+        Read a whole file, raise FileNotFoundError if it does not exist.
+
+        :param key: file key
+        :type key: str
+        :return: file content
+        :rtype: bytes
+        """
+
+    @abstractmethod
+    def download(self, key: str, local_path: str):
+        """
+        Copy a file to the local disk, raise FileNotFoundError if it does not exist.
+
+        :param key: file key
+        :type key: str
+        :param local_path: destination path
+        :type local_path: str
+        """
+
+    @abstractmethod
+    def upload(self, local_path: str, key: str):
+        """
+        Copy a local file to the store.
+
+        :param local_path: source path
+        :type local_path: str
+        :param key: file key
+        :type key: str
+        """
+
+    @abstractmethod
+    def list_keys(self, prefix: str) -> List[str]:
+        """
+        List the files whose key starts with a prefix.
+
+        :param prefix: key prefix
+        :type prefix: str
+        :return: file keys
+        :rtype: List[str]
+        """
+
+    @abstractmethod
+    def delete(self, key: str):
+        """
+        Delete a file, if it exists.
+
+        :param key: file key
+        :type key: str
+        """
+
+
+class LocalStorageBackend(StorageBackend):
+    """Store files in a local (or mounted) directory."""
+
+    def __init__(self, root_path: str):
+        """
+        Create the backend.
+
+        :param root_path: directory holding the files
+        :type root_path: str
+        """
+        self.root_path = os.path.abspath(root_path)
+
+    def _get_path(self, key: str) -> str:
+        path = os.path.normpath(os.path.join(self.root_path, *key.split("/")))
+        if os.path.commonpath([path, self.root_path]) != self.root_path:
+            raise Exception(f"Key '{key}' is outside of {self.root_path}")
+        return path
+
+    def exists(self, key: str) -> bool:
+        return os.path.isfile(self._get_path(key))
+
+    def read_bytes(self, key: str) -> bytes:
+        with open(self._get_path(key), "rb") as fi:
+            return fi.read()
+
+    def download(self, key: str, local_path: str):
+        shutil.copyfile(self._get_path(key), local_path)
+
+    def upload(self, local_path: str, key: str):
+        path = self._get_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # readers of the store never see a partial file
+        tmp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.{uuid.uuid4().hex}")
+        try:
+            shutil.copyfile(local_path, tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def list_keys(self, prefix: str) -> List[str]:
+        keys = []
+        # only walk the deepest directory covering the prefix
+        walk_path = self._get_path(prefix.rsplit("/", 1)[0]) if "/" in prefix else self.root_path
+        for root, _, files in os.walk(walk_path):
+            for f in files:
+                key = os.path.relpath(os.path.join(root, f), self.root_path).replace(os.sep, "/")
+                if key.startswith(prefix) and not f.startswith("."):
+                    keys.append(key)
+        return sorted(keys)
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._get_path(key))
+        except FileNotFoundError:
+            pass
+
+
+class S3StorageBackend(StorageBackend):
+    """
+    Store files in an S3 compatible bucket (AWS, MinIO...).
+
+    ``boto3`` is only imported when the backend is first used. Credentials
+    are resolved the boto3 way (environment, profile, instance role).
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "",
+        endpoint_url: Optional[str] = None,
+        region_name: Optional[str] = None,
+        max_connections: int = DEFAULT_STORAGE_WORKERS,
+        client=None,
+    ):
+        """
+        Create the backend.
+
+        :param bucket: bucket name
+        :type bucket: str
+        :param prefix: prefix of the keys in the bucket
+        :type prefix: str
+        :param endpoint_url: endpoint of S3 compatible stores, None for AWS
+        :type endpoint_url: Optional[str]
+        :param region_name: bucket region
+        :type region_name: Optional[str]
+        :param max_connections: size of the connection pool, shared by the transfer threads
+        :type max_connections: int
+        :param client: boto3 S3 client to use instead of creating one
+        """
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.endpoint_url = endpoint_url
+        self.region_name = region_name
+        self.max_connections = max_connections
+        self._client = client
+        self._lock = threading.Lock()
+
+    def _get_client(self):
+        with self._lock:
+            if self._client is None:
+                try:
+                    import boto3
+                    from botocore.config import Config
+                except ImportError:
+                    raise Exception("The 's3' storage backend requires boto3, install it with 'pip install boto3'")
+
+                # boto3 clients are thread safe, a single pooled client serves all the transfers
+                self._client = boto3.session.Session().client(
+                    "s3",
+                    endpoint_url=self.endpoint_url,
+                    region_name=self.region_name,
+                    config=Config(max_pool_connections=self.max_connections, retries={"mode": "standard"}),
+                )
+            return self._client
+
+    def _get_key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    @staticmethod
+    def _is_not_found(e: Exception) -> bool:
+        error = getattr(e, "response", None) or dict()
+        return error.get("Error", dict()).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+    def exists(self, key: str) -> bool:
+        try:
+            self._get_client().head_object(Bucket=self.bucket, Key=self._get_key(key))
+            return True
+        except Exception as e:
+            if self._is_not_found(e):
+                return False
+            raise
+
+    def read_bytes(self, key: str) -> bytes:
+        try:
+            return self._get_client().get_object(Bucket=self.bucket, Key=self._get_key(key))["Body"].read()
+        except Exception as e:
+            if self._is_not_found(e):
+                raise FileNotFoundError(key)
+            raise
+
+    def download(self, key: str, local_path: str):
+        try:
+            self._get_client().download_file(self.bucket, self._get_key(key), local_path)
+        except Exception as e:
+            if self._is_not_found(e):
+                raise FileNotFoundError(key)
+            raise
+
+    def upload(self, local_path: str, key: str):
+        self._get_client().upload_file(local_path, self.bucket, self._get_key(key))
+
+    def list_keys(self, prefix: str) -> List[str]:
+        full_prefix = self._get_key(prefix)
+        keys = []
+        paginator = self._get_client().get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=full_prefix):
+            for item in page.get("Contents", []):
+                keys.append(item["Key"][len(self._get_key("")):])
+        return sorted(keys)
+
+    def delete(self, key: str):
+        self._get_client().delete_object(Bucket=self.bucket, Key=self._get_key(key))
+
+
+def make_storage_backend(conf: Dict[str, Any], workers: int = DEFAULT_STORAGE_WORKERS) -> StorageBackend:
+    """
+    Create a storage backend from its configuration.
+
+    :param conf: ``{"type": "s3", "bucket", "prefix", "endpoint_url", "region"}`` or ``{"type": "local", "path"}``
+    :type conf: Dict[str, Any]
+    :param workers: number of transfer threads, sizes the connection pool
+    :type workers: int
+    :return: storage backend
+    :rtype: StorageBackend
+    """
+    backend_type = conf.get("type", "s3")
+    if backend_type == "s3":
+        if not conf.get("bucket"):
+            raise Exception("Missing 'bucket' from the 's3' storage configuration")
+        return S3StorageBackend(
+            bucket=conf["bucket"],
+            prefix=conf.get("prefix", ""),
+            endpoint_url=conf.get("endpoint_url"),
+            region_name=conf.get("region"),
+            max_connections=workers,
+        )
+    if backend_type == "local":
+        if not conf.get("path"):
+            raise Exception("Missing 'path' from the 'local' storage configuration")
+        return LocalStorageBackend(conf["path"])
+    raise Exception(f"Unknown storage type '{backend_type}', expected 's3' or 'local'")
+
+
+class TieredStorage:
+    """
+    Local cache directory in front of a shared storage backend.
+
+    Reads are read-through: a bank missing locally is fetched from the
+    remote store into a staging directory, then committed like a freshly
+    written bank. Writes are write-through: a committed bank is uploaded,
+    its ``metadata.json`` last, so remote readers only see complete banks.
+    Blobs of deduplicated banks are shared on both tiers and only
+    transferred when missing.
+    """
+
+    def __init__(self, cache_path: str, remote: StorageBackend, workers: int = DEFAULT_STORAGE_WORKERS):
+        """
+        Create the tiered storage of a cache.
+
+        :param cache_path: root path of the local cache
+        :type cache_path: str
+        :param remote: shared storage backend
+        :type remote: StorageBackend
+        :param workers: number of parallel transfers
+        :type workers: int
+        """
+        self.cache_path = os.path.abspath(cache_path)
+        self.remote = remote
+        self.workers = max(1, workers)
+
+    def get_key(self, local_path: str) -> str:
+        """
+        Get the remote key of a local path of the cache.
+
+        :param local_path: path inside the cache
+        :type local_path: str
+        :return: remote key
+        :rtype: str
+        """
+        rel_path = os.path.relpath(os.path.abspath(local_path), self.cache_path)
+        if rel_path.startswith(".."):
+            raise Exception(f"{local_path} is outside of the cache {self.cache_path}")
+        return rel_path.replace(os.sep, "/")
+
+    def _transfer(self, func, items: List[Any]):
+        if len(items) <= 1 or self.workers <= 1:
+            for item in items:
+                func(item)
+            return
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(items))) as pool:
+            # re-raise the first failure
+            for _ in pool.map(func, items):
+                pass
+
+    def _get_bank_files(self, bank_key: str, metadata: Dict[str, Any]) -> List[str]:
+        files = metadata.get(FILES_KEY)
+        if files is not None:
+            return list(files)
+        # banks written before integrity records: every file of the bank folder
+        prefix = f"{bank_key}/"
+        return [k[len(prefix):] for k in self.remote.list_keys(prefix) if k[len(prefix):] != METADATA_FILENAME]
+
+    def fetch_bank(self, bank_path: str) -> bool:
+        """
+        Copy a bank from the remote store to the local cache.
+
+        :param bank_path: local bank full path
+        :type bank_path: str
+        :return: Whether the bank exists remotely and has been fetched
+        :rtype: bool
+        """
+        bank_key = self.get_key(bank_path)
+        try:
+            metadata = json.loads(self.remote.read_bytes(f"{bank_key}/{METADATA_FILENAME}"))
+        except FileNotFoundError:
+            return False
+
+        rel_paths = self._get_bank_files(bank_key, metadata)
+        _logger.info(f"fetching {bank_path} ({len(rel_paths)} files) from the remote store")
+
+        with stage_bank(bank_path, cache_path=self.cache_path) as staging_path:
+            def fetch(rel_path: str):
+                # blobs live outside of the bank folder and are shared by other banks
+                target = os.path.normpath(os.path.join(bank_path, rel_path))
+                in_bank = os.path.commonpath([target, os.path.abspath(bank_path)]) == os.path.abspath(bank_path)
+                dest = os.path.join(staging_path, rel_path) if in_bank else target
+                if not in_bank and os.path.isfile(dest):
+                    return
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                tmp_path = os.path.join(os.path.dirname(dest), f".{os.path.basename(dest)}.{uuid.uuid4().hex}")
+                try:
+                    self.remote.download(self.get_key(target), tmp_path)
+                    os.replace(tmp_path, dest)
+                finally:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+
+            self._transfer(fetch, rel_paths)
+            if not check_files(staging_path, metadata):
+                raise Exception(f"Bank {bank_path} fetched from the remote store is incomplete!")
+            write_bank_metadata(bank_path=staging_path, data=metadata)
+        return True
+
+    def push_bank(self, bank_path: str):
+        """
+        Copy a local bank to the remote store.
+
+        :param bank_path: local bank full path
+        :type bank_path: str
+        """
+        bank_key = self.get_key(bank_path)
+        metadata_path = os.path.join(bank_path, METADATA_FILENAME)
+        with open(metadata_path, "r") as mf:
+            metadata = json.load(mf)
+
+        files = metadata.get(FILES_KEY)
+        if files is None:
+            file_paths = list_bank_files(bank_path, exclude=[METADATA_FILENAME])
+        else:
+            file_paths = [os.path.normpath(os.path.join(bank_path, rel_path)) for rel_path in files]
+
+        def push(file_path: str):
+            key = self.get_key(file_path)
+            in_bank = key.startswith(f"{bank_key}/")
+            # blobs are immutable, the ones already stored are skipped
+            if not in_bank and self.remote.exists(key):
+                return
+            self.remote.upload(file_path, key)
+
+        self._transfer(push, file_paths)
+        self.remote.upload(metadata_path, f"{bank_key}/{METADATA_FILENAME}")
+        _logger.info(f"{bank_path} pushed to the remote store ({len(file_paths)} files)")
+
+
+_tiered_storages: Dict[Tuple[str, str], TieredStorage] = dict()
+_tiered_storages_lock = threading.Lock()
+
+
+def get_tiered_storage(
+    cache_path: str, remote_conf: Dict[str, Any], workers: int = DEFAULT_STORAGE_WORKERS
+) -> TieredStorage:
+    """
+    Get the process-wide tiered storage of a cache, its connection pool is shared by all the nodes.
+
+    :param cache_path: root path of the local cache
+    :type cache_path: str
+    :param remote_conf: configuration of the remote backend, see ``make_storage_backend``
+    :type remote_conf: Dict[str, Any]
+    :param workers: number of parallel transfers
+    :type workers: int
+    :return: tiered storage
+    :rtype: TieredStorage
+    """
+    key = (os.path.abspath(cache_path), json.dumps([remote_conf, workers], sort_keys=True))
+    with _tiered_storages_lock:
+        storage = _tiered_storages.get(key)
+        if storage is None:
+            storage = _tiered_storages[key] = TieredStorage(
+                cache_path, make_storage_backend(remote_conf, workers=workers), workers=workers
+            )
+        return storage
@@ -0,0 +1,143 @@
+"""In-memory cache of loaded banks."""
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import torch
+
+TensorCacheKey = Tuple[str, int]
+
+
+class TensorCache:
+    """
+    LRU cache of bank tensors bounded by a byte budget.
+
+    Entries are keyed by ``(bank_path, metadata_mtime)`` so a rewritten bank
+    never serves stale images.
+    """
+
+    def __init__(self, max_bytes: int = 0):
+        """
+        Create the cache.
+
+        :param max_bytes: byte budget, 0 disables the cache
+        :type max_bytes: int
+        """
+        self._entries: "OrderedDict[TensorCacheKey, torch.Tensor]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._max_bytes = max_bytes
+        self._current_bytes = 0
+
+    @property
+    def max_bytes(self) -> int:
+        """Get the byte budget."""
+        return self._max_bytes
+
+    @property
+    def current_bytes(self) -> int:
+        """Get the number of bytes currently held."""
+        return self._current_bytes
+
+    def resize(self, max_bytes: int):
+        """
+        Change the byte budget, evicting entries if needed.
+
+        :param max_bytes: byte budget, 0 disables the cache
+        :type max_bytes: int
+        """
+        with self._lock:
+            self._max_bytes = max_bytes
+            self._evict()
+
+    def get(self, key: TensorCacheKey) -> Optional[torch.Tensor]:
+        """
+        Get a cached tensor.
+
+        :param key: (bank_path, metadata_mtime)
+        :type key: TensorCacheKey
+        :return: cached tensor if any
+        :rtype: Optional[torch.Tensor]
+        """
+        with self._lock:
+            tensor = self._entries.get(key)
+            if tensor is not None:
+                self._entries.move_to_end(key)
+            return tensor
+
+    def put(self, key: TensorCacheKey, tensor: torch.Tensor):
+        """
+        Add a tensor to the cache.
+
+        Tensors larger than the budget are not cached.
+
+        :param key: (bank_path, metadata_mtime)
+        :type key: TensorCacheKey
+        :param tensor: tensor to cache
+        :type tensor: torch.Tensor
+        """
+        size = tensor.element_size() * tensor.nelement()
+        with self._lock:
+            if size > self._max_bytes:
+                return
+            self._remove(key)
+            self._entries[key] = tensor
+            self._current_bytes += size
+            self._evict()
+
+    def invalidate(self, bank_path: str):
+        """
+        Remove all the entries of a bank.
+
+        :param bank_path: bank full path
+        :type bank_path: str
+        """
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == bank_path]:
+                self._remove(key)
+
+    def _remove(self, key: TensorCacheKey):
+        tensor = self._entries.pop(key, None)
+        if tensor is not None:
+            self._current_bytes -= tensor.element_size() * tensor.nelement()
+
+    def _evict(self):
+        while self._current_bytes > self._max_bytes and self._entries:
+            _, tensor = self._entries.popitem(last=False)
+            self._current_bytes -= tensor.element_size() * tensor.nelement()
+
+
+_tensor_caches: Dict[str, TensorCache] = dict()
+_tensor_caches_lock = threading.Lock()
+
+
+def get_tensor_cache(cache_name: str, max_bytes: int) -> TensorCache:
+    """
+    Get the process-wide in-memory cache of a configured cache.
+
+    :param cache_name: Name of the cache
+    :type cache_name: str
+    :param max_bytes: byte budget of this cache
+    :type max_bytes: int
+    :return: in-memory cache
+    :rtype: TensorCache
+    """
+    with _tensor_caches_lock:
+        tensor_cache = _tensor_caches.get(cache_name)
+        if tensor_cache is None:
+            tensor_cache = _tensor_caches[cache_name] = TensorCache(max_bytes=max_bytes)
+    if tensor_cache.max_bytes != max_bytes:
+        tensor_cache.resize(max_bytes)
+    return tensor_cache
+
+
+def invalidate_bank(bank_path: str):
+    """
+    Drop a bank from every in-memory cache.
+
+    :param bank_path: bank full path
+    :type bank_path: str
+    """
+    with _tensor_caches_lock:
+        tensor_caches = list(_tensor_caches.values())
+    for tensor_cache in tensor_caches:
+        tensor_cache.invalidate(bank_path)
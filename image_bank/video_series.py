@@ -0,0 +1,95 @@
+"""Lazy representation of chained image banks (VIDEO_SERIES)."""
+from typing import Any, Callable, Dict, List, Optional
+
+import torch
+
+
+def make_serie(
+    bank_name: str,
+    cache_name: str,
+    bank_path: str,
+    num_frames: int,
+    images: Optional[torch.Tensor] = None,
+) -> Dict[str, Any]:
+    """
+    Create a step of a series.
+
+    A step references its persisted bank, images are only kept in memory
+    when the bank has not been persisted.
+
+    :param bank_name: name of the bank
+    :type bank_name: str
+    :param cache_name: name of the cache holding the bank
+    :type cache_name: str
+    :param bank_path: bank full path
+    :type bank_path: str
+    :param num_frames: number of frames of the step
+    :type num_frames: int
+    :param images: images of the step when the bank is not persisted
+    :type images: Optional[torch.Tensor]
+    :return: series step
+    :rtype: Dict[str, Any]
+    """
+    return {
+        "bank_name": bank_name,
+        "cache_name": cache_name,
+        "bank_path": bank_path,
+        "num_frames": num_frames,
+        "images": images,
+    }
+
+
+def get_series_num_frames(series: List[Dict[str, Any]]) -> int:
+    """
+    Get the total number of frames of a series.
+
+    :param series: steps of the series
+    :type series: List[Dict[str, Any]]
+    :return: number of frames
+    :rtype: int
+    """
+    return sum(
+        s["images"].shape[0] if s.get("images") is not None else s.get("num_frames", 0)
+        for s in series
+    )
+
+
+def materialize_series(
+    series: List[Dict[str, Any]],
+    load_bank: Callable[[Dict[str, Any]], torch.Tensor],
+) -> torch.Tensor:
+    """
+    Concatenate the images of all the steps of a series.
+
+    Each step is loaded once and copied once into a preallocated batch.
+
+    :param series: steps of the series
+    :type series: List[Dict[str, Any]]
+    :param load_bank: loads the images of a step whose images are not in memory
+    :type load_bank: Callable[[Dict[str, Any]], torch.Tensor]
+    :return: batch of all the images
+    :rtype: torch.Tensor
+    """
+    if not series:
+        raise Exception("Cannot materialize an empty series!")
+
+    output: Optional[torch.Tensor] = None
+    total = get_series_num_frames(series)
+    offset = 0
+
+    for step in series:
+        images = step.get("images")
+        if images is None:
+            if step.get("bank_path") is None:
+                raise Exception(f"Step of bank '{step.get('bank_name')}' has neither images nor a bank!")
+            images = load_bank(step)
+
+        if output is None:
+            output = torch.empty((total, *images.shape[1:]), dtype=images.dtype, device=images.device)
+        if offset + images.shape[0] > total:
+            raise Exception(f"Bank {step.get('bank_path')} holds more frames than expected!")
+
+        output[offset:offset + images.shape[0]].copy_(images)
+        offset += images.shape[0]
+
+    return output[:offset]  # type: ignore
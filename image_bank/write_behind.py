@@ -0,0 +1,182 @@
+"""Write-behind persistence of image banks."""
+import atexit
+import logging
+import threading
+# imported before the drain is registered, so that its pools shut down after the drain (see _register_drain)
+import concurrent.futures.thread  # noqa: F401
+from queue import Queue
+from typing import Any, Callable, Dict, Optional
+
+import torch
+
+from . import write_bank_metadata
+from .blob_store import save_bank_frames
+from .staging import stage_bank
+
+DEFAULT_MAX_PENDING_BANKS = 2
+
+_logger = logging.getLogger("comfy.custom.persistence.write_behind")
+
+
+class WriteBehindQueue:
+    """
+    Persist banks in a background thread.
+
+    Banks are written in a staging directory renamed into place once
+    complete, so a bank only becomes valid once it has been entirely
+    committed.
+    """
+
+    def __init__(self, max_pending: int = DEFAULT_MAX_PENDING_BANKS):
+        """
+        Create the queue.
+
+        :param max_pending: number of banks that can wait for their commit before ``submit`` blocks
+        :type max_pending: int
+        """
+        self._jobs: Queue = Queue(maxsize=max_pending)
+        self._pending: Dict[str, torch.Tensor] = dict()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(
+        self,
+        bank_path: str,
+        encoder,
+        images: torch.Tensor,
+        metadata: Dict[str, Any],
+        workers: int = 1,
+        on_commit: Optional[Callable[[str], None]] = None,
+        cache_path: Optional[str] = None,
+        options: Optional[Dict[str, Any]] = None,
+        dedup: bool = False,
+        on_finish: Optional[Callable[[str], None]] = None,
+    ):
+        """
+        Queue a bank to be written.
+
+        :param bank_path: bank full path
+        :type bank_path: str
+        :param encoder: ImageEncoder used to save the frames
+        :param images: batch of images to save
+        :type images: torch.Tensor
+        :param metadata: bank metadata, should be Json serializable
+        :type metadata: Dict[str, Any]
+        :param workers: number of encoding threads
+        :type workers: int
+        :param on_commit: called with the bank path once the bank is committed
+        :type on_commit: Optional[Callable[[str], None]]
+        :param cache_path: root path of the cache, the bank is added to its index when set
+        :type cache_path: Optional[str]
+        :param options: encoder options
+        :type options: Optional[Dict[str, Any]]
+        :param dedup: store the frames in the blob store of the cache
+        :type dedup: bool
+        :param on_finish: called with the bank path once the write is over, whether it succeeded or not
+        :type on_finish: Optional[Callable[[str], None]]
+        """
+        with self._lock:
+            self._pending[bank_path] = images
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="persistence-write-behind", daemon=True)
+                self._thread.start()
+
+        # blocks while too many banks are waiting (back-pressure)
+        self._jobs.put(
+            (bank_path, encoder, images, metadata, workers, on_commit, cache_path, options, dedup, on_finish)
+        )
+
+    def get_pending(self, bank_path: str) -> Optional[torch.Tensor]:
+        """
+        Get the images of a bank that has not been committed yet.
+
+        :param bank_path: bank full path
+        :type bank_path: str
+        :return: Batch of images if the bank is pending
+        :rtype: Optional[torch.Tensor]
+        """
+        with self._lock:
+            return self._pending.get(bank_path)
+
+    def is_pending(self, bank_path: str) -> bool:
+        """
+        Check if a bank is waiting for its commit.
+
+        :param bank_path: bank full path
+        :type bank_path: str
+        :return: Whether the bank is pending
+        :rtype: bool
+        """
+        return self.get_pending(bank_path) is not None
+
+    def flush(self):
+        """Wait until all the queued banks are committed."""
+        self._jobs.join()
+
+    def _run(self):
+        while True:
+            (
+                bank_path, encoder, images, metadata, workers, on_commit, cache_path, options, dedup, on_finish
+            ) = self._jobs.get()
+            try:
+                try:
+                    self._write(bank_path, encoder, images, metadata, workers, cache_path, options, dedup)
+                except RuntimeError as e:
+                    if workers == 1:
+                        raise
+                    # thread pools refuse new work once the interpreter exits, encode in this thread instead
+                    _logger.warning(f"Unable to write bank {bank_path} with {workers} workers ({e}), retrying with one")
+                    self._write(bank_path, encoder, images, metadata, 1, cache_path, options, dedup)
+                _logger.info(f"{bank_path} committed")
+                if on_commit is not None:
+                    on_commit(bank_path)
+            except Exception as e:
+                _logger.exception(f"Unable to write bank {bank_path}: {e}")
+            finally:
+                with self._lock:
+                    if self._pending.get(bank_path) is images:
+                        del self._pending[bank_path]
+                if on_finish is not None:
+                    on_finish(bank_path)
+                self._jobs.task_done()
+
+    @staticmethod
+    def _write(bank_path, encoder, images, metadata, workers, cache_path, options, dedup):
+        with stage_bank(bank_path, cache_path=cache_path) as staging_path:
+            save_bank_frames(encoder, images, staging_path, metadata, workers=workers, options=options, dedup=dedup)
+            write_bank_metadata(bank_path=staging_path, data=metadata)
+
+
+_write_behind_queue = WriteBehindQueue()
+
+
+def get_write_behind_queue() -> WriteBehindQueue:
+    """
+    Get the process-wide write-behind queue.
+
+    :return: write-behind queue
+    :rtype: WriteBehindQueue
+    """
+    return _write_behind_queue
+
+
+def _drain_write_behind_queue():
+    # make sure pending banks are committed before the server stops
+    _write_behind_queue.flush()
+
+
+def _register_drain():
+    # The encoders run on thread pools, which refuse new work once concurrent.futures has shut down. Since
+    # Python 3.9, concurrent.futures shuts down from a threading exit hook, before atexit callbacks run and
+    # before non-daemon threads are joined, so the only hook running ahead of it is the private
+    # threading._register_atexit (hooks run in reverse order). Earlier versions shut down from atexit, where
+    # this drain, registered after concurrent.futures.thread is imported, runs first. If the drain still runs
+    # too late, the worker writes the remaining banks without pool.
+    register = getattr(threading, "_register_atexit", None)
+    if register is not None:
+        register(_drain_write_behind_queue)
+    else:
+        atexit.register(_drain_write_behind_queue)
+
+
+_register_drain()
@@ -0,0 +1,139 @@
+import os
+import json
+import shutil
+import time
+import threading
+import pytest
+from pathlib import Path
+
+from image_bank import METADATA_FILENAME, get_banks, write_bank_metadata
+from image_bank.bank_index import BankIndex, BANK_INDEX_FILENAME
+from image_bank.bank_lock import file_lock
+
+
+def _make_bank(cache_path: Path, bank_name: str, bank_id: str, num_frames: int = 1) -> Path:
+    bank_path = cache_path / bank_name / bank_id
+    bank_path.mkdir(parents=True)
+    (bank_path / METADATA_FILENAME).write_text(json.dumps({"bank_config": {"num_frames": num_frames}}))
+    return bank_path
+
+
+def _bank_keys(banks):
+    return sorted(f"{b['bank_name']}/{b['bank_id']}" for b in banks)
+
+
+@pytest.mark.unit
+class TestBankIndex:
+    """Tests for the bank index."""
+
+    def test_scan_existing_banks(self, tmp_path: Path):
+        _make_bank(tmp_path, "a", "step1")
+        _make_bank(tmp_path, "a", "step2")
+        _make_bank(tmp_path, "b", "x")
+        # invalid bank, no metadata
+        (tmp_path / "b" / "y").mkdir()
+
+        assert _bank_keys(BankIndex(str(tmp_path)).get_banks()) == ["a/step1", "a/step2", "b/x"]
+        assert os.path.isfile(tmp_path / BANK_INDEX_FILENAME)
+
+    def test_index_is_reused_and_updated(self, tmp_path: Path):
+        _make_bank(tmp_path, "a", "step1")
+        BankIndex(str(tmp_path)).get_banks()
+
+        # a new index replays the log, only the changed directory is rescanned
+        _make_bank(tmp_path, "c", "z")
+        index = BankIndex(str(tmp_path))
+        assert _bank_keys(index.get_banks()) == ["a/step1", "c/z"]
+
+        os.remove(tmp_path / "c" / "z" / METADATA_FILENAME)
+        os.rmdir(tmp_path / "c" / "z")
+        assert _bank_keys(index.get_banks()) == ["a/step1"]
+
+    def test_write_bank_metadata_updates_index(self, tmp_path: Path):
+        get_banks(str(tmp_path))
+        bank_path = tmp_path / "a" / "step1"
+        bank_path.mkdir(parents=True)
+        write_bank_metadata(str(bank_path), {"bank_config": {"num_frames": 3}}, cache_path=str(tmp_path))
+
+        banks = get_banks(str(tmp_path))
+        assert _bank_keys(banks) == ["a/step1"]
+        assert banks[0]["metadata"]["bank_config"]["num_frames"] == 3
+
+    def test_compact(self, tmp_path: Path):
+        _make_bank(tmp_path, "a", "step1")
+        index = BankIndex(str(tmp_path))
+        for i in range(10):
+            index.put("a", "step1", {"bank_config": {"num_frames": i}})
+        index.compact()
+
+        with open(tmp_path / BANK_INDEX_FILENAME) as fi:
+            assert len(fi.readlines()) == 1
+        assert BankIndex(str(tmp_path)).get_banks()[0]["metadata"]["bank_config"]["num_frames"] == 9
+
+    def test_entries_are_revalidated(self, tmp_path: Path):
+        bank_path = _make_bank(tmp_path, "a", "step1")
+        _make_bank(tmp_path, "a", "step2")
+        index = BankIndex(str(tmp_path))
+        assert _bank_keys(index.get_banks()) == ["a/step1", "a/step2"]
+
+        # metadata rewritten in place, the bank name directory is unchanged
+        stat = os.stat(bank_path / METADATA_FILENAME)
+        (bank_path / METADATA_FILENAME).write_text(json.dumps({"bank_config": {"num_frames": 5}}))
+        os.utime(bank_path / METADATA_FILENAME, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+        # listing the banks does not stat every bank, the rewrite is seen once the bank is read
+        banks = {b["bank_id"]: b for b in index.get_banks()}
+        assert banks["step1"]["metadata"]["bank_config"]["num_frames"] == 1
+        index.touch("a", "step1")
+        banks = {b["bank_id"]: b for b in index.get_banks()}
+        assert banks["step1"]["metadata"]["bank_config"]["num_frames"] == 5
+
+        # bank invalidated while its folder stays
+        os.remove(tmp_path / "a" / "step2" / METADATA_FILENAME)
+        index.touch("a", "step2")
+        assert _bank_keys(index.get_banks()) == ["a/step1"]
+
+        # bank replaced by a commit, which changes the bank name directory
+        staging_path = _make_bank(tmp_path, "a", ".staging-step1", num_frames=8)
+        shutil.rmtree(bank_path)
+        os.rename(staging_path, bank_path)
+        banks = {b["bank_id"]: b for b in index.get_banks()}
+        assert banks["step1"]["metadata"]["bank_config"]["num_frames"] == 8
+        assert _bank_keys(BankIndex(str(tmp_path)).get_banks()) == ["a/step1"]
+
+    def test_compaction_excludes_appends(self, tmp_path: Path):
+        _make_bank(tmp_path, "a", "step1")
+        _make_bank(tmp_path, "a", "step2")
+        index = BankIndex(str(tmp_path))
+        index.get_banks()
+
+        other = BankIndex(str(tmp_path))
+        with file_lock(index.lock_path, exclusive=True):
+            # another worker appends while the log is being compacted
+            writer = threading.Thread(target=other.put, args=("a", "step2", {"bank_config": {"num_frames": 7}}))
+            writer.start()
+            time.sleep(0.2)
+            assert writer.is_alive()
+        writer.join()
+        index.compact()
+
+        banks = {b["bank_id"]: b for b in BankIndex(str(tmp_path)).get_banks()}
+        assert banks["step2"]["metadata"]["bank_config"]["num_frames"] == 7
+
+    def test_size_and_touch(self, tmp_path: Path):
+        bank_path = _make_bank(tmp_path, "a", "step1")
+        (bank_path / "0.webp").write_bytes(b"x" * 100)
+        index = BankIndex(str(tmp_path))
+        index.put("a", "step1", {"bank_config": {"num_frames": 1}})
+
+        bank = index.get_banks()[0]
+        assert bank["size"] >= 100
+        atime = bank["atime"]
+
+        # accesses are rate limited
+        index.touch("a", "step1", atime=atime + 1)
+        assert index.get_banks()[0]["atime"] == atime
+        index.touch("a", "step1", atime=atime + 3600)
+        assert BankIndex(str(tmp_path)).get_banks()[0]["atime"] == atime + 3600
+
+        index.compact()
+        assert BankIndex(str(tmp_path)).get_banks()[0]["atime"] == atime + 3600
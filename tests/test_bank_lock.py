@@ -0,0 +1,147 @@
+import os
+import sys
+import time
+import threading
+import subprocess
+import pytest
+from pathlib import Path
+
+from image_bank.bank_lock import (
+    LOCK_SUFFIX,
+    BankLock,
+    acquire_bank_lock,
+    disown_bank_lock,
+    is_bank_lock_held,
+    release_bank_lock,
+    release_prompt_bank_locks,
+    release_stale_bank_locks,
+)
+
+
+@pytest.mark.unit
+class TestBankLock:
+    """Tests for the cross-process locks of banks."""
+
+    def test_exclusive(self, tmp_path: Path):
+        bank_path = str(tmp_path / "bank_name" / "bank_id")
+        first = BankLock(bank_path)
+        second = BankLock(bank_path)
+
+        assert first.acquire()
+        assert os.path.isfile(f"{bank_path}{LOCK_SUFFIX}")
+        assert not second.acquire()
+        assert not second.acquire(timeout=0.2)
+
+        first.release()
+        assert second.acquire()
+        second.release()
+
+    def test_wait_for_release(self, tmp_path: Path):
+        bank_path = str(tmp_path / "bank_name" / "bank_id")
+        first = BankLock(bank_path)
+        assert first.acquire()
+
+        timer = threading.Timer(0.2, first.release)
+        timer.start()
+        second = BankLock(bank_path)
+        start = time.monotonic()
+        assert second.acquire(timeout=5)
+        assert time.monotonic() - start < 4
+        second.release()
+        timer.join()
+
+    def test_lock_file_removed(self, tmp_path: Path):
+        bank_path = str(tmp_path / "bank_name" / "bank_id")
+        assert acquire_bank_lock(bank_path)
+        release_bank_lock(bank_path)
+        assert not os.path.exists(f"{bank_path}{LOCK_SUFFIX}")
+
+    def test_waiter_on_removed_lock_file(self, tmp_path: Path):
+        bank_path = str(tmp_path / "bank_name" / "bank_id")
+        first = BankLock(bank_path)
+        assert first.acquire()
+
+        # the waiter retries on a new lock file once the first one is removed
+        timer = threading.Timer(0.2, first.release)
+        timer.start()
+        second = BankLock(bank_path)
+        assert second.acquire(timeout=5)
+        timer.join()
+        assert os.path.isfile(f"{bank_path}{LOCK_SUFFIX}")
+        assert not BankLock(bank_path).acquire()
+        second.release()
+
+    def test_registry(self, tmp_path: Path):
+        bank_path = str(tmp_path / "bank_name" / "bank_id")
+        assert not is_bank_lock_held(bank_path)
+        assert acquire_bank_lock(bank_path)
+        assert is_bank_lock_held(bank_path)
+        # reentrant within the process
+        assert acquire_bank_lock(bank_path)
+        assert not BankLock(bank_path).acquire()
+
+        release_bank_lock(bank_path)
+        assert not is_bank_lock_held(bank_path)
+        release_bank_lock(bank_path)
+        assert BankLock(bank_path).acquire()
+
+    def test_stale_locks(self, tmp_path: Path):
+        failed_prompt, next_prompt = {"1": {}}, {"1": {}}
+        failed_path = str(tmp_path / "bank_name" / "failed")
+        written_path = str(tmp_path / "bank_name" / "written")
+        current_path = str(tmp_path / "bank_name" / "current")
+        assert acquire_bank_lock(failed_path, owner=failed_prompt)
+        assert acquire_bank_lock(written_path, owner=failed_prompt)
+        disown_bank_lock(written_path)
+        assert acquire_bank_lock(current_path, owner=next_prompt)
+
+        # equal prompts are different runs
+        assert release_stale_bank_locks(next_prompt) == 1
+        assert not is_bank_lock_held(failed_path)
+        assert BankLock(failed_path).acquire()
+        assert is_bank_lock_held(written_path)
+        assert is_bank_lock_held(current_path)
+
+        # a lock acquired again moves to the new prompt
+        assert acquire_bank_lock(written_path, owner=next_prompt)
+        assert release_stale_bank_locks({}) == 2
+        assert not is_bank_lock_held(written_path)
+        assert not is_bank_lock_held(current_path)
+
+    def test_prompt_locks(self, tmp_path: Path):
+        prompt = {"1": {}}
+        failed_path = str(tmp_path / "bank_name" / "failed")
+        written_path = str(tmp_path / "bank_name" / "written")
+        assert acquire_bank_lock(failed_path, owner=prompt)
+        assert acquire_bank_lock(written_path, owner=prompt)
+        disown_bank_lock(written_path)
+
+        assert release_prompt_bank_locks() == 1
+        assert not is_bank_lock_held(failed_path)
+        assert not os.path.exists(f"{failed_path}{LOCK_SUFFIX}")
+        assert is_bank_lock_held(written_path)
+        assert release_prompt_bank_locks() == 0
+        release_bank_lock(written_path)
+
+    def test_other_process(self, tmp_path: Path):
+        bank_path = str(tmp_path / "bank_name" / "bank_id")
+        script = (
+            "import sys, time\n"
+            "from image_bank.bank_lock import BankLock\n"
+            "lock = BankLock(sys.argv[1])\n"
+            "assert lock.acquire()\n"
+            "print('locked', flush=True)\n"
+            "time.sleep(60)\n"
+        )
+        root = str(Path(__file__).parent.parent)
+        proc = subprocess.Popen([sys.executable, "-c", script, bank_path], cwd=root, stdout=subprocess.PIPE, text=True)
+        try:
+            assert proc.stdout.readline().strip() == "locked"
+            assert not acquire_bank_lock(bank_path, timeout=0.2)
+        finally:
+            proc.kill()
+            proc.wait()
+
+        # the lock dies with its holder
+        assert acquire_bank_lock(bank_path, timeout=5)
+        release_bank_lock(bank_path)
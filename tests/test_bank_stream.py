@@ -0,0 +1,68 @@
+import pytest
+import torch
+from pathlib import Path
+
+from image_bank import is_bank_valid, read_bank_metadata
+from image_bank.bank_stream import BankReader, BankWriter
+from encoders.safetensor_image_encoder import SafetensorsImageEncoder
+from encoders.safetensor_bank_encoder import SafetensorsBankEncoder
+from encoders.raw_image_encoder import RawImageEncoder
+from encoders.packed_image_encoder import PackedImageEncoder
+
+
+@pytest.mark.unit
+class TestBankStream:
+    """Tests for the streaming reader and writer."""
+
+    @pytest.fixture(params=[SafetensorsImageEncoder, SafetensorsBankEncoder], ids=lambda c: c.__name__)
+    def encoder(self, request, monkeypatch):
+        monkeypatch.setattr(SafetensorsBankEncoder, "CHUNK_FRAMES", 2)
+        return request.param
+
+    @pytest.fixture
+    def images(self) -> torch.Tensor:
+        return torch.rand((7, 4, 4, 3))
+
+    def test_write_then_read(self, encoder, images: torch.Tensor, tmp_path: Path):
+        bank_path = str(tmp_path / "bank")
+        with BankWriter(bank_path, encoder, bank_config={"seed": 1}, workers=2) as writer:
+            writer.write(images[0])
+            writer.write(images[1:5])
+            assert is_bank_valid(bank_path) is False
+            writer.write(images[5:])
+
+        metadata = read_bank_metadata(bank_path)
+        assert metadata["bank_config"] == {"seed": 1, "num_frames": 7}
+        assert metadata["encoder"] == encoder.get_name()
+
+        chunks = list(BankReader(bank_path, encoder, chunk_size=3))
+        assert [c.shape[0] for c in chunks] == [3, 3, 1]
+        assert torch.equal(torch.cat(chunks), images)
+        assert torch.equal(torch.stack(list(BankReader(bank_path, encoder, prefetch=0).frames())), images)
+
+    def test_not_committed_on_error(self, encoder, images: torch.Tensor, tmp_path: Path):
+        bank_path = str(tmp_path / "bank")
+        with pytest.raises(RuntimeError):
+            with BankWriter(bank_path, encoder) as writer:
+                writer.write(images)
+                raise RuntimeError("generation failed")
+
+        assert is_bank_valid(bank_path) is False
+
+    @pytest.mark.parametrize("container", [PackedImageEncoder, RawImageEncoder], ids=lambda c: c.__name__)
+    def test_write_container(self, container, images: torch.Tensor, tmp_path: Path):
+        bank_path = str(tmp_path / "bank")
+        with BankWriter(bank_path, container, workers=2) as writer:
+            writer.write(images[:3])
+            writer.write(images[3:])
+        assert sorted(p.name for p in Path(bank_path).iterdir()) == ["frames" + container.file_extension(), "metadata.json"]
+
+        # same frames as a container written at once
+        expected_path = tmp_path / "expected"
+        expected_path.mkdir()
+        container.save_frames(images, str(expected_path))
+        expected = container.load_frames(str(expected_path), 7)
+
+        assert torch.equal(container.load_frames(bank_path, 7, workers=2), expected)
+        assert torch.equal(container.load_frame(bank_path, -2), expected[-2])
+        assert torch.equal(torch.cat(list(BankReader(bank_path, container, chunk_size=3))), expected)
@@ -0,0 +1,116 @@
+import os
+import pytest
+import torch
+from pathlib import Path
+
+from image_bank import write_bank_metadata, read_bank_metadata
+from image_bank.blob_store import (
+    FRAMES_KEY,
+    get_blobs_path,
+    hash_frame,
+    load_bank_frame,
+    load_bank_frame_range,
+    load_bank_frames,
+    save_bank_frames,
+    save_blobs,
+)
+from image_bank.bank_stream import BankReader, BankWriter
+from encoders.pil_image_encoder import PilImageEncoder
+from encoders.safetensor_image_encoder import SafetensorsImageEncoder
+from encoders.png_image_encoder import PngImageEncoder
+from encoders.packed_image_encoder import PackedImageEncoder
+
+
+def count_blobs(blobs_path: str) -> int:
+    return sum(len(files) for _, _, files in os.walk(blobs_path))
+
+
+@pytest.mark.unit
+class TestBlobStore:
+    """Tests for the content-addressed frame store."""
+
+    @pytest.fixture
+    def images(self) -> torch.Tensor:
+        return torch.rand((4, 8, 8, 3))
+
+    def test_blobs_path(self, tmp_path: Path):
+        assert get_blobs_path(str(tmp_path / "bank_name" / "bank_id")) == str(tmp_path / ".blobs")
+
+    def test_hash_frame(self, images: torch.Tensor):
+        assert hash_frame(images[0]) == hash_frame(images[0].clone())
+        assert hash_frame(images[0]) != hash_frame(images[1])
+        assert hash_frame(images[0]) != hash_frame(images[0], b"salt")
+        assert hash_frame(images[0]) != hash_frame(images[0].half())
+
+    def test_shared_frames_are_stored_once(self, images: torch.Tensor, tmp_path: Path):
+        blobs_path = str(tmp_path / ".blobs")
+        keys = save_blobs(SafetensorsImageEncoder, images, blobs_path, workers=2)
+        assert count_blobs(blobs_path) == 4
+
+        # the last frame of a step starts the next one
+        next_keys = save_blobs(SafetensorsImageEncoder, torch.cat([images[-1:], images[-1:]]), blobs_path)
+        assert next_keys == [keys[-1], keys[-1]]
+        assert count_blobs(blobs_path) == 4
+
+    def test_blobs_depend_on_options(self, images: torch.Tensor, tmp_path: Path):
+        blobs_path = str(tmp_path / ".blobs")
+        keys = save_blobs(PilImageEncoder, images[:1], blobs_path)
+        assert save_blobs(PilImageEncoder, images[:1], blobs_path, options={"quality": 10}) != keys
+        assert count_blobs(blobs_path) == 2
+
+    @pytest.mark.parametrize("dedup", [True, False])
+    def test_bank_round_trip(self, images: torch.Tensor, tmp_path: Path, dedup: bool):
+        bank_path = str(tmp_path / "bank_name" / "bank_id")
+        os.makedirs(bank_path)
+        metadata = {"encoder": PngImageEncoder.get_name(), "bank_config": {"num_frames": 4}}
+        save_bank_frames(PngImageEncoder, images, bank_path, metadata, workers=2, dedup=dedup)
+        write_bank_metadata(bank_path, metadata)
+
+        assert (FRAMES_KEY in read_bank_metadata(bank_path)) is dedup
+        assert os.path.isdir(tmp_path / ".blobs") is dedup
+
+        expected = PilImageEncoder.to_uint8_array(images)
+        frames = load_bank_frames(PngImageEncoder, bank_path, metadata, 4, workers=2)
+        assert frames.numpy().tolist() == expected.tolist()
+        assert load_bank_frame(PngImageEncoder, bank_path, metadata, 2).numpy().tolist() == expected[2].tolist()
+        assert load_bank_frame_range(PngImageEncoder, bank_path, metadata, 1, 3).numpy().tolist() == expected[1:3].tolist()
+
+    def test_num_frames_mismatch(self, images: torch.Tensor, tmp_path: Path):
+        bank_path = str(tmp_path / "bank_name" / "bank_id")
+        metadata = dict()
+        save_bank_frames(SafetensorsImageEncoder, images, bank_path, metadata, dedup=True)
+
+        with pytest.raises(Exception):
+            load_bank_frames(SafetensorsImageEncoder, bank_path, metadata, 5)
+
+    def test_packed_banks_not_deduplicated(self, images: torch.Tensor, tmp_path: Path):
+        bank_path = str(tmp_path / "bank_name" / "bank_id")
+        os.makedirs(bank_path)
+        metadata = {"encoder": PackedImageEncoder.get_name(), "bank_config": {"num_frames": 4}}
+        save_bank_frames(PackedImageEncoder, images, bank_path, metadata, dedup=True)
+
+        assert FRAMES_KEY not in metadata
+        assert not os.path.isdir(tmp_path / ".blobs")
+        assert load_bank_frames(PackedImageEncoder, bank_path, metadata, 4).shape[0] == 4
+
+        with BankWriter(str(tmp_path / "bank_name" / "streamed"), PackedImageEncoder, dedup=True) as writer:
+            writer.write(images)
+        assert FRAMES_KEY not in read_bank_metadata(str(tmp_path / "bank_name" / "streamed"))
+        assert not os.path.isdir(tmp_path / ".blobs")
+
+    def test_no_temporary_files_left(self, images: torch.Tensor, tmp_path: Path):
+        blobs_path = tmp_path / ".blobs"
+        save_blobs(SafetensorsImageEncoder, images, str(blobs_path))
+
+        assert not [p for p in blobs_path.rglob("*") if p.name.startswith(".")]
+
+    def test_stream(self, images: torch.Tensor, tmp_path: Path):
+        bank_path = str(tmp_path / "bank_name" / "bank_id")
+        with BankWriter(bank_path, SafetensorsImageEncoder, workers=2, dedup=True) as writer:
+            writer.write(images)
+            writer.write(images[0])
+
+        assert len(read_bank_metadata(bank_path)[FRAMES_KEY]) == 5
+        assert count_blobs(str(tmp_path / ".blobs")) == 4
+        frames = torch.cat(list(BankReader(bank_path, SafetensorsImageEncoder, chunk_size=2)))
+        assert torch.equal(frames, torch.cat([images, images[:1]]))
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+import torch
+
+from image.color_transfer import hm_mvgd_hm, match_gaussian, match_histograms, transfer_colors
+
+
+@pytest.mark.unit
+class TestColorTransfer:
+    """Tests for the hm-mvgd-hm color transfer."""
+
+    @pytest.fixture
+    def frames(self) -> torch.Tensor:
+        generator = torch.Generator().manual_seed(0)
+        base = torch.rand((1, 16, 16, 3), generator=generator)
+        # the same content drifting towards red
+        drift = torch.tensor([0.0, 0.1, 0.2, 0.3]).reshape(4, 1, 1, 1) * torch.tensor([1.0, -0.5, -0.5])
+        return (base * 0.6 + 0.2 + drift).clamp(0, 1)
+
+    def test_match_histograms(self, frames: torch.Tensor):
+        matched = match_histograms(frames[1], frames[0])
+        for ch in range(3):
+            torch.testing.assert_close(matched[..., ch].flatten().sort().values, frames[0][..., ch].flatten().sort().values)
+        # equal values stay equal
+        flat = match_histograms(torch.full((4, 4, 3), 0.5), frames[0])
+        assert torch.all(flat == flat[0, 0])
+
+    @pytest.mark.parametrize("levels", [0, 255, 7])
+    def test_match_histograms_as_numpy(self, levels: int):
+        generator = torch.Generator().manual_seed(levels)
+        source, reference = torch.rand((32, 40, 3), generator=generator), torch.rand((20, 30, 3), generator=generator) ** 2
+        if levels:
+            source, reference = (source * levels).round() / levels, (reference * levels).round() / levels
+
+        # reference implementation over the unique values of each channel
+        expected = np.empty(source.shape)
+        for ch in range(3):
+            src_values, src_inverse, src_counts = np.unique(source[..., ch].numpy(), return_inverse=True, return_counts=True)
+            ref_values, ref_counts = np.unique(reference[..., ch].numpy(), return_counts=True)
+            mapped = np.interp(np.cumsum(src_counts) / src_inverse.size, np.cumsum(ref_counts) / ref_counts.sum(), ref_values)
+            expected[..., ch] = mapped[src_inverse].reshape(source.shape[:-1])
+
+        np.testing.assert_allclose(match_histograms(source, reference).numpy(), expected, atol=1e-6)
+
+    def test_match_gaussian(self, frames: torch.Tensor):
+        matched = match_gaussian(frames[3], frames[0]).reshape(-1, 3).double()
+        ref = frames[0].reshape(-1, 3).double()
+        torch.testing.assert_close(matched.mean(0), ref.mean(0), atol=1e-5, rtol=0)
+        torch.testing.assert_close(torch.cov(matched.T), torch.cov(ref.T), atol=1e-5, rtol=0)
+
+    def test_hm_mvgd_hm(self, frames: torch.Tensor):
+        matched = hm_mvgd_hm(frames[2], frames[0])
+        assert matched.shape == frames[2].shape
+        assert (matched.mean((0, 1)) - frames[0].mean((0, 1))).abs().max() < 1e-3
+
+    def test_transfer_colors(self, frames: torch.Tensor):
+        result = transfer_colors(frames, strength=1.0)
+        assert result.shape == frames.shape and result.dtype == torch.float32
+        assert torch.equal(result[0], frames[0])
+        assert result.min() >= 0 and result.max() <= 1
+        # the drift is removed along the whole sequence
+        drift = (result.mean((1, 2)) - frames[0].mean((0, 1))).abs().max()
+        assert drift < 1e-2 < (frames.mean((1, 2)) - frames[0].mean((0, 1))).abs().max()
+
+    def test_strength(self, frames: torch.Tensor):
+        torch.testing.assert_close(transfer_colors(frames, strength=0.0), frames)
+        half = transfer_colors(frames[:2], strength=0.5)[1]
+        torch.testing.assert_close(half, torch.lerp(frames[1], hm_mvgd_hm(frames[1], frames[0]), 0.5).clamp(0, 1))
+
+    def test_long_sequence(self, frames: torch.Tensor):
+        # frames are sorted by chunks, the result does not depend on them
+        sequence = torch.cat([frames, frames.flip(0), frames, frames.flip(0)])
+        expected = sequence.clone()
+        for idx in range(1, sequence.shape[0]):
+            expected[idx] = hm_mvgd_hm(sequence[idx], expected[idx - 1]).clamp(0, 1)
+        torch.testing.assert_close(transfer_colors(sequence), expected)
+
+    def test_single_frame(self, frames: torch.Tensor):
+        assert transfer_colors(frames[0]).shape == (1, 16, 16, 3)
+        with pytest.raises(ValueError):
+            transfer_colors(torch.rand(3, 3))
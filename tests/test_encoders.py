@@ -8,9 +8,14 @@ from typing import Dict
 from pathlib import Path
 from PIL import Image
 from safetensors.torch import save_file
-from encoders.image_encoder import ImageEncoder
+from encoders.image_encoder import ImageEncoder, as_image_batch, run_bounded, to_float_images, to_storage_dtype
 from encoders.pil_image_encoder import PilImageEncoder
 from encoders.safetensor_image_encoder import SafetensorsImageEncoder
+from encoders.packed_image_encoder import PackedImageEncoder
+from encoders.safetensor_bank_encoder import SafetensorsBankEncoder
+from encoders.raw_image_encoder import RawImageEncoder
+from encoders.lossless_webp_image_encoder import LosslessWebpImageEncoder
+from encoders.png_image_encoder import PngImageEncoder
 
 
 @pytest.mark.unit
@@ -44,6 +49,22 @@ class TestPilEncoder:
 
         output[SafetensorsImageEncoder.file_extension()] = str(tmp_path / "img")
 
+        # packed format
+        PackedImageEncoder.save_image(tensor_img, str(tmp_path / "img"))
+        output[PackedImageEncoder.file_extension()] = str(tmp_path / "img")
+
+        # chunked safetensors format
+        SafetensorsBankEncoder.save_image(tensor_img, str(tmp_path / "img"))
+        output[SafetensorsBankEncoder.file_extension()] = str(tmp_path / "img")
+
+        # uncompressed safetensors format
+        RawImageEncoder.save_image(tensor_img, str(tmp_path / "img"))
+        output[RawImageEncoder.file_extension()] = str(tmp_path / "img")
+
+        # png format
+        img.save(tmp_path / "img.png", format="PNG")
+        output[PngImageEncoder.file_extension()] = str(tmp_path / "img")
+
         return output
 
     @pytest.fixture
@@ -53,7 +74,18 @@ class TestPilEncoder:
 
         return torch.from_numpy(image.copy())[None,].squeeze(0)  # removes batch dim
 
-    @pytest.fixture(params=[PilImageEncoder, SafetensorsImageEncoder], ids=lambda c: c.__name__)
+    @pytest.fixture(
+        params=[
+            PilImageEncoder,
+            SafetensorsImageEncoder,
+            PackedImageEncoder,
+            SafetensorsBankEncoder,
+            RawImageEncoder,
+            LosslessWebpImageEncoder,
+            PngImageEncoder,
+        ],
+        ids=lambda c: c.__name__
+    )
     def encoder(self, request):
         return request.param()
 
@@ -68,3 +100,268 @@ class TestPilEncoder:
         encoder.save_image(image=tensor_image, save_path=save_path)
 
         assert os.path.isfile(f"{save_path}{encoder.file_extension()}")
+
+    @pytest.mark.parametrize("workers", [1, 4])
+    def test_load_frames(self, encoder: ImageEncoder, tensor_image: torch.Tensor, tmp_path: Path, workers: int):
+        encoder.save_frames([tensor_image] * 5, str(tmp_path))
+
+        frames = encoder.load_frames(str(tmp_path), 5, workers=workers)
+        assert frames.size() == torch.Size([5, 100, 100, 3])
+        assert torch.allclose(frames[-1], encoder.load_frame(str(tmp_path), 4))
+
+    @pytest.mark.parametrize("workers", [1, 4])
+    def test_save_frames(self, encoder: ImageEncoder, tensor_image: torch.Tensor, tmp_path: Path, workers: int):
+        encoder.save_frames([tensor_image] * 9, str(tmp_path), workers=workers, max_pending=2)
+
+        frames = encoder.load_frames(str(tmp_path), 9, workers=workers)
+        assert frames.size() == torch.Size([9, 100, 100, 3])
+
+    def test_load_frame(self, encoder: ImageEncoder, tmp_path: Path):
+        images = [torch.full((8, 8, 3), v) for v in (0.0, 0.5, 1.0)]
+        encoder.save_frames(images, str(tmp_path))
+
+        assert torch.allclose(to_float_images(encoder.load_frame(str(tmp_path), 1)), images[1], atol=0.02)
+
+    def test_save_frames_with_options(self, encoder: ImageEncoder, tensor_image: torch.Tensor, tmp_path: Path):
+        encoder.save_frames([tensor_image] * 2, str(tmp_path), workers=2, options={"quality": 10})
+
+        assert encoder.load_frames(str(tmp_path), 2).size() == torch.Size([2, 100, 100, 3])
+
+    def test_save_frames_error(self, encoder: ImageEncoder, tensor_image: torch.Tensor, tmp_path: Path):
+        with pytest.raises(Exception):
+            encoder.save_frames([tensor_image] * 4, str(tmp_path / "missing"), workers=2)
+
+    def test_save_frames_batch(self, encoder: ImageEncoder, tmp_path: Path):
+        images = torch.stack([torch.full((8, 8, 3), v) for v in (0.1, 0.4, 0.6, 0.9)])
+        encoder.save_frames(images, str(tmp_path), workers=2)
+
+        assert torch.allclose(to_float_images(encoder.load_frames(str(tmp_path), 4)), images, atol=0.1)
+
+
+@pytest.mark.unit
+class TestBatchImages:
+    """Tests the batch level entry points."""
+
+    @pytest.mark.parametrize("encoder", [PilImageEncoder, SafetensorsImageEncoder])
+    @pytest.mark.parametrize("workers", [1, 3])
+    def test_round_trip(self, encoder: ImageEncoder, workers: int, tmp_path: Path):
+        images = torch.stack([torch.full((8, 8, 3), v) for v in (0.0, 0.2, 0.5, 0.7, 1.0)])
+        paths = [str(tmp_path / f"img{idx}") for idx in range(5)]
+        encoder.save_images(images, paths, workers=workers)
+
+        loaded = encoder.load_images(paths, workers=workers)
+        assert loaded.size() == images.size()
+        assert torch.allclose(to_float_images(loaded), images, atol=0.1)
+        assert torch.allclose(to_float_images(loaded[2]), encoder.load_image(paths[2]))
+
+    def test_pil_batch_matches_single(self, tmp_path: Path):
+        images = torch.rand((3, 8, 8, 3))
+        PilImageEncoder.save_images(images, [str(tmp_path / f"b{idx}") for idx in range(3)])
+        PilImageEncoder.save_image(images[1], str(tmp_path / "s1"))
+
+        assert torch.equal(
+            PilImageEncoder.load_stored_image(str(tmp_path / "b1")),
+            PilImageEncoder.load_stored_image(str(tmp_path / "s1")),
+        )
+
+    def test_pil_rounding(self):
+        image = torch.full((1, 1, 3), 0.999)
+        assert PilImageEncoder.to_uint8_array(image)[0, 0, 0] == 255
+
+    def test_length_mismatch(self, tmp_path: Path):
+        with pytest.raises(Exception):
+            PilImageEncoder.save_images(torch.rand((2, 8, 8, 3)), [str(tmp_path / "img")])
+
+    def test_load_empty(self):
+        with pytest.raises(Exception):
+            PilImageEncoder.load_images([])
+
+    def test_as_image_batch(self):
+        images = torch.rand((2, 4, 4, 3))
+        assert as_image_batch(images) is images
+        assert as_image_batch(images.unbind(0)).size() == images.size()
+        assert as_image_batch(images[0]).size() == torch.Size([1, 4, 4, 3])
+
+    @pytest.mark.parametrize("workers", [1, 4])
+    def test_run_bounded_error(self, workers: int):
+        def func(idx: int):
+            if idx == 3:
+                raise ValueError("boom")
+
+        with pytest.raises(ValueError):
+            run_bounded(func, 10, workers, max_pending=1)
+
+
+@pytest.mark.unit
+class TestPackedEncoder:
+    """Tests PackedImageEncoder."""
+
+    def test_single_file(self, tmp_path: Path):
+        PackedImageEncoder.save_frames([torch.zeros((8, 8, 3))] * 4, str(tmp_path), workers=2)
+        assert os.listdir(tmp_path) == [f"frames{PackedImageEncoder.file_extension()}"]
+
+    def test_load_frame_negative_index(self, tmp_path: Path):
+        images = [torch.zeros((8, 8, 3)), torch.ones((8, 8, 3))]
+        PackedImageEncoder.save_frames(images, str(tmp_path))
+
+        assert torch.equal(to_float_images(PackedImageEncoder.load_frame(str(tmp_path), -1)), images[1])
+        with pytest.raises(IndexError):
+            PackedImageEncoder.load_frame(str(tmp_path), 2)
+
+    def test_num_frames_mismatch(self, tmp_path: Path):
+        PackedImageEncoder.save_frames([torch.zeros((8, 8, 3))] * 2, str(tmp_path))
+        with pytest.raises(Exception):
+            PackedImageEncoder.load_frames(str(tmp_path), 3)
+
+
+@pytest.mark.unit
+class TestSafetensorsEncoder:
+    """Tests SafetensorsImageEncoder."""
+
+    def test_round_trip_of_a_batch_view(self, tmp_path: Path):
+        batch = torch.rand((3, 8, 8, 3))
+        # frames split from a batch are contiguous views with a storage offset
+        SafetensorsImageEncoder.save_image(batch.unbind(0)[1], str(tmp_path / "img"))
+
+        assert torch.equal(SafetensorsImageEncoder.load_image(str(tmp_path / "img")), batch[1])
+
+    def test_round_trip_non_contiguous(self, tmp_path: Path):
+        image = torch.rand((3, 8, 8)).permute(1, 2, 0)
+        SafetensorsImageEncoder.save_image(image, str(tmp_path / "img"))
+
+        assert torch.equal(SafetensorsImageEncoder.load_image(str(tmp_path / "img")), image)
+
+
+@pytest.mark.unit
+class TestSafetensorsBankEncoder:
+    """Tests SafetensorsBankEncoder."""
+
+    @pytest.fixture
+    def images(self) -> torch.Tensor:
+        return torch.rand((5, 8, 8, 3))
+
+    @pytest.fixture
+    def bank_path(self, images: torch.Tensor, tmp_path: Path, monkeypatch) -> str:
+        monkeypatch.setattr(SafetensorsBankEncoder, "CHUNK_FRAMES", 2)
+        SafetensorsBankEncoder.save_frames(images.unbind(0), str(tmp_path), workers=2)
+        return str(tmp_path)
+
+    def test_chunks(self, bank_path: str):
+        ext = SafetensorsBankEncoder.file_extension()
+        assert sorted(os.listdir(bank_path)) == [f"0{ext}", f"2{ext}", f"4{ext}"]
+
+    def test_load_frames(self, images: torch.Tensor, bank_path: str):
+        assert torch.equal(SafetensorsBankEncoder.load_frames(bank_path, 5, workers=2), images)
+
+    @pytest.mark.parametrize("index", [0, 3, 4, -1, -4, -5])
+    def test_load_frame(self, images: torch.Tensor, bank_path: str, index: int):
+        assert torch.equal(SafetensorsBankEncoder.load_frame(bank_path, index), images[index])
+
+    @pytest.mark.parametrize("missing", ["0", "2", "4"])
+    def test_missing_chunk(self, bank_path: str, missing: str):
+        os.remove(os.path.join(bank_path, f"{missing}{SafetensorsBankEncoder.file_extension()}"))
+        with pytest.raises(Exception):
+            SafetensorsBankEncoder.load_frames(bank_path, 5)
+
+    def test_missing_frames(self, bank_path: str):
+        with pytest.raises(Exception):
+            SafetensorsBankEncoder.load_frames(bank_path, 6)
+
+    @pytest.mark.parametrize("index", [5, -6])
+    def test_load_frame_out_of_range(self, bank_path: str, index: int):
+        with pytest.raises(IndexError):
+            SafetensorsBankEncoder.load_frame(bank_path, index)
+
+
+@pytest.mark.unit
+class TestRawEncoder:
+    """Tests RawImageEncoder."""
+
+    def test_load_frames_is_mapped(self, tmp_path: Path):
+        images = torch.rand((3, 8, 8, 3))
+        RawImageEncoder.save_frames(images.unbind(0), str(tmp_path))
+
+        frames = RawImageEncoder.load_frames(str(tmp_path), 3)
+        assert torch.equal(frames, images)
+        assert torch.equal(RawImageEncoder.load_frame(str(tmp_path), -1), images[-1])
+
+        # in-place changes are private to the process
+        frames.zero_()
+        assert torch.equal(RawImageEncoder.load_frames(str(tmp_path), 3), images)
+
+    def test_num_frames_mismatch(self, tmp_path: Path):
+        RawImageEncoder.save_frames([torch.zeros((8, 8, 3))] * 2, str(tmp_path))
+        with pytest.raises(Exception):
+            RawImageEncoder.load_frames(str(tmp_path), 3)
+
+
+@pytest.mark.unit
+class TestEncoderOptions:
+    """Tests encoder options parsing."""
+
+    def test_pil_quality(self):
+        assert "quality" not in PilImageEncoder.save_params()
+        assert PilImageEncoder.save_params({"quality": 120})["quality"] == 100
+
+    def test_zstd_level(self):
+        assert SafetensorsImageEncoder.compression_level({"quality": -1}) == SafetensorsImageEncoder.compression_level()
+        assert SafetensorsImageEncoder.compression_level({"quality": 50}) == 22
+
+    def test_pil_effort(self):
+        assert PilImageEncoder.save_params({"effort": 9})["method"] == 6
+        assert PilImageEncoder.save_params({"lossless": True})["lossless"]
+
+    def test_lossless_webp_defaults_to_fastest(self):
+        params = LosslessWebpImageEncoder.save_params({"quality": -1})
+        assert params["lossless"] and params["method"] == 0 and params["quality"] == 0
+        assert LosslessWebpImageEncoder.save_params({"effort": 4})["method"] == 4
+
+    def test_png_level(self):
+        assert PngImageEncoder.save_params({"quality": 90}) == {"compress_level": PngImageEncoder.COMPRESS_LEVEL}
+        assert PngImageEncoder.save_params({"effort": 12}) == {"compress_level": 9}
+
+
+@pytest.mark.unit
+class TestLosslessEncoders:
+    """Tests exact round trips of the lossless encoders."""
+
+    @pytest.mark.parametrize("encoder", [LosslessWebpImageEncoder, PngImageEncoder])
+    def test_exact_round_trip(self, encoder: ImageEncoder, tmp_path: Path):
+        images = torch.randint(0, 256, (3, 16, 16, 3), dtype=torch.uint8)
+        encoder.save_frames(to_float_images(images), str(tmp_path), workers=2)
+
+        assert torch.equal(encoder.load_frames(str(tmp_path), 3), images)
+
+    def test_packed_lossless(self, tmp_path: Path):
+        images = torch.randint(0, 256, (2, 16, 16, 3), dtype=torch.uint8)
+        PackedImageEncoder.save_frames(images, str(tmp_path), options={"lossless": True, "effort": 0})
+
+        assert torch.equal(PackedImageEncoder.load_frames(str(tmp_path), 2), images)
+
+
+@pytest.mark.unit
+class TestStorageDtype:
+    """Tests compact storage of frames."""
+
+    @pytest.mark.parametrize("encoder", [SafetensorsImageEncoder, SafetensorsBankEncoder, RawImageEncoder])
+    @pytest.mark.parametrize("dtype,atol", [("uint8", 1 / 255), ("float16", 1e-3)])
+    def test_compact_round_trip(self, encoder: ImageEncoder, dtype: str, atol: float, tmp_path: Path):
+        images = torch.rand((3, 8, 8, 3))
+        encoder.save_frames(images.unbind(0), str(tmp_path), options={"dtype": dtype})
+
+        frames = encoder.load_frames(str(tmp_path), 3)
+        assert frames.dtype == to_storage_dtype(images, {"dtype": dtype}).dtype
+        assert torch.allclose(to_float_images(frames), images, atol=atol)
+
+    def test_load_image_is_float(self, tmp_path: Path):
+        SafetensorsImageEncoder.save_image(torch.rand((8, 8, 3)), str(tmp_path / "img"), options={"dtype": "uint8"})
+        assert SafetensorsImageEncoder.load_image(str(tmp_path / "img")).dtype == torch.float32
+
+    def test_pil_frames_are_uint8(self, tmp_path: Path):
+        PilImageEncoder.save_frames([torch.ones((8, 8, 3))] * 2, str(tmp_path))
+        assert PilImageEncoder.load_frames(str(tmp_path), 2).dtype == torch.uint8
+        assert PilImageEncoder.load_image(str(tmp_path / "0")).dtype == torch.float32
+
+    def test_unknown_dtype(self):
+        with pytest.raises(Exception):
+            to_storage_dtype(torch.zeros(1), {"dtype": "int64"})
@@ -0,0 +1,172 @@
+import os
+import time
+import pytest
+import torch
+from pathlib import Path
+
+from image_bank import METADATA_FILENAME, is_bank_valid, write_bank_metadata
+from image_bank.bank_index import BankIndex, get_bank_index
+from image_bank.bank_lock import LOCK_SUFFIX, BankLock, acquire_bank_lock, release_bank_lock
+from image_bank.blob_store import save_bank_frames
+from image_bank.eviction import DEFAULT_BLOB_GRACE, CacheEvictor, ensure_cache_evictor
+from image_bank.staging import STAGING_PREFIX
+from encoders.safetensor_image_encoder import SafetensorsImageEncoder
+
+
+def _make_bank(cache_path: Path, bank_name: str, bank_id: str, size: int, atime: float) -> Path:
+    bank_path = cache_path / bank_name / bank_id
+    bank_path.mkdir(parents=True)
+    (bank_path / "0.webp").write_bytes(b"x" * size)
+    metadata = {"bank_config": {"num_frames": 1}}
+    write_bank_metadata(str(bank_path), metadata)
+    get_bank_index(str(cache_path)).put(bank_name, bank_id, metadata, atime=atime)
+    return bank_path
+
+
+def _make_dedup_bank(cache_path: Path, bank_id: str, images: torch.Tensor) -> Path:
+    bank_path = cache_path / "dedup" / bank_id
+    bank_path.mkdir(parents=True)
+    metadata = {"encoder": "safetensors", "bank_config": {"num_frames": images.shape[0]}}
+    save_bank_frames(SafetensorsImageEncoder, images, str(bank_path), metadata, dedup=True)
+    write_bank_metadata(str(bank_path), metadata, cache_path=str(cache_path))
+    return bank_path
+
+
+def _blob_files(cache_path: Path):
+    return [p for p in (cache_path / ".blobs").rglob("*") if p.is_file()]
+
+
+@pytest.mark.unit
+class TestCacheEvictor:
+    """Tests for the eviction of banks."""
+
+    def test_no_limit(self, tmp_path: Path):
+        now = time.time()
+        _make_bank(tmp_path, "a", "old", 1000, now - 10000)
+
+        stats = CacheEvictor(str(tmp_path)).run_once(now)
+        assert stats["banks_evicted"] == 0
+        assert stats["banks"] == 1
+        assert stats["bytes_used"] >= 1000
+
+    def test_lru_eviction(self, tmp_path: Path):
+        now = time.time()
+        recent = _make_bank(tmp_path, "b", "recent", 1000, now - 1000)
+        oldest = _make_bank(tmp_path, "a", "oldest", 1000, now - 3000)
+        old = _make_bank(tmp_path, "a", "old", 1000, now - 2000)
+
+        evictor = CacheEvictor(str(tmp_path), max_bytes=2500)
+        stats = evictor.run_once(now)
+
+        assert stats["banks_evicted"] == 1
+        assert stats["bytes_used"] <= 2500
+        assert not oldest.exists()
+        assert is_bank_valid(str(old)) and is_bank_valid(str(recent))
+        assert sorted(b["bank_id"] for b in BankIndex(str(tmp_path)).get_banks()) == ["old", "recent"]
+
+    def test_ttl_eviction(self, tmp_path: Path):
+        now = time.time()
+        expired = _make_bank(tmp_path, "a", "expired", 10, now - 7200)
+        alive = _make_bank(tmp_path, "a", "alive", 10, now - 60)
+
+        stats = CacheEvictor(str(tmp_path), ttl=3600).run_once(now)
+        assert stats["banks_evicted"] == 1
+        assert not expired.exists()
+        assert is_bank_valid(str(alive))
+
+    def test_locked_bank_kept(self, tmp_path: Path):
+        now = time.time()
+        locked = _make_bank(tmp_path, "a", "locked", 1000, now - 3000)
+        owned = _make_bank(tmp_path, "a", "owned", 1000, now - 2000)
+        other = _make_bank(tmp_path, "a", "other", 1000, now - 1000)
+        bank_lock = BankLock(str(locked))
+        assert bank_lock.acquire()
+        # locks held by this process are not taken over either
+        assert acquire_bank_lock(str(owned))
+
+        try:
+            stats = CacheEvictor(str(tmp_path), max_bytes=1500).run_once(now)
+            assert stats["banks_evicted"] == 1
+            assert is_bank_valid(str(locked)) and is_bank_valid(str(owned))
+            assert not other.exists()
+            assert not BankLock(str(owned)).acquire()
+        finally:
+            bank_lock.release()
+            release_bank_lock(str(owned))
+
+        assert CacheEvictor(str(tmp_path), max_bytes=1500).run_once(now)["banks_evicted"] == 1
+        assert not locked.exists()
+        assert not os.path.exists(f"{locked}{LOCK_SUFFIX}")
+
+    def test_metadata_removed_first(self, tmp_path: Path, monkeypatch):
+        bank_path = _make_bank(tmp_path, "a", "bank", 10, time.time())
+        evictor = CacheEvictor(str(tmp_path))
+
+        # the folder cannot be deleted, the bank is invalid anyway
+        monkeypatch.setattr("shutil.rmtree", lambda *args, **kwargs: None)
+        assert evictor.evict_bank("a", "bank")
+        assert bank_path.exists()
+        assert not (bank_path / METADATA_FILENAME).exists()
+        assert not is_bank_valid(str(bank_path))
+
+    def test_blob_gc(self, tmp_path: Path):
+        images = torch.rand((3, 4, 4, 3))
+        first = _make_dedup_bank(tmp_path, "first", images)
+        _make_dedup_bank(tmp_path, "second", images[:1])
+        assert len(_blob_files(tmp_path)) == 3
+
+        evictor = CacheEvictor(str(tmp_path), blob_grace=0)
+        evictor.evict_bank("dedup", "first")
+        assert not first.exists()
+
+        # blobs are young: kept during the grace period
+        stats = CacheEvictor(str(tmp_path)).run_once()
+        assert stats["blobs_removed"] == 0
+        assert len(_blob_files(tmp_path)) == 3
+
+        # frame shared with the second bank is kept
+        stats = evictor.run_once(time.time() + 1)
+        assert stats["blobs_removed"] == 2
+        assert len(_blob_files(tmp_path)) == 1
+
+    def test_dedup_bank_frees_its_blobs(self, tmp_path: Path):
+        images = torch.rand((4, 16, 16, 3))
+        _make_dedup_bank(tmp_path, "bank", images)
+
+        evictor = CacheEvictor(str(tmp_path), max_bytes=1, blob_grace=0)
+        stats = evictor.run_once(time.time() + 1)
+        assert stats["banks_evicted"] == 1
+        assert stats["blobs_removed"] == 4
+        assert stats["bytes_used"] == 0
+        assert _blob_files(tmp_path) == []
+
+    def test_staging_cleaned_without_limit(self, tmp_path: Path):
+        staging_path = tmp_path / "a" / f"{STAGING_PREFIX}bank"
+        staging_path.mkdir(parents=True)
+        stale = time.time() - 2 * DEFAULT_BLOB_GRACE
+        os.utime(staging_path, (stale, stale))
+
+        runs = []
+        evictor = ensure_cache_evictor(str(tmp_path), max_bytes=0, ttl=0, on_run=runs.append)
+        try:
+            for _ in range(100):
+                if not staging_path.exists():
+                    break
+                time.sleep(0.01)
+            assert not staging_path.exists()
+            # no eviction run
+            assert runs == []
+        finally:
+            evictor.stop()
+
+    def test_ensure_cache_evictor(self, tmp_path: Path):
+        runs = []
+        evictor = ensure_cache_evictor(str(tmp_path), max_bytes=10, ttl=0, on_run=runs.append)
+        try:
+            for _ in range(100):
+                if runs:
+                    break
+                time.sleep(0.01)
+            assert runs and runs[0]["banks"] == 0
+        finally:
+            evictor.stop()
@@ -0,0 +1,59 @@
+import pytest
+
+from image_bank.graph_utils import STEP_BANK_NAME_PLACEHOLDER, get_step_bank_settings, is_output_used, predict_banks
+
+
+@pytest.mark.unit
+class TestGraphUtils:
+    """Tests for workflow graph utils."""
+
+    @pytest.fixture
+    def prompt(self):
+        return {
+            "1": {"class_type": "PersistImageBank", "inputs": {"bank_name": "a", "bank_id": "b"}},
+            "2": {"class_type": "PreviewImage", "inputs": {"images": ["1", 1]}},
+            "3": {"class_type": "SaveImage", "inputs": {"images": ["2", 0], "filename_prefix": "x"}},
+        }
+
+    def test_used_output(self, prompt):
+        assert is_output_used(prompt, "1", 1) is True
+
+    def test_unused_output(self, prompt):
+        assert is_output_used(prompt, "1", 0) is False
+        assert is_output_used(prompt, "3", 0) is False
+
+    def test_unknown_node(self, prompt):
+        assert is_output_used(prompt, "42", 0) is True
+        assert is_output_used(None, "1", 0) is True
+
+    def test_step_bank_settings(self):
+        assert get_step_bank_settings("shot", None, None) == ("shot", "step1")
+        assert get_step_bank_settings(STEP_BANK_NAME_PLACEHOLDER, None, [{"bank_name": "shot"}]) == ("shot", "step2")
+        assert get_step_bank_settings("other", "custom", [{"bank_name": "shot"}]) == ("other", "custom")
+        with pytest.raises(Exception):
+            get_step_bank_settings("", None, None)
+
+    def test_predict_banks(self, prompt):
+        prompt["4"] = {"class_type": "PersistImageBank", "inputs": {"bank_name": "c", "bank_id": ["9", 0]}}
+        assert predict_banks(prompt) == [{"node_id": "1", "cache_name": "default", "bank_name": "a", "bank_id": "b"}]
+        assert predict_banks(None) == []
+
+    def test_predict_stepped_chain(self):
+        prompt = {
+            "1": {"class_type": "PersistSteppedImageBank", "inputs": {"cache_name": "fast", "bank_name": "shot"}},
+            "2": {
+                "class_type": "PersistSteppedImageBank",
+                "inputs": {"cache_name": "fast", "bank_name": STEP_BANK_NAME_PLACEHOLDER, "previous_series": ["1", 3]},
+            },
+            "3": {
+                "class_type": "PersistSteppedImageBank",
+                "inputs": {"bank_name": STEP_BANK_NAME_PLACEHOLDER, "bank_id": "last", "previous_series": ["2", 3]},
+            },
+            # unpredictable: the previous series comes from an unknown node
+            "4": {"class_type": "PersistSteppedImageBank", "inputs": {"bank_name": "x", "previous_series": ["9", 0]}},
+        }
+        banks = {bank["node_id"]: bank for bank in predict_banks(prompt)}
+        assert sorted(banks) == ["1", "2", "3"]
+        assert (banks["1"]["bank_name"], banks["1"]["bank_id"]) == ("shot", "step1")
+        assert (banks["2"]["bank_name"], banks["2"]["bank_id"]) == ("shot", "step2")
+        assert (banks["3"]["bank_name"], banks["3"]["bank_id"], banks["3"]["cache_name"]) == ("shot", "last", "default")
@@ -1,7 +1,15 @@
+import os
+import json
+import shutil
 import pytest
+import torch
 from pathlib import Path
 
-from image_bank import get_bank_fingerprint, is_bank_valid
+from image_bank import get_bank_fingerprint, is_bank_valid, load_conf_file
+from image_bank import read_bank_metadata, write_bank_metadata, verify_banks
+from image_bank.blob_store import save_bank_frames
+from image_bank.integrity import FILES_KEY, VALIDATION_MODES, check_files
+from encoders.safetensor_image_encoder import SafetensorsImageEncoder
 
 
 @pytest.mark.unit
@@ -27,3 +35,107 @@ class TestImageBank:
     def test_is_bank_valid_2(self):
         bank_path = Path(__file__).parent / "data" / "missing_bank"
         assert is_bank_valid(bank_path=str(bank_path)) is False
+
+    def test_load_conf_file_is_cached(self, tmp_path):
+        conf_file_path = tmp_path / "image_banks.json"
+        conf_file_path.write_text(json.dumps({"default": {"cache_path": "/tmp/a"}}))
+
+        conf = load_conf_file(str(conf_file_path))
+        assert conf["default"]["cache_path"] == "/tmp/a"
+        assert load_conf_file(str(conf_file_path)) is conf
+
+    def test_load_conf_file_reloads_on_change(self, tmp_path):
+        conf_file_path = tmp_path / "image_banks.json"
+        conf_file_path.write_text(json.dumps({"default": {"cache_path": "/tmp/a"}}))
+        load_conf_file(str(conf_file_path))
+
+        conf_file_path.write_text(json.dumps({"default": {"cache_path": "/tmp/a"}, "fast": {"cache_path": "/tmp/b"}}))
+        st = os.stat(conf_file_path)
+        os.utime(conf_file_path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+        assert list(load_conf_file(str(conf_file_path)).keys()) == ["default", "fast"]
+
+
+@pytest.mark.unit
+class TestBankValidation:
+    """Tests for the integrity checks of banks."""
+
+    @pytest.fixture
+    def bank_path(self, tmp_path) -> str:
+        bank_path = str(tmp_path / "bank_name" / "bank_id")
+        os.makedirs(bank_path)
+        metadata = {"encoder": "safetensors", "bank_config": {"num_frames": 3}}
+        save_bank_frames(SafetensorsImageEncoder, torch.rand((3, 4, 4, 3)), bank_path, metadata)
+        write_bank_metadata(bank_path, metadata)
+        return bank_path
+
+    def test_files_are_recorded(self, bank_path: str):
+        files = read_bank_metadata(bank_path)[FILES_KEY]
+        assert sorted(files) == [f"{idx}{SafetensorsImageEncoder.file_extension()}" for idx in range(3)]
+        assert all(record["size"] > 0 for record in files.values())
+
+    @pytest.mark.parametrize("mode", VALIDATION_MODES)
+    def test_valid(self, bank_path: str, mode: str):
+        assert is_bank_valid(bank_path, mode=mode) is True
+
+    @pytest.mark.parametrize("mode,valid", [("exists", True), ("stat", False), ("checksum", False)])
+    def test_missing_frame(self, bank_path: str, mode: str, valid: bool):
+        os.remove(os.path.join(bank_path, f"1{SafetensorsImageEncoder.file_extension()}"))
+        assert is_bank_valid(bank_path, mode=mode) is valid
+
+    @pytest.mark.parametrize("mode,valid", [("exists", True), ("stat", False), ("checksum", False)])
+    def test_truncated_frame(self, bank_path: str, mode: str, valid: bool):
+        frame_path = os.path.join(bank_path, f"2{SafetensorsImageEncoder.file_extension()}")
+        with open(frame_path, "r+b") as fo:
+            fo.truncate(10)
+        assert is_bank_valid(bank_path, mode=mode) is valid
+
+    def test_corrupted_frame(self, bank_path: str):
+        frame_path = os.path.join(bank_path, f"0{SafetensorsImageEncoder.file_extension()}")
+        with open(frame_path, "r+b") as fo:
+            data = fo.read()
+            fo.seek(0)
+            fo.write(bytes([data[0] ^ 0xFF]))
+
+        assert is_bank_valid(bank_path, mode="stat") is True
+        assert is_bank_valid(bank_path, mode="checksum") is False
+
+    def test_dedup_blobs_are_recorded(self, tmp_path):
+        bank_path = str(tmp_path / "bank_name" / "dedup")
+        os.makedirs(bank_path)
+        images = torch.rand((1, 4, 4, 3))
+        metadata = {"bank_config": {"num_frames": 2}}
+        save_bank_frames(SafetensorsImageEncoder, torch.cat([images, images]), bank_path, metadata, dedup=True)
+        write_bank_metadata(bank_path, metadata)
+        assert len(metadata[FILES_KEY]) == 1
+        assert is_bank_valid(bank_path) is True
+
+        shutil.rmtree(tmp_path / ".blobs")
+        write_bank_metadata(bank_path, metadata)
+        assert is_bank_valid(bank_path) is False
+
+    def test_result_is_cached(self, bank_path: str, monkeypatch):
+        assert is_bank_valid(bank_path) is True
+
+        def fail(*args, **kwargs):
+            raise AssertionError("metadata read again")
+
+        monkeypatch.setattr("image_bank.read_bank_metadata", fail)
+        assert is_bank_valid(bank_path) is True
+
+    def test_cache_follows_metadata(self, bank_path: str):
+        assert is_bank_valid(bank_path) is True
+        write_bank_metadata(bank_path, {"bank_config": {}})
+        assert is_bank_valid(bank_path) is False
+
+    def test_unknown_mode(self, bank_path: str):
+        with pytest.raises(Exception):
+            check_files(bank_path, read_bank_metadata(bank_path), mode="deep")
+
+    def test_verify_banks(self, bank_path: str, tmp_path):
+        cache_path = str(tmp_path)
+        write_bank_metadata(bank_path, read_bank_metadata(bank_path), cache_path=cache_path)
+        assert verify_banks(cache_path) == []
+
+        os.remove(os.path.join(bank_path, f"0{SafetensorsImageEncoder.file_extension()}"))
+        assert [b["bank_id"] for b in verify_banks(cache_path)] == ["bank_id"]
@@ -0,0 +1,59 @@
+import threading
+import pytest
+
+from image_bank.prefetch import BankPrefetcher
+
+
+@pytest.mark.unit
+class TestBankPrefetcher:
+    """Tests for the background loading of banks."""
+
+    def test_single_flight(self):
+        prefetcher = BankPrefetcher(workers=2)
+        release = threading.Event()
+        calls = []
+
+        def load():
+            calls.append(1)
+            release.wait(5)
+            return "images"
+
+        first = prefetcher.submit("bank", load)
+        assert prefetcher.submit("bank", load) is first
+        assert prefetcher.is_pending("bank")
+
+        release.set()
+        assert prefetcher.wait("bank") == "images"
+        first.result()
+        assert len(calls) == 1
+
+    def test_done_loads_are_kept_until_consumed(self):
+        prefetcher = BankPrefetcher()
+        prefetcher.submit("bank", lambda: "images").result()
+        assert not prefetcher.is_pending("bank")
+        assert prefetcher.wait("bank") == "images"
+        assert prefetcher.wait("bank") is None
+
+    def test_oldest_done_loads_are_dropped(self):
+        prefetcher = BankPrefetcher(workers=2)
+        for name in ["first", "second", "third"]:
+            # callbacks run in order, the prefetcher has recorded the load once this one runs
+            recorded = threading.Event()
+            prefetcher.submit(name, lambda name=name: name).add_done_callback(lambda _: recorded.set())
+            assert recorded.wait(5)
+        assert prefetcher.wait("first") is None
+        assert prefetcher.wait("second") == "second"
+        assert prefetcher.wait("third") == "third"
+
+    def test_failed_load(self):
+        prefetcher = BankPrefetcher()
+        release = threading.Event()
+
+        def load():
+            release.wait(5)
+            raise Exception("corrupted bank")
+
+        prefetcher.submit("bank", load)
+        release.set()
+        # the node loads the bank itself
+        assert prefetcher.wait("bank") is None
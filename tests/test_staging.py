@@ -0,0 +1,71 @@
+import os
+import time
+import pytest
+from pathlib import Path
+
+from image_bank import METADATA_FILENAME, is_bank_valid, read_bank_metadata, write_bank_metadata
+from image_bank.bank_index import BankIndex
+from image_bank.eviction import CacheEvictor
+from image_bank.staging import STAGING_PREFIX, stage_bank
+
+
+def _write_bank(staging_path: str, frames: int, tag: str):
+    for idx in range(frames):
+        Path(staging_path, f"{idx}.bin").write_text(tag)
+    write_bank_metadata(staging_path, {"bank_config": {"num_frames": frames}, "tag": tag})
+
+
+@pytest.mark.unit
+class TestStaging:
+    """Tests for the atomic commit of banks."""
+
+    def test_commit(self, tmp_path: Path):
+        bank_path = str(tmp_path / "bank_name" / "bank_id")
+        with stage_bank(bank_path, cache_path=str(tmp_path)) as staging_path:
+            assert os.path.basename(staging_path).startswith(STAGING_PREFIX)
+            _write_bank(staging_path, 2, "a")
+            assert not is_bank_valid(bank_path, mode="exists")
+
+        assert is_bank_valid(bank_path, mode="exists")
+        assert sorted(os.listdir(tmp_path / "bank_name")) == ["bank_id"]
+        assert [b["bank_id"] for b in BankIndex(str(tmp_path)).get_banks()] == ["bank_id"]
+
+    def test_replace_existing_bank(self, tmp_path: Path):
+        bank_path = str(tmp_path / "bank_name" / "bank_id")
+        with stage_bank(bank_path) as staging_path:
+            _write_bank(staging_path, 3, "a")
+        with stage_bank(bank_path) as staging_path:
+            _write_bank(staging_path, 1, "b")
+
+        # no frame of the first write is left
+        assert sorted(os.listdir(bank_path)) == ["0.bin", METADATA_FILENAME]
+        assert read_bank_metadata(bank_path)["tag"] == "b"
+        assert sorted(os.listdir(tmp_path / "bank_name")) == ["bank_id"]
+
+    def test_not_committed_on_error(self, tmp_path: Path):
+        bank_path = str(tmp_path / "bank_name" / "bank_id")
+        with pytest.raises(RuntimeError):
+            with stage_bank(bank_path) as staging_path:
+                _write_bank(staging_path, 1, "a")
+                raise RuntimeError("crash")
+
+        assert not os.path.exists(bank_path)
+        assert os.listdir(tmp_path / "bank_name") == []
+
+    def test_metadata_write_is_atomic(self, tmp_path: Path):
+        write_bank_metadata(str(tmp_path), {"bank_config": {"num_frames": 1}})
+        write_bank_metadata(str(tmp_path), {"bank_config": {"num_frames": 2}})
+
+        assert os.listdir(tmp_path) == [METADATA_FILENAME]
+        assert read_bank_metadata(str(tmp_path))["bank_config"]["num_frames"] == 2
+
+    def test_stale_staging_is_collected(self, tmp_path: Path):
+        stale = tmp_path / "bank_name" / f"{STAGING_PREFIX}bank_id-0"
+        stale.mkdir(parents=True)
+        fresh = tmp_path / "bank_name" / f"{STAGING_PREFIX}bank_id-1"
+        fresh.mkdir()
+        os.utime(stale, (time.time() - 7200, time.time() - 7200))
+
+        CacheEvictor(str(tmp_path)).run_once()
+        assert not stale.exists()
+        assert fresh.exists()
@@ -0,0 +1,120 @@
+import os
+import pytest
+import torch
+from pathlib import Path
+
+from image_bank import METADATA_FILENAME, is_bank_valid, read_bank_metadata, write_bank_metadata
+from image_bank.blob_store import load_bank_frames, save_bank_frames
+from image_bank.staging import stage_bank
+from image_bank.storage import LocalStorageBackend, S3StorageBackend, TieredStorage, make_storage_backend
+from encoders.safetensor_image_encoder import SafetensorsImageEncoder
+
+
+def write_bank(bank_path: str, images: torch.Tensor, dedup: bool = False):
+    metadata = {"encoder": "safetensors", "bank_config": {"num_frames": len(images)}}
+    with stage_bank(bank_path) as staging_path:
+        save_bank_frames(SafetensorsImageEncoder, images, staging_path, metadata, dedup=dedup)
+        write_bank_metadata(staging_path, metadata)
+
+
+@pytest.mark.unit
+class TestTieredStorage:
+    """Tests for the local tier in front of a shared store."""
+
+    @pytest.fixture
+    def images(self) -> torch.Tensor:
+        return torch.rand((3, 8, 8, 3))
+
+    def test_local_backend(self, tmp_path: Path):
+        backend = LocalStorageBackend(str(tmp_path / "store"))
+        src = tmp_path / "src.bin"
+        src.write_bytes(b"frame")
+
+        assert not backend.exists("a/b/c.bin")
+        backend.upload(str(src), "a/b/c.bin")
+        assert backend.exists("a/b/c.bin")
+        assert backend.read_bytes("a/b/c.bin") == b"frame"
+        assert backend.list_keys("a/") == ["a/b/c.bin"]
+        assert backend.list_keys("b/") == []
+
+        backend.download("a/b/c.bin", str(tmp_path / "dst.bin"))
+        assert (tmp_path / "dst.bin").read_bytes() == b"frame"
+        with pytest.raises(FileNotFoundError):
+            backend.read_bytes("a/missing.bin")
+        with pytest.raises(Exception):
+            backend.exists("../outside")
+
+        backend.delete("a/b/c.bin")
+        backend.delete("a/b/c.bin")
+        assert not backend.exists("a/b/c.bin")
+
+    @pytest.mark.parametrize("dedup", [False, True])
+    def test_push_then_fetch(self, images: torch.Tensor, tmp_path: Path, dedup: bool):
+        remote = LocalStorageBackend(str(tmp_path / "store"))
+        node_a = TieredStorage(str(tmp_path / "node_a"), remote, workers=4)
+        node_b = TieredStorage(str(tmp_path / "node_b"), remote, workers=4)
+
+        bank_a = str(tmp_path / "node_a" / "bank_name" / "bank_id")
+        bank_b = str(tmp_path / "node_b" / "bank_name" / "bank_id")
+        assert not node_b.fetch_bank(bank_b)
+
+        write_bank(bank_a, images, dedup=dedup)
+        node_a.push_bank(bank_a)
+        assert remote.exists(f"bank_name/bank_id/{METADATA_FILENAME}")
+
+        assert node_b.fetch_bank(bank_b)
+        assert is_bank_valid(bank_b)
+        metadata = read_bank_metadata(bank_b)
+        torch.testing.assert_close(load_bank_frames(SafetensorsImageEncoder, bank_b, metadata, 3), images)
+
+    def test_incomplete_remote_bank(self, images: torch.Tensor, tmp_path: Path):
+        remote = LocalStorageBackend(str(tmp_path / "store"))
+        node_a = TieredStorage(str(tmp_path / "node_a"), remote)
+        node_b = TieredStorage(str(tmp_path / "node_b"), remote)
+
+        bank_a = str(tmp_path / "node_a" / "bank_name" / "bank_id")
+        write_bank(bank_a, images)
+        node_a.push_bank(bank_a)
+        remote.delete(remote.list_keys("bank_name/bank_id/")[0])
+
+        bank_b = str(tmp_path / "node_b" / "bank_name" / "bank_id")
+        with pytest.raises(Exception):
+            node_b.fetch_bank(bank_b)
+        assert not is_bank_valid(bank_b, mode="exists")
+        assert not os.path.exists(os.path.dirname(bank_b)) or os.listdir(os.path.dirname(bank_b)) == []
+
+    def test_make_storage_backend(self, tmp_path: Path):
+        assert isinstance(make_storage_backend({"type": "local", "path": str(tmp_path)}), LocalStorageBackend)
+        assert isinstance(make_storage_backend({"type": "s3", "bucket": "banks"}), S3StorageBackend)
+        with pytest.raises(Exception):
+            make_storage_backend({"type": "s3"})
+        with pytest.raises(Exception):
+            make_storage_backend({"type": "ftp"})
+
+
+@pytest.mark.unit
+class TestS3StorageBackend:
+    """Tests for the S3 backend, against a moto stand-in."""
+
+    def test_round_trip(self, tmp_path: Path):
+        moto = pytest.importorskip("moto")
+        boto3 = pytest.importorskip("boto3")
+
+        with moto.mock_aws():
+            client = boto3.client("s3", region_name="us-east-1")
+            client.create_bucket(Bucket="banks")
+            backend = S3StorageBackend("banks", prefix="cache", client=client)
+
+            src = tmp_path / "src.bin"
+            src.write_bytes(b"frame")
+            assert not backend.exists("a/b.bin")
+            backend.upload(str(src), "a/b.bin")
+            assert backend.exists("a/b.bin")
+            assert backend.read_bytes("a/b.bin") == b"frame"
+            assert backend.list_keys("a/") == ["a/b.bin"]
+            with pytest.raises(FileNotFoundError):
+                backend.read_bytes("a/missing.bin")
+            with pytest.raises(FileNotFoundError):
+                backend.download("a/missing.bin", str(tmp_path / "missing.bin"))
+            backend.delete("a/b.bin")
+            assert not backend.exists("a/b.bin")
@@ -0,0 +1,46 @@
+import pytest
+import torch
+
+from image_bank.tensor_cache import TensorCache
+
+
+@pytest.mark.unit
+class TestTensorCache:
+    """Tests for the in-memory bank cache."""
+
+    def test_get_returns_same_tensor(self):
+        cache = TensorCache(max_bytes=1024)
+        tensor = torch.zeros(16)
+        cache.put(("bank", 1), tensor)
+
+        assert cache.get(("bank", 1)) is tensor
+        assert cache.get(("bank", 2)) is None
+        assert cache.current_bytes == 64
+
+    def test_lru_eviction(self):
+        cache = TensorCache(max_bytes=128)
+        cache.put(("a", 1), torch.zeros(16))
+        cache.put(("b", 1), torch.zeros(16))
+        # refresh a so that b is the least recently used
+        cache.get(("a", 1))
+        cache.put(("c", 1), torch.zeros(16))
+
+        assert cache.get(("a", 1)) is not None
+        assert cache.get(("b", 1)) is None
+        assert cache.get(("c", 1)) is not None
+        assert cache.current_bytes == 128
+
+    def test_too_large_and_disabled(self):
+        cache = TensorCache(max_bytes=0)
+        cache.put(("a", 1), torch.zeros(1))
+        assert cache.get(("a", 1)) is None
+
+    def test_invalidate(self):
+        cache = TensorCache(max_bytes=1024)
+        cache.put(("a", 1), torch.zeros(4))
+        cache.put(("b", 1), torch.zeros(4))
+        cache.invalidate("a")
+
+        assert cache.get(("a", 1)) is None
+        assert cache.get(("b", 1)) is not None
+        assert cache.current_bytes == 16
@@ -0,0 +1,33 @@
+import pytest
+import torch
+
+from image_bank.video_series import make_serie, get_series_num_frames, materialize_series
+
+
+@pytest.mark.unit
+class TestVideoSeries:
+    """Tests for the lazy series."""
+
+    def test_materialize_loads_each_bank_once(self):
+        banks = {"a/step1": torch.rand((2, 4, 4, 3)), "a/step2": torch.rand((3, 4, 4, 3))}
+        loaded = []
+
+        def load_bank(step):
+            loaded.append(step["bank_path"])
+            return banks[step["bank_path"]]
+
+        in_memory = torch.rand((1, 4, 4, 3))
+        series = [
+            make_serie("a", "default", "a/step1", 2),
+            make_serie("a", "default", "a/step2", 3),
+            make_serie("a", "default", "a/step3", 1, images=in_memory),
+        ]
+
+        assert get_series_num_frames(series) == 6
+        all_images = materialize_series(series, load_bank)
+        assert torch.equal(all_images, torch.cat([banks["a/step1"], banks["a/step2"], in_memory]))
+        assert loaded == ["a/step1", "a/step2"]
+
+    def test_missing_images(self):
+        with pytest.raises(Exception):
+            materialize_series([{"bank_name": "a", "images": None}], lambda s: torch.zeros(1))
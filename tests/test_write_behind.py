@@ -0,0 +1,81 @@
+import sys
+import subprocess
+import pytest
+import torch
+from pathlib import Path
+
+from image_bank import is_bank_valid, read_bank_metadata
+from image_bank.staging import OUTPUTS_DIRNAME
+from image_bank.write_behind import WriteBehindQueue
+from encoders.safetensor_image_encoder import SafetensorsImageEncoder
+
+
+@pytest.mark.unit
+class TestWriteBehindQueue:
+    """Tests for the write-behind queue."""
+
+    def test_submit_and_flush(self, tmp_path: Path):
+        bank_path = str(tmp_path / "bank" / "id")
+        images = torch.rand((3, 8, 8, 3))
+        committed = []
+
+        queue = WriteBehindQueue()
+        queue.submit(
+            bank_path, SafetensorsImageEncoder, images, {"bank_config": {"num_frames": 3}}, on_commit=committed.append
+        )
+        queue.flush()
+
+        assert is_bank_valid(bank_path=bank_path) is True
+        assert read_bank_metadata(bank_path=bank_path)["bank_config"]["num_frames"] == 3
+        assert committed == [bank_path]
+        assert queue.get_pending(bank_path) is None
+        assert torch.equal(SafetensorsImageEncoder.load_frames(bank_path, 3), images)
+
+    def test_video_saved_before_commit(self, tmp_path: Path):
+        bank_path = tmp_path / "bank" / "id"
+        # the expanded SaveWEBM node may run before the background commit
+        video_path = bank_path / OUTPUTS_DIRNAME / "video_00001_.webm"
+        video_path.parent.mkdir(parents=True)
+        video_path.write_bytes(b"webm")
+
+        queue = WriteBehindQueue()
+        queue.submit(str(bank_path), SafetensorsImageEncoder, torch.rand((2, 8, 8, 3)), {"bank_config": {"num_frames": 2}})
+        queue.flush()
+
+        assert is_bank_valid(bank_path=str(bank_path)) is True
+        assert video_path.read_bytes() == b"webm"
+        assert [p.name for p in (tmp_path / "bank").iterdir()] == ["id"]
+
+    def test_failed_commit_is_not_valid(self, tmp_path: Path):
+        bank_path = str(tmp_path / "bank" / "id")
+        # a scalar tensor cannot be split into frames
+        queue = WriteBehindQueue()
+        queue.submit(bank_path, SafetensorsImageEncoder, torch.rand(()), {"bank_config": {"num_frames": 1}})
+        queue.flush()
+
+        assert is_bank_valid(bank_path=bank_path) is False
+        assert queue.is_pending(bank_path) is False
+
+    @pytest.mark.parametrize("private_hook", [True, False])
+    def test_drain_at_exit(self, tmp_path: Path, private_hook: bool):
+        # the banks are queued and the interpreter exits right away
+        script = (
+            "import sys, threading, torch\n"
+            "if sys.argv[2] == '0':\n"
+            "    # interpreter without threading exit hooks, the drain falls back to atexit\n"
+            "    del threading._register_atexit\n"
+            "from image_bank.write_behind import get_write_behind_queue\n"
+            "from encoders.pil_image_encoder import PilImageEncoder\n"
+            "for idx in range(3):\n"
+            "    get_write_behind_queue().submit(\n"
+            "        f'{sys.argv[1]}/bank/{idx}', PilImageEncoder, torch.rand((4, 8, 8, 3)),\n"
+            "        {'bank_config': {'num_frames': 4}}, workers=4,\n"
+            "    )\n"
+        )
+        root = str(Path(__file__).parent.parent)
+        subprocess.run([sys.executable, "-c", script, str(tmp_path), str(int(private_hook))], cwd=root, check=True, timeout=120)
+
+        for idx in range(3):
+            bank_path = str(tmp_path / "bank" / str(idx))
+            assert is_bank_valid(bank_path=bank_path) is True
+            assert read_bank_metadata(bank_path=bank_path)["bank_config"]["num_frames"] == 4
@@ -1,11 +1,9 @@
 """VPersistTransferColors."""
 from typing import Dict, Any
-from itertools import accumulate
 
 from torch import Tensor
-from comfy_execution.graph_utils import GraphBuilder
 
-from ..image.image_utils import split_images
+from ..image.color_transfer import transfer_colors
 
 
 class PersistTransferColors:
@@ -37,32 +35,5 @@ class PersistTransferColors:
         match_strength: float
     ):
         """Execute the node."""
-        graph = GraphBuilder()
-        # split images and add dim 0
-        images_seq = [img.unsqueeze(0) for img in split_images(images)]
-
-        def match_color(prev, img):
-            return (
-                # match colors using ColorMatch from KJ
-                graph.node(
-                    "ColorMatch",
-                    image_ref=prev,
-                    image_target=img,
-                    method="hm-mvgd-hm",
-                    strength=match_strength,
-                    multithread=True,
-                ).out(0)
-                if prev is not None
-                else img
-            )
-
-        # match all images with previous one
-        matched_images = list(accumulate(images_seq, match_color))
-        # prepare dict for Expansion call
-        arg_imgs = {f"image_{i}": img for i, img in enumerate(matched_images, 1)}
-
-        return {
-            # batch all images using ImageBatchMulti from KJ
-            "result": (graph.node("ImageBatchMulti", inputcount=len(arg_imgs),  **arg_imgs).out(0),),
-            "expand": graph.finalize()
-        }
+        # match all images with the previous one (hm-mvgd-hm), without node expansion
+        return (transfer_colors(images, strength=match_strength),)